@@ -0,0 +1,198 @@
+import argparse
+import base64
+import binascii
+import gzip
+import json
+import re
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIServer, make_server
+
+import db
+from branches import BRANCHES, BranchError, branch_path, init_branches
+from catalog import (
+    PAGE_SIZE,
+    catalog_generation,
+    get_books_page,
+    get_categories,
+    get_category_count,
+    get_category_counts,
+    get_total_books,
+    init_db,
+)
+from search import SEARCH_LIMIT, search_books
+
+MAX_LIMIT = 200
+# Responses smaller than this aren't worth compressing
+GZIP_MIN_SIZE = 512
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _limit(query, default):
+    try:
+        limit = int(query.get("limit", default))
+    except ValueError:
+        raise HTTPError("400 Bad Request", "limit must be an integer") from None
+    if not 1 <= limit <= MAX_LIMIT:
+        raise HTTPError("400 Bad Request", f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+
+def encode_cursor(cursor):
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor, ensure_ascii=False).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    # Cursors come back from clients, so anything but ["name", id] is a 400
+    try:
+        name, book_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(name, str):
+            raise TypeError(name)
+        return name, int(book_id)
+    except (binascii.Error, ValueError, TypeError, OverflowError):
+        raise HTTPError("400 Bad Request", "invalid cursor") from None
+
+
+def list_categories(query):
+    return {"categories": [{"name": name, "book_count": count} for name, count in get_category_counts()]}
+
+
+def list_books(query, category):
+    if category not in get_categories():
+        raise HTTPError("404 Not Found", f"no category named {category!r}")
+    limit = _limit(query, PAGE_SIZE)
+    books, next_cursor = get_books_page(category, decode_cursor(query.get("cursor")), limit)
+    return {
+        "category": category,
+        "book_count": get_category_count(category),
+        "books": [book._asdict() for book in books],
+        "next_cursor": encode_cursor(next_cursor),
+    }
+
+
+def search(query):
+    text = query.get("q", "").strip()
+    if not text:
+        raise HTTPError("400 Bad Request", "q is required")
+    hits = search_books(text, query.get("category"), _limit(query, SEARCH_LIMIT))
+    return {
+        "query": text,
+        "results": [
+            {"id": hit.id, "name": hit.name, "author": hit.author, "number": hit.number, "category": hit.category}
+            for hit in hits
+        ],
+    }
+
+
+def total(query):
+    return {"total": get_total_books()}
+
+
+ROUTES = [
+    (re.compile(r"/api/categories"), list_categories),
+    (re.compile(r"/api/categories/(?P<category>[^/]+)/books"), list_books),
+    (re.compile(r"/api/search"), search),
+    (re.compile(r"/api/total"), total),
+]
+
+
+def _dispatch(path, query):
+    for pattern, handler in ROUTES:
+        match = pattern.fullmatch(path)
+        if match:
+            return handler(query, **match.groupdict())
+    raise HTTPError("404 Not Found", f"no route for {path}")
+
+
+def _decode_path(environ):
+    # PEP 3333 hands PATH_INFO over as latin-1 decoded bytes
+    return environ.get("PATH_INFO", "").encode("latin-1").decode("utf-8", "replace")
+
+
+def _database(query):
+    # ?branch=name in multi-branch mode; the first branch by default
+    if not BRANCHES:
+        return db.DB_FILE
+    try:
+        return branch_path(query.get("branch", next(iter(BRANCHES))))
+    except BranchError as e:
+        raise HTTPError("404 Not Found", str(e)) from None
+
+
+def application(environ, start_response):
+    method = environ["REQUEST_METHOD"]
+    headers = [("Content-Type", "application/json; charset=utf-8"), ("Vary", "Accept-Encoding")]
+    if method not in ("GET", "HEAD"):
+        start_response("405 Method Not Allowed", headers + [("Allow", "GET, HEAD")])
+        return [b'{"error": "read-only API"}']
+
+    query = {key: values[-1] for key, values in parse_qs(environ.get("QUERY_STRING", "")).items()}
+    try:
+        path = _database(query)
+    except HTTPError as e:
+        start_response(e.status, headers)
+        return [json.dumps({"error": e.message}, ensure_ascii=False).encode("utf-8")]
+    with db.use_database(path):
+        return _respond(environ, start_response, method, headers, query)
+
+
+def _respond(environ, start_response, method, headers, query):
+    # The generation only moves when the catalog is written, so it is a valid
+    # validator for every resource. It is read before the data so a write in
+    # between can only make the ETag older than the body, never newer.
+    # Errors are answered in full and without one, so a client repeating an
+    # ETag still learns that the route or cursor is wrong.
+    etag = f'W/"{catalog_generation()}"'
+    headers.append(("Cache-Control", "no-cache"))
+    try:
+        status, payload = "200 OK", _dispatch(_decode_path(environ), query)
+    except HTTPError as e:
+        status, payload = e.status, {"error": e.message}
+    else:
+        headers.append(("ETag", etag))
+        if etag in [tag.strip() for tag in environ.get("HTTP_IF_NONE_MATCH", "").split(",")]:
+            start_response("304 Not Modified", headers)
+            return []
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    if len(body) >= GZIP_MIN_SIZE and "gzip" in environ.get("HTTP_ACCEPT_ENCODING", ""):
+        body = gzip.compress(body, compresslevel=5)
+        headers.append(("Content-Encoding", "gzip"))
+    headers.append(("Content-Length", str(len(body))))
+    start_response(status, headers)
+    return [] if method == "HEAD" else [body]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the catalog as a read-only JSON API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--db", default=db.DB_FILE)
+    args = parser.parse_args()
+
+    db.DB_FILE = args.db
+    if BRANCHES:
+        init_branches()
+    else:
+        init_db()
+    with make_server(args.host, args.port, application, server_class=ThreadingWSGIServer) as server:
+        print(f"Serving catalog API on http://{args.host}:{args.port}/api/")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
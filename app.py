@@ -1,68 +1,93 @@
+import html
+import json
+import os
+from functools import partial
+
 import streamlit as st
-import sqlite3
-import pandas as pd
-
-DB_FILE = "library.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            number TEXT NOT NULL,
-            author TEXT,
-            category TEXT NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-def get_categories():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT DISTINCT category FROM books")
-    cats = [row[0] for row in c.fetchall()]
-    conn.close()
-    return cats
-
-def get_books_by_category(category):
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query("SELECT * FROM books WHERE category = ?", conn, params=(category,))
-    conn.close()
-    return df
-
-def add_book(name, number, author, category):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("INSERT INTO books (name, number, author, category) VALUES (?, ?, ?, ?)",
-              (name, number, author, category))
-    conn.commit()
-    conn.close()
-
-def delete_book(book_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("DELETE FROM books WHERE id = ?", (book_id,))
-    conn.commit()
-    conn.close()
-
-def add_category(category_name):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("INSERT INTO books (name, number, author, category) VALUES (?, ?, ?, ?)",
-              ("New Book", "000", None, category_name))
-    conn.commit()
-    conn.close()
-
-def delete_category(category_name):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    # First delete all books in this category
-    c.execute("DELETE FROM books WHERE category = ?", (category_name,))
-    conn.commit()
-    conn.close()
+
+import db
+import styles
+from backup import BackupError, list_backups, restore_backup, start_backups
+from branches import BRANCHES, branch_names, branch_path, init_branches, search_branches
+from cache import cache_stats
+from catalog import (
+    PAGE_SIZE,
+    DeleteError,
+    MergeError,
+    add_book,
+    add_category,
+    changed_categories,
+    delete_book,
+    delete_books,
+    dismiss_duplicate,
+    get_books_page,
+    get_categories,
+    get_category_count,
+    get_category_counts,
+    get_duplicates,
+    get_total_books,
+    get_trash,
+    init_db,
+    latest_change_id,
+    merge_books,
+    move_books,
+    restore_trash,
+    update_books,
+)
+from circulation import (
+    MAX_RENEWALS,
+    CirculationError,
+    add_member,
+    find_open_loans,
+    get_members,
+    get_open_loans,
+    get_overdue_loans,
+    issue_book,
+    renew_loan,
+    return_book,
+)
+from exporter import FORMAT_LABELS, FORMATS, export_bytes, export_filename, export_mime
+from fuzzy import fuzzy_search
+from intake import IntakeError, IntakeQueue
+from instrument import ENABLED as PROFILING, mark, profile_rerun, prometheus_text
+from jobs import fail_interrupted_jobs, get_jobs, submit_job
+from search import HIGHLIGHT_END, HIGHLIGHT_START, SearchHit, search_books
+from stats import TOP_AUTHORS, get_duplicate_numbers, get_growth, get_summary, get_top_authors
+from writer import writer_stats
+
+# Searches with fewer full-text hits than this also show similar titles
+FUZZY_FALLBACK = 10
+# How often the book list and total poll for other sessions' changes
+LIVE_REFRESH_SECONDS = 5
+# How often the Jobs panel polls background jobs' progress
+JOB_REFRESH_SECONDS = 2
+JOB_ICONS = {'queued': "⏳", 'running': "⚙️", 'done': "✅", 'failed': "❌"}
+
+@st.cache_resource(show_spinner=False)
+def init_catalog(path):
+    # Migrations only need checking once per process and database, not on
+    # every rerun of every session
+    if BRANCHES:
+        init_branches()
+    else:
+        init_db()
+    for database in BRANCHES.values() if BRANCHES else [path]:
+        with db.use_database(database):
+            fail_interrupted_jobs()
+    start_backups(BRANCHES.values() if BRANCHES else [path])
+
+def current_database():
+    # The selected branch's file, or the single catalog
+    if not BRANCHES:
+        return db.DB_FILE
+    if st.session_state.get('branch') not in BRANCHES:
+        st.session_state.branch = branch_names()[0]
+    return branch_path(st.session_state.branch)
+
+def switch_branch():
+    # Categories and page cursors belong to the branch being left
+    for key in ('selected_cat', 'page_category', 'page_cursors', 'live_page'):
+        st.session_state.pop(key, None)
 
 def logout():
     st.session_state.logged_in = False
@@ -72,113 +97,7 @@ def logout():
 
 def login():
     # Center and style the title and buttons
-    st.markdown(
-        """
-        <style>
-        .title-center {
-            text-align: center;
-            font-size: 48px;
-            font-weight: bold;
-            margin-top: 40px;
-            margin-bottom: 60px;
-            color: #ffffff;
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-        }
-        .center-container {
-            display: flex;
-            justify-content: center;
-            gap: 50px;
-            margin-bottom: 40px;
-        }
-        /* Custom button styling */
-        .stButton > button {
-            width: 100%;
-            height: 80px;
-            border-radius: 20px;
-            font-size: 28px;
-            font-weight: 700;
-            transition: all 0.3s ease;
-            box-shadow: 0 8px 15px rgba(0, 0, 0, 0.2);
-            border: none;
-            margin: 15px 0;
-            text-transform: uppercase;
-            letter-spacing: 1px;
-        }
-        /* View Catalog button - Green */
-        .stButton > button[kind="view_catalog"] {
-            background: linear-gradient(135deg, #2ecc71, #27ae60);
-            color: white;
-            text-shadow: 1px 1px 2px rgba(0,0,0,0.2);
-        }
-        .stButton > button[kind="view_catalog"]:hover {
-            background: linear-gradient(135deg, #27ae60, #2ecc71);
-            transform: translateY(-3px) scale(1.02);
-            box-shadow: 0 12px 20px rgba(46, 204, 113, 0.3);
-        }
-        /* Admin Login button - Red */
-        .stButton > button[kind="admin_login"] {
-            background: linear-gradient(135deg, #e74c3c, #c0392b);
-            color: white;
-            text-shadow: 1px 1px 2px rgba(0,0,0,0.2);
-        }
-        .stButton > button[kind="admin_login"]:hover {
-            background: linear-gradient(135deg, #c0392b, #e74c3c);
-            transform: translateY(-3px) scale(1.02);
-            box-shadow: 0 12px 20px rgba(231, 76, 60, 0.3);
-        }
-        /* Admin login form minimalist styling */
-        .stTextInput > div > div > input {
-            border: none;
-            border-radius: 7px;
-            padding: 10px 8px;
-            font-size: 18px;
-            text-align: center;
-            box-sizing: border-box;
-            background: none;
-            box-shadow: none;
-            transition: border-color 0.2s;
-        }
-        .stTextInput > div > div > input:focus {
-            border: none;
-            box-shadow: none;
-        }
-        /* Login button in admin form */
-        .stButton > button[kind="login"] {
-            background: linear-gradient(135deg, #e74c3c, #c0392b);
-            color: white;
-            border-radius: 15px;
-            height: 60px;
-            font-size: 22px;
-            font-weight: 700;
-            text-transform: uppercase;
-            letter-spacing: 1px;
-        }
-        .stButton > button[kind="login"]:hover {
-            background: linear-gradient(135deg, #c0392b, #e74c3c);
-            transform: translateY(-2px) scale(1.02);
-            box-shadow: 0 8px 15px rgba(231, 76, 60, 0.3);
-        }
-        /* Admin login title */
-        .admin-login-title {
-            text-align: center;
-            color: #ffffff;
-            margin-bottom: 40px;
-            font-size: 36px;
-            font-weight: bold;
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-        }
-        /* Center the text input labels */
-        .stTextInput > label {
-            text-align: center;
-            font-size: 20px;
-            font-weight: 600;
-            margin-bottom: 10px;
-            color: #ffffff;
-        }
-        </style>
-        <div class="title-center">DIET Dehradun 📚Library Catalog</div>
-        """
-        , unsafe_allow_html=True)
+    st.markdown(styles.LOGIN_HTML, unsafe_allow_html=True)
 
     # Create two columns for the buttons
     col1, col2 = st.columns(2)
@@ -197,19 +116,7 @@ def login():
 
     # Admin login form if chosen
     if st.session_state.get('view_mode') == 'admin_login':
-        st.markdown("""
-            <style>
-            .admin-login-title {
-                text-align: center;
-                color: #ff0000;
-                margin-bottom: 40px;
-                font-size: 36px;
-                font-weight: bold;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            </style>
-            <h2 class="admin-login-title">🔐 Admin Login</h2>
-        """, unsafe_allow_html=True)
+        st.markdown(styles.ADMIN_LOGIN_HTML, unsafe_allow_html=True)
         username = st.text_input("Username")
         password = st.text_input("Password", type="password")
         if st.button("Login", key="login"):
@@ -222,267 +129,535 @@ def login():
             else:
                 st.error("Invalid credentials.")
 
-def get_total_books():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM books")
-    total = c.fetchone()[0]
-    conn.close()
-    return total
+def highlight_html(text):
+    escaped = html.escape(text or "")
+    return escaped.replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_END, "</mark>")
+
+def render_search_results(results, branches=None):
+    hits = []
+    for i, row in enumerate(results):
+        author = highlight_html(row.author_hl) or "Unknown"
+        branch = f"🏫 {html.escape(branches[i])} · " if branches else ""
+        hits.append(
+            f'<div class="search-hit"><div class="search-hit-title">{highlight_html(row.name_hl)}</div>'
+            f'<div class="search-hit-meta">{branch}{author} · 📁 {html.escape(row.category)} · #{html.escape(row.number or "")}</div></div>'
+        )
+    return "\n".join(hits)
+
+def similar_books(search_term, results):
+    # Typo and transliteration matches for searches that found little,
+    # shaped like search hits without highlights
+    shown = {row.id for row in results}
+    return [
+        SearchHit(hit.id, hit.name, hit.author, hit.number, hit.category, hit.name, hit.author)
+        for hit in fuzzy_search(search_term)
+        if hit.id not in shown
+    ][:FUZZY_FALLBACK]
+
+def listing_table(books):
+    # An Arrow table goes to the browser as is; a DataFrame would be built
+    # and then converted on every rerun. pyarrow ships with streamlit.
+    import pyarrow as pa
+
+    return pa.table({
+        'name': pa.array([book.name for book in books], pa.string()),
+        'author': pa.array([book.author for book in books], pa.string()),
+        'status': pa.array([f"Due {book.due_at}" if book.due_at else "Available" for book in books], pa.string()),
+    })
+
+# Fragment reruns skip main(), so the live fragments select the session's
+# database themselves
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def render_total():
+    with db.use_database(current_database()):
+        total = get_total_books()
+    st.markdown(f'<div class="total-books">Total Books: {total}</div>', unsafe_allow_html=True)
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def render_live_page(category, cursor):
+    # Reruns on its own to pick up other sessions' edits. The page is only
+    # fetched again when the change feed says this category was touched.
+    live = st.session_state.live_page
+    with db.use_database(current_database()):
+        changed, live["change_id"] = changed_categories(live["change_id"])
+        if category in changed:
+            live["rows"], _ = get_books_page(category, cursor)
+    if not live["rows"]:
+        st.info("No books found.")
+    else:
+        st.dataframe(listing_table(live["rows"]), use_container_width=True, hide_index=True)
+
+def next_page(cursor):
+    st.session_state.page_cursors.append(cursor)
+
+def prev_page():
+    st.session_state.page_cursors.pop()
+
+def render_page_nav(category, page, next_cursor):
+    total_pages = max(1, -(-get_category_count(category) // PAGE_SIZE))
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        st.button("◀ Prev", key="page_prev", on_click=prev_page, disabled=page == 1, use_container_width=True)
+    with col2:
+        st.markdown(f'<div class="page-status">Page {page} of {total_pages}</div>', unsafe_allow_html=True)
+    with col3:
+        st.button("Next ▶", key="page_next", on_click=next_page, args=(next_cursor,),
+                  disabled=next_cursor is None, use_container_width=True)
+
+def _text_or_none(value):
+    # data_editor hands back NaN for cleared or missing cells
+    return value.strip() or None if isinstance(value, str) else None
+
+def render_batch_edit(books, categories, selected_cat, page):
+    if 'batch_summary' in st.session_state:
+        st.success(st.session_state.pop('batch_summary'))
+    if not books:
+        st.info("No books on this page.")
+        return
+
+    # The editable grid is admin-only, so pandas is loaded here rather than
+    # on the listing path
+    import pandas as pd
+
+    grid = pd.DataFrame([book[:4] for book in books], columns=['id', 'name', 'number', 'author'])
+    grid.insert(0, 'select', False)
+    # The version changes after every batch write, so ticks and edits left in
+    # the editor's state can't land on the rows that move into their places
+    version = st.session_state.get('batch_version', 0)
+    edited = st.data_editor(
+        grid,
+        key=f"batch_grid_{selected_cat}_{page}_{version}",
+        hide_index=True,
+        use_container_width=True,
+        disabled=['id'],
+        column_config={
+            'select': st.column_config.CheckboxColumn("Select", default=False),
+            'id': None,
+            'name': "Book Name",
+            'number': "Book Number",
+            'author': "Author/Publication",
+        },
+    )
+
+    selected_ids = [int(book_id) for book_id in edited.loc[edited['select'], 'id']]
+    changes = []
+    invalid = False
+    for before, after in zip(grid.itertuples(index=False), edited.itertuples(index=False)):
+        old = (_text_or_none(before.name), _text_or_none(before.number), _text_or_none(before.author))
+        new = (_text_or_none(after.name), _text_or_none(after.number), _text_or_none(after.author))
+        if new != old:
+            changes.append((int(after.id), *new))
+            # Older records without a number can still be edited; only
+            # clearing a name or a number that was set is refused
+            invalid = invalid or new[0] is None or (new[1] is None and old[1] is not None)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button(f"🗑️ Delete {len(selected_ids)} selected", disabled=not selected_ids):
+            try:
+                delete_books(selected_ids)
+            except DeleteError as e:
+                st.error(str(e))
+            else:
+                st.session_state.batch_version = version + 1
+                st.session_state.batch_summary = f"Deleted {len(selected_ids)} books."
+                st.rerun()
+    with col2:
+        targets = [cat for cat in categories if cat != selected_cat]
+        target = st.selectbox("Move selected to", options=targets, disabled=not targets)
+        if st.button("📁 Move selected", disabled=not selected_ids or not targets):
+            move_books(selected_ids, target)
+            st.session_state.batch_version = version + 1
+            st.session_state.batch_summary = f"Moved {len(selected_ids)} books to '{target}'."
+            st.rerun()
+    with col3:
+        if st.button(f"💾 Save {len(changes)} edits", disabled=not changes):
+            if invalid:
+                st.error("Book Name and Number cannot be empty.")
+            else:
+                update_books(changes)
+                st.session_state.batch_version = version + 1
+                st.session_state.batch_summary = f"Saved changes to {len(changes)} books."
+                st.rerun()
+
+def render_bulk_import(selected_cat):
+    if 'import_summary' in st.session_state:
+        st.success(st.session_state.pop('import_summary'))
+    uploaded = st.file_uploader("CSV or Excel accession register", type=["csv", "xlsx"])
+    use_selected = st.checkbox(f"Put rows without a category into '{selected_cat}'", value=True)
+    skip_duplicates = st.checkbox("Skip books whose number is already in the catalog", value=True)
+    if uploaded is None or not st.button("Import Books"):
+        return
+    submit_job("import", f"Import {uploaded.name}", uploaded.getvalue(), uploaded.name,
+               selected_cat if use_selected else None, skip_duplicates)
+    st.session_state.import_summary = f"Importing {uploaded.name} in the background; see ⚙️ Jobs for progress."
+    st.rerun()
+
+def intake_queue(path):
+    # One queue per database, so switching branches doesn't mix scans
+    queues = st.session_state.setdefault('intake_queues', {})
+    if path not in queues:
+        queues[path] = IntakeQueue(path)
+    return queues[path]
+
+def on_scan(path, category):
+    # Runs before the fragment reruns. The chat input clears itself in the
+    # browser on submit, so the next scan can start straight away; a
+    # scanner's stored codes pasted at once are taken one by one.
+    queue = intake_queue(path)
+    queue.next_number = st.session_state.get('intake_next_number', '').strip() or None
+    notes = []
+    for code in (st.session_state.intake_scan or "").split():
+        try:
+            item = queue.scan(code, category)
+        except IntakeError as e:
+            notes.append(("error", str(e)))
+            continue
+        if item.isbn and not item.name:
+            notes.append(("warning", f"{item.isbn} isn't in the metadata cache; type its title below."))
+        elif item.name:
+            notes.append(("success", f"{item.name} · {item.author or 'Unknown'} · #{item.number or '…'}"))
+    notes += saved_notes(queue.flush)
+    st.session_state.intake_notes = notes
+    st.session_state.intake_next_number = queue.next_number or ""
+
+def saved_notes(flush):
+    saved = flush()
+    if not saved:
+        return []
+    return [("success", f"Saved {saved} books; they are being checked for duplicates, see ⚙️ Jobs.")]
+
+def save_intake(queue):
+    st.session_state.intake_notes = saved_notes(partial(queue.flush, force=True))
+
+@st.fragment
+def render_intake(selected_cat):
+    # A fragment, so a scan reruns only this panel and not the listing,
+    # sidebar and the rest of the admin page
+    path = current_database()
+    queue = intake_queue(path)
+    st.caption(f"Scanned books go into '{selected_cat}' and are saved {queue.batch_size} at a time.")
+    st.text_input("Next accession number (leave blank to scan each book's accession barcode)",
+                  key="intake_next_number")
+    st.chat_input("Scan an ISBN or accession barcode", key="intake_scan", on_submit=on_scan,
+                  args=(path, selected_cat))
+    for kind, note in st.session_state.pop('intake_notes', []):
+        getattr(st, kind)(note)
+    if not queue.items:
+        st.info(f"Nothing waiting to be saved. {queue.saved} books saved this session.")
+        return
+
+    # pandas only for the review grid, as in render_batch_edit
+    import pandas as pd
+
+    grid = pd.DataFrame([item[:4] for item in queue.items], columns=['isbn', 'name', 'number', 'author'])
+    edited = st.data_editor(
+        grid,
+        key=f"intake_grid_{queue.version}",
+        hide_index=True,
+        use_container_width=True,
+        disabled=['isbn'],
+        column_config={
+            'isbn': "ISBN",
+            'name': "Book Name",
+            'number': "Book Number",
+            'author': "Author/Publication",
+        },
+    )
+    for index, (before, after) in enumerate(zip(grid.itertuples(index=False), edited.itertuples(index=False))):
+        new = (_text_or_none(after.name), _text_or_none(after.number), _text_or_none(after.author))
+        if new != (_text_or_none(before.name), _text_or_none(before.number), _text_or_none(before.author)):
+            try:
+                queue.edit(index, *new)
+            except IntakeError as e:
+                st.error(str(e))
+
+    ready = len(queue.ready())
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button(f"💾 Save {ready} now", key="intake_save", on_click=save_intake, args=(queue,),
+                  disabled=not ready, use_container_width=True)
+    with col2:
+        st.button("↩️ Undo last scan", key="intake_undo", on_click=queue.undo, use_container_width=True)
+
+def render_circulation(books):
+    if 'circulation_summary' in st.session_state:
+        st.success(st.session_state.pop('circulation_summary'))
+    issue_tab, return_tab, members_tab, overdue_tab = st.tabs(["Issue", "Return / Renew", "Members", "Overdue"])
+    members = get_members()
+
+    with issue_tab:
+        available = [book for book in books if not book.due_at]
+        if not available or not members:
+            st.info("No available books on this page." if members else "Register a member first.")
+        else:
+            book = st.selectbox("Book", options=available, format_func=lambda b: f"{b.name} (#{b.number or '-'})",
+                                key="issue_book")
+            member = st.selectbox("Member", options=members, format_func=lambda m: f"{m.name} ({m.card})",
+                                  key="issue_member")
+            if st.button("📖 Issue", key="issue"):
+                try:
+                    issue_book(book.id, member.id)
+                except CirculationError as e:
+                    st.error(str(e))
+                else:
+                    st.session_state.circulation_summary = f"Issued '{book.name}' to {member.name}."
+                    st.rerun()
+
+    with return_tab:
+        # Scanning the book in hand (or the member's card) finds its loan
+        # anywhere in the catalog; otherwise the loans on this page are offered
+        code = st.text_input("Accession number or member card", key="return_code",
+                             placeholder="Scan or type to find a loan outside this page").strip()
+        if code:
+            loans = find_open_loans(code)
+        else:
+            loans = get_open_loans(tuple(book.id for book in books if book.due_at))
+        if not loans:
+            st.info(f"No open loan for '{code}'." if code else "No books on this page are out on loan.")
+        else:
+            loan = st.selectbox("Loan", options=loans, key="return_loan",
+                                format_func=lambda l: f"{l.name} · {l.member} ({l.card}) · due {l.due_at}")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("↩️ Return", key="return", use_container_width=True):
+                    try:
+                        return_book(loan.book_id)
+                    except CirculationError as e:
+                        st.error(str(e))
+                    else:
+                        st.session_state.circulation_summary = f"Returned '{loan.name}'."
+                        st.rerun()
+            with col2:
+                if st.button(f"🔁 Renew ({loan.renewals}/{MAX_RENEWALS})", key="renew", use_container_width=True,
+                             disabled=loan.renewals >= MAX_RENEWALS):
+                    try:
+                        renew_loan(loan.book_id)
+                    except CirculationError as e:
+                        st.error(str(e))
+                    else:
+                        st.session_state.circulation_summary = f"Renewed '{loan.name}'."
+                        st.rerun()
+
+    with members_tab:
+        with st.form("add_member_form", clear_on_submit=True):
+            name = st.text_input("Member Name")
+            card = st.text_input("Library Card Number")
+            phone = st.text_input("Phone (optional)")
+            if st.form_submit_button("Add Member"):
+                if not name.strip() or not card.strip():
+                    st.error("Member name and card number cannot be empty.")
+                else:
+                    try:
+                        add_member(name.strip(), card.strip(), phone.strip() or None)
+                    except CirculationError as e:
+                        st.error(str(e))
+                    else:
+                        st.session_state.circulation_summary = f"Added member '{name.strip()}'."
+                        st.rerun()
+        st.caption(f"{len(members)} registered members")
+
+    with overdue_tab:
+        overdue = get_overdue_loans()
+        if not overdue:
+            st.info("Nothing is overdue.")
+        else:
+            st.caption(f"{len(overdue)} overdue loans, most overdue first")
+            st.dataframe([loan._asdict() for loan in overdue], use_container_width=True, hide_index=True,
+                         column_order=['name', 'number', 'category', 'member', 'card', 'phone', 'due_at', 'days_overdue'])
+
+def render_statistics():
+    summary = get_summary()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Books", summary.total_books)
+    col2.metric("Categories", summary.categories)
+    col3.metric("Authors", summary.authors)
+    col4.metric("Duplicate numbers", summary.duplicate_numbers)
+
+    counts = get_category_counts()
+    st.caption("Books per category")
+    st.bar_chart({'category': [name for name, _ in counts], 'books': [count for _, count in counts]},
+                 x='category', y='books')
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.caption(f"Top {TOP_AUTHORS} authors/publishers")
+        st.dataframe([{'author': author, 'books': count} for author, count in get_top_authors()],
+                     use_container_width=True, hide_index=True)
+    with col2:
+        st.caption("Book numbers used more than once")
+        st.dataframe([{'number': number, 'books': count} for number, count in get_duplicate_numbers()],
+                     use_container_width=True, hide_index=True)
+
+    growth = get_growth()
+    if growth:
+        st.caption("Catalog size by month")
+        st.line_chart({'month': [m.month for m in growth], 'books': [m.total for m in growth]}, x='month', y='books')
+
+def render_duplicates():
+    if 'duplicate_summary' in st.session_state:
+        st.success(st.session_state.pop('duplicate_summary'))
+    if st.button("🔎 Scan catalog", key="scan_duplicates"):
+        submit_job("duplicates", "Scan for duplicates")
+        st.session_state.duplicate_summary = "Scanning in the background; see ⚙️ Jobs for progress."
+        st.rerun()
+
+    suggestions = get_duplicates()
+    if not suggestions:
+        st.info("No duplicates suggested. New books are checked as they are added.")
+        return
+    pair = st.selectbox("Suggestion", options=suggestions, key="duplicate_pair",
+                        format_func=lambda p: f"{p.score:.0%} · {p.name} / {p.other_name}")
+    col1, col2 = st.columns(2)
+    for col, book_id, keep, drop in ((col1, pair.book_id, pair[1:6], pair[6:11]),
+                                     (col2, pair.other_id, pair[6:11], pair[1:6])):
+        with col:
+            _, name, number, author, category = keep
+            st.markdown(f"**{html.escape(name)}**  \n#{html.escape(number or '-')} · "
+                        f"{html.escape(author or 'Unknown')} · 📁 {html.escape(category)}")
+            if st.button("Keep this one", key=f"keep_{book_id}", use_container_width=True):
+                try:
+                    merge_books(book_id, drop[0])
+                except MergeError as e:
+                    st.error(str(e))
+                else:
+                    st.session_state.duplicate_summary = f"Merged into '{name}'; the other record is in the Trash."
+                    st.rerun()
+    if st.button("Not duplicates", key="dismiss_duplicate"):
+        dismiss_duplicate(pair.book_id, pair.other_id)
+        st.rerun()
+
+def render_trash():
+    if 'trash_summary' in st.session_state:
+        st.success(st.session_state.pop('trash_summary'))
+    entries = get_trash()
+    if not entries:
+        st.info("Nothing has been deleted recently.")
+        return
+    entry = st.selectbox("Deleted", options=entries, key="trash_entry",
+                         format_func=lambda e: f"{e.deleted_at} UTC · {e.label} · {e.book_count} books")
+    if st.button("♻️ Restore", key="restore_trash"):
+        restored = restore_trash(entry.id)
+        st.session_state.trash_summary = f"Restored {restored} books from {entry.label}."
+        st.rerun()
+
+def render_backups():
+    if 'backup_summary' in st.session_state:
+        st.success(st.session_state.pop('backup_summary'))
+    if st.button("💾 Back up now", key="backup_now"):
+        submit_job("backup", "Back up the catalog")
+        st.session_state.backup_summary = "Backing up in the background; see ⚙️ Jobs for progress."
+        st.rerun()
+
+    snapshots = list_backups()
+    if not snapshots:
+        st.info("No snapshots yet.")
+        return
+    snapshot = st.selectbox("Snapshot", options=snapshots, key="backup_snapshot",
+                            format_func=lambda s: f"{s.created:%Y-%m-%d %H:%M:%S} UTC · {s.size / 1e6:.1f} MB")
+    confirm = st.checkbox("Replace the catalog with this snapshot. Changes made since are kept in a new snapshot "
+                          "taken first.", key="backup_confirm")
+    if st.button("⏪ Restore snapshot", key="restore_backup", disabled=not confirm):
+        try:
+            restore_backup(snapshot.path)
+        except BackupError as e:
+            st.error(str(e))
+        else:
+            st.session_state.backup_summary = f"Restored the catalog as of {snapshot.created:%Y-%m-%d %H:%M} UTC."
+            st.rerun()
+
+def render_export(selected_cat):
+    if 'export_summary' in st.session_state:
+        st.success(st.session_state.pop('export_summary'))
+    scope = st.radio("Books", ["Whole catalog", f"Category '{selected_cat}'"], horizontal=True)
+    fmt = st.selectbox("Format", FORMATS, format_func=FORMAT_LABELS.get)
+    compress = st.checkbox("Compress", value=False)
+    category = None if scope == "Whole catalog" else selected_cat
+    path = db.current_path()
+
+    def build():
+        # Runs when the button is clicked, on its own thread
+        with db.use_database(path):
+            return export_bytes(fmt, category, compress)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "Download",
+            data=build,
+            file_name=export_filename(fmt, category, compress),
+            mime=export_mime(fmt, compress),
+            on_click="ignore",
+            use_container_width=True,
+        )
+    with col2:
+        # For big catalogs: the file is written by a job and offered for
+        # download under Jobs, so the browser isn't left waiting
+        if st.button("Export in background", key="export_job", use_container_width=True):
+            submit_job("export", f"Export {export_filename(fmt, category, compress)}", fmt, category, compress)
+            st.session_state.export_summary = "Exporting in the background; download it from ⚙️ Jobs."
+            st.rerun()
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+@st.fragment(run_every=JOB_REFRESH_SECONDS)
+def render_jobs():
+    # Polls the newest rows of the jobs table; runs on its own, so progress
+    # moves without rerunning the page
+    with db.use_database(current_database()):
+        jobs = get_jobs()
+    if not jobs:
+        st.info("No background jobs yet.")
+        return
+    for job in jobs:
+        title = f"{JOB_ICONS.get(job.status, '')} {job.label} · {job.created_at} UTC"
+        if job.status in ('queued', 'running'):
+            st.progress(job.progress, text=f"{title} · {job.message or job.status}")
+            continue
+        st.markdown(f"{html.escape(title)}  \n{html.escape(job.message or '')}")
+        if job.output and os.path.exists(job.output):
+            st.download_button(f"Download {os.path.basename(job.output)}", data=partial(read_file, job.output),
+                               file_name=os.path.basename(job.output), key=f"job_download_{job.id}",
+                               on_click="ignore")
+
+def render_diagnostics():
+    profile = st.session_state.get('last_profile')
+    if profile is None:
+        st.info("No rerun has been profiled yet.")
+        return
+    report = profile.as_dict()
+    st.caption(f"Previous rerun ({report['label']}): {report['seconds'] * 1e3:.1f} ms")
+    st.dataframe(report['phases'], use_container_width=True, hide_index=True)
+    st.dataframe(report['calls'], use_container_width=True, hide_index=True)
+    if report['statements']:
+        more = f"\n-- {report['dropped_statements']} more not shown" if report['dropped_statements'] else ""
+        st.code("\n".join(report['statements']) + more, language="sql")
+    st.json({"connection_pool": db.pool_stats(), "read_cache": cache_stats(), "write_queue": writer_stats()},
+            expanded=False)
+    metrics = prometheus_text({
+        "library_connection_pool": ("Connection pool counters.", db.pool_stats()),
+        "library_read_cache": ("Read cache counters.", cache_stats()),
+        "library_write_queue": ("Write queue counters.", writer_stats()),
+    })
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Prometheus metrics", metrics, file_name="library-metrics.txt", mime="text/plain",
+                           on_click="ignore")
+    with col2:
+        st.download_button("Rerun profile (JSON)", json.dumps(report, ensure_ascii=False, indent=2),
+                           file_name="library-rerun.json", mime="application/json", on_click="ignore")
 
 def main_app(username):
-    st.markdown(
-        """
-        <style>
-        /* Main container styling */
-        .main {
-            background: linear-gradient(135deg, #1a1a1a 0%, #2c3e50 100%);
-            padding: 20px;
-            border-radius: 15px;
-        }
-        
-        /* Title styling */
-        .catalog-title {
-            text-align: center;
-            font-size: 48px;
-            font-weight: bold;
-            margin-top: 40px;
-            margin-bottom: 20px;
-            color: #ffffff;
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-            background: linear-gradient(135deg, #ffffff 0%, #f0f0f0 100%);
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-        }
-        
-        /* Total books counter */
-        .total-books {
-            text-align: center;
-            font-size: 24px;
-            color: #ffffff;
-            margin-bottom: 40px;
-            padding: 10px;
-            background: rgba(255, 255, 255, 0.1);
-            border-radius: 10px;
-            backdrop-filter: blur(5px);
-        }
-        
-        /* Sidebar styling */
-        .sidebar .sidebar-content {
-            background: linear-gradient(135deg, #2c3e50 0%, #1a1a1a 100%);
-            padding: 20px;
-            border-radius: 15px;
-        }
-        
-        .sidebar-title {
-            font-size: 24px;
-            font-weight: bold;
-            color: #ffffff;
-            margin-bottom: 20px;
-            text-align: center;
-            text-shadow: 1px 1px 2px rgba(0,0,0,0.2);
-            padding: 10px;
-            background: rgba(255, 255, 255, 0.1);
-            border-radius: 10px;
-        }
-        
-        /* Modernize Streamlit radio buttons for categories - no circles, rounded rectangles, smooth color transition */
-        .stRadio [role="radiogroup"] {
-            display: flex;
-            flex-direction: column;
-            gap: 16px;
-        }
-        .stRadio [role="radiogroup"] > label {
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            width: 220px;
-            min-height: 44px;
-            border-radius: 22px;
-            background: #23242a;
-            color: #fff;
-            font-size: 1.1em;
-            font-weight: 600;
-            letter-spacing: 1px;
-            box-shadow: 0 2px 12px rgba(0,0,0,0.08);
-            position: relative;
-            transition: background 0.4s, box-shadow 0.3s, transform 0.2s;
-            cursor: pointer;
-            text-align: center;
-            padding: 0 32px 0 24px;
-            margin: 0 auto;
-        }
-        .stRadio [role="radiogroup"] > label:hover,
-        .stRadio [role="radiogroup"] > label[data-selected="true"] {
-            background: #ff6a88;
-            color: #fff;
-            box-shadow: 0 6px 24px rgba(255, 204, 112, 0.18);
-            transform: translateY(-2px) scale(1.03);
-        }
-        /* Hide the radio input and its visual circle */
-        .stRadio [role="radiogroup"] input[type="radio"] {
-            display: none !important;
-        }
-        /* Do NOT hide label > div, so category names remain visible */
-        .stRadio [role="radiogroup"] > label span, .stRadio [role="radiogroup"] > label div {
-            flex: 1;
-            text-align: center;
-            font-size: 1.1em;
-            font-weight: 600;
-            letter-spacing: 1px;
-            z-index: 2;
-        }
-        .stRadio [role="radiogroup"] > label::after {
-            content: "→";
-            position: absolute;
-            right: 18px;
-            font-size: 1.3em;
-            opacity: 0.7;
-            transition: opacity 0.2s;
-        }
-        .stRadio [role="radiogroup"] > label[data-selected="true"]::after,
-        .stRadio [role="radiogroup"] > label:hover::after {
-            opacity: 1;
-        }
-        
-        /* Logout button styling */
-        .stButton > button[kind="logout"] {
-            background: linear-gradient(135deg, #e74c3c, #c0392b);
-            color: white;
-            border-radius: 15px;
-            height: 50px;
-            font-size: 18px;
-            font-weight: 700;
-            text-transform: uppercase;
-            letter-spacing: 1px;
-            margin-top: 20px;
-            width: 100%;
-            transition: all 0.3s ease;
-        }
-        
-        .stButton > button[kind="logout"]:hover {
-            background: linear-gradient(135deg, #c0392b, #e74c3c);
-            transform: translateY(-2px) scale(1.02);
-            box-shadow: 0 8px 15px rgba(231, 76, 60, 0.3);
-        }
-        
-        /* Search box styling */
-        .stTextInput > div > div > input {
-            background: rgba(255, 255, 255, 0.1);
-            border: none;
-            border-radius: 10px;
-            color: white;
-            padding: 10px;
-        }
-        
-        /* Expander styling */
-        .streamlit-expanderHeader {
-            background: rgba(255, 255, 255, 0.1);
-            border-radius: 10px;
-            color: white;
-        }
-        
-        /* Dataframe styling */
-        .stDataFrame {
-            background: rgba(255, 255, 255, 0.05);
-            border-radius: 10px;
-            padding: 10px;
-        }
-        
-        /* Form styling */
-        .stForm {
-            background: rgba(255, 255, 255, 0.05);
-            border-radius: 10px;
-            padding: 20px;
-        }
-        
-        /* Button styling */
-        .stButton > button {
-            background: linear-gradient(135deg, #3498db, #2980b9);
-            color: white;
-            border-radius: 10px;
-            transition: all 0.3s ease;
-        }
-        
-        .stButton > button:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 5px 15px rgba(52, 152, 219, 0.3);
-        }
-        
-        /* Info and warning messages */
-        .stInfo, .stWarning, .stSuccess, .stError {
-            background: rgba(255, 255, 255, 0.1);
-            border-radius: 10px;
-            padding: 10px;
-        }
-        .category-btn {
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            width: 220px;
-            min-height: 44px;
-            border-radius: 22px;
-            background: #23242a;
-            color: #fff;
-            font-size: 1.1em;
-            font-weight: 600;
-            letter-spacing: 1px;
-            box-shadow: 0 2px 12px rgba(0,0,0,0.08);
-            position: relative;
-            transition: background 0.4s, box-shadow 0.3s, transform 0.2s;
-            cursor: pointer;
-            text-align: center;
-            padding: 0 32px 0 24px;
-            margin: 0 auto 12px auto;
-            border: none;
-        }
-        .category-btn.selected {
-            background: #ff6a88 !important;
-            color: #fff !important;
-            box-shadow: 0 6px 24px rgba(255, 204, 112, 0.18);
-            transform: translateY(-2px) scale(1.03);
-        }
-        .category-btn:hover {
-            background: #ff6a88;
-            color: #fff;
-        }
-        </style>
-        <div class="catalog-title">DIET Dehradun 📚Library Catalog</div>
-        """
-        , unsafe_allow_html=True)
-
-    total_books = get_total_books()
-    st.markdown(f'<div class="total-books">Total Books: {total_books}</div>', unsafe_allow_html=True)
+    st.markdown(styles.CATALOG_HTML, unsafe_allow_html=True)
+    mark("styles")
+
+    render_total()
 
     # Add PDF button with styling
-    st.markdown("""
-        <style>
-        .pdf-button {
-            display: flex;
-            justify-content: center;
-            margin: 20px 0;
-        }
-        .pdf-button a {
-            background: linear-gradient(135deg, #4CAF50, #45a049);
-            color: white;
-            padding: 12px 24px;
-            text-decoration: none;
-            border-radius: 25px;
-            font-weight: bold;
-            font-size: 18px;
-            transition: all 0.3s ease;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.2);
-        }
-        .pdf-button a:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 6px 20px rgba(0,0,0,0.3);
-            background: linear-gradient(135deg, #45a049, #4CAF50);
-        }
-        </style>
-        <div class="pdf-button">
-            <a href="https://1024terabox.com/s/1UYnyARbZP_jGDSF77MxkZQ" target="_blank">📚 Access Book PDFs</a>
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown(styles.PDF_BUTTON_HTML, unsafe_allow_html=True)
+    mark("header")
 
     categories = get_categories()
     if not categories:
@@ -491,62 +666,74 @@ def main_app(username):
 
     # Sidebar for category selection and logout
     with st.sidebar:
+        if BRANCHES:
+            st.selectbox("🏫 Branch", options=branch_names(), key="branch", on_change=switch_branch)
         st.markdown('<div class="sidebar-title">📚 Categories</div>', unsafe_allow_html=True)
         
         # Vertical button menu for categories
         if 'selected_cat' not in st.session_state or st.session_state.selected_cat not in categories:
             st.session_state.selected_cat = categories[0]
-        for cat in categories:
+        for cat, count in get_category_counts():
             btn_label = f"{cat}  →"
-            if st.button(btn_label, key=f"cat_{cat}", use_container_width=True, help=cat):
+            if st.button(btn_label, key=f"cat_{cat}", use_container_width=True, help=f"{cat} · {count} books"):
                 st.session_state.selected_cat = cat
         # Custom JS/CSS to highlight the selected button
-        st.markdown(f"""
-        <style>
-        [data-testid="stButton"] button.category-btn {{
-            background: #23242a;
-            color: #fff;
-        }}
-        [data-testid="stButton"] button.category-btn.selected {{
-            background: #ff6a88 !important;
-            color: #fff !important;
-        }}
-        </style>
-        <script>
-        const btns = window.parent.document.querySelectorAll('[data-testid="stButton"] button.category-btn');
-        btns.forEach(btn => {{
-            if(btn.innerText.trim() === "{st.session_state.selected_cat}  →") {{
-                btn.classList.add('selected');
-            }} else {{
-                btn.classList.remove('selected');
-            }}
-        }});
-        </script>
-        """, unsafe_allow_html=True)
+        st.markdown(styles.category_highlight(st.session_state.selected_cat), unsafe_allow_html=True)
         
         st.markdown("<br>", unsafe_allow_html=True)
         if st.button("Logout", key="logout"):
             logout()
 
+    mark("sidebar")
+
     selected_cat = st.session_state.selected_cat
 
-    # Main content area
-    df_cat = get_books_by_category(selected_cat)
+    # Main content area, one keyset page at a time
+    if st.session_state.get('page_category') != selected_cat:
+        st.session_state.page_category = selected_cat
+        st.session_state.page_cursors = [None]
+    page_cursors = st.session_state.page_cursors
+    # Read before the page, so a write landing in between shows up on the
+    # next poll rather than being missed
+    change_id = latest_change_id()
+    books, next_cursor = get_books_page(selected_cat, page_cursors[-1])
 
     search_term = st.text_input("🔍 Search Book")
-    if search_term:
-        df_cat = df_cat[df_cat['name'].str.contains(search_term, case=False)]
-
-    if not df_cat.empty:
-        st.dataframe(df_cat[['name', 'author']], use_container_width=True)
+    all_branches = len(BRANCHES) > 1 and st.checkbox("Search all branches", key="search_all_branches")
+    if search_term and all_branches:
+        hits = search_branches(search_term)
+        if hits:
+            st.caption(f"Top {len(hits)} matches across {len(BRANCHES)} branches")
+            st.markdown(render_search_results([hit.hit for hit in hits], [hit.branch for hit in hits]),
+                        unsafe_allow_html=True)
+        else:
+            st.info("No books found.")
+    elif search_term:
+        # Searches title, author and number across every category
+        results = search_books(search_term)
+        similar = similar_books(search_term, results) if len(results) < FUZZY_FALLBACK else []
+        if results:
+            st.caption(f"Top {len(results)} matches across all categories")
+            st.markdown(render_search_results(results), unsafe_allow_html=True)
+        if similar:
+            st.caption("Similar titles")
+            st.markdown(render_search_results(similar), unsafe_allow_html=True)
+        if not results and not similar:
+            st.info("No books found.")
     else:
-        st.info("No books found.")
+        st.session_state.live_page = {"change_id": change_id, "rows": books}
+        render_live_page(selected_cat, page_cursors[-1])
+        if books:
+            render_page_nav(selected_cat, len(page_cursors), next_cursor)
+    mark("listing")
 
     if st.session_state.view_mode == 'admin':
         col1, col2 = st.columns(2)
 
         with col1:
             with st.expander("➕ Add a New Book", expanded=True):
+                if 'add_warning' in st.session_state:
+                    st.warning(st.session_state.pop('add_warning'))
                 with st.form("add_book_form"):
                     new_name = st.text_input("Book Name")
                     new_number = st.text_input("Book Number (can be alphanumeric)")
@@ -557,22 +744,30 @@ def main_app(username):
                         if not new_name.strip() or not new_number.strip():
                             st.error("Book Name and Number cannot be empty.")
                         else:
-                            add_book(new_name.strip(), new_number.strip(), new_author.strip() or None, selected_cat)
+                            duplicates = add_book(new_name.strip(), new_number.strip(), new_author.strip() or None,
+                                                  selected_cat)
+                            if duplicates:
+                                st.session_state.add_warning = (f"'{new_name.strip()}' looks like {len(duplicates)} "
+                                                                "book(s) already in the catalog; see 🔁 Duplicates.")
                             st.success(f"Added '{new_name}' to '{selected_cat}'.")
                             st.rerun()
 
         with col2:
             with st.expander("🗑️ Delete a Book", expanded=True):
-                if df_cat.empty:
+                if not books:
                     st.info("No books to delete.")
                 else:
-                    delete_options = [(row['id'], f"{row['name']} by {row['author'] or 'Unknown'}") for idx, row in df_cat.iterrows()]
+                    delete_options = [(book.id, f"{book.name} by {book.author or 'Unknown'}") for book in books]
                     book_to_delete = st.selectbox("Select book to delete", options=delete_options, format_func=lambda x: x[1])
 
                     if st.button("Delete Book"):
-                        delete_book(book_to_delete[0])
-                        st.success(f"Deleted '{book_to_delete[1]}'.")
-                        st.rerun()
+                        try:
+                            delete_book(book_to_delete[0])
+                        except DeleteError as e:
+                            st.error(str(e))
+                        else:
+                            st.success(f"Deleted '{book_to_delete[1]}'.")
+                            st.rerun()
 
         st.markdown("---")
         
@@ -597,21 +792,65 @@ def main_app(username):
                     category_to_delete = st.selectbox("Select category to delete", options=categories)
                     if st.button("Delete Category"):
                         if st.warning(f"Are you sure you want to delete '{category_to_delete}'? This will also delete all books in this category."):
-                            delete_category(category_to_delete)
-                            st.success(f"Deleted category '{category_to_delete}' and all its books.")
+                            submit_job("delete_category", f"Delete category '{category_to_delete}'", category_to_delete)
+                            st.success(f"Deleting category '{category_to_delete}' and all its books in the background.")
                             st.rerun()
+
+        with st.expander("✏️ Edit This Page", expanded=False):
+            render_batch_edit(books, categories, selected_cat, len(page_cursors))
+
+        with st.expander("📊 Statistics", expanded=False):
+            render_statistics()
+
+        with st.expander("📖 Circulation", expanded=False):
+            render_circulation(books)
+
+        with st.expander("📷 Barcode Intake", expanded=False):
+            render_intake(selected_cat)
+
+        with st.expander("📥 Bulk Import", expanded=False):
+            render_bulk_import(selected_cat)
+
+        with st.expander("📤 Export Catalog", expanded=False):
+            render_export(selected_cat)
+
+        with st.expander("🔁 Duplicates", expanded=False):
+            render_duplicates()
+
+        with st.expander("🗑️ Trash", expanded=False):
+            render_trash()
+
+        with st.expander("💾 Backups", expanded=False):
+            render_backups()
+
+        with st.expander("⚙️ Jobs", expanded=False):
+            if st.button("🔄 Rebuild search indexes", key="reindex"):
+                submit_job("reindex", "Rebuild search indexes")
+            render_jobs()
+        mark("admin")
+
+        if PROFILING:
+            with st.expander("🩺 Diagnostics", expanded=False):
+                render_diagnostics()
     else:
         # guest view only
         st.info("Read-only access. Please login as admin to modify the catalog.")
 
 def main():
     st.set_page_config(page_title="Library Catalog", layout="centered")
-    init_db()
+    with profile_rerun(st.session_state.get('view_mode') or 'login') as profile:
+        init_catalog(db.DB_FILE)
+        mark("init_db")
 
-    if 'logged_in' not in st.session_state or not st.session_state.logged_in:
-        login()
-    else:
-        main_app(st.session_state.get('username', 'guest'))
+        with db.use_database(current_database()):
+            if 'logged_in' not in st.session_state or not st.session_state.logged_in:
+                login()
+                mark("login")
+            else:
+                main_app(st.session_state.get('username', 'guest'))
+    if profile is not None:
+        # Shown by the diagnostics panel on the next rerun
+        st.session_state.last_profile = profile
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,260 @@
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import db
+from branches import branch_path
+from cache import clear_cache
+from catalog import catalog_generation, init_db, latest_change_id
+from instrument import traced
+from writer import write
+
+# Snapshots go to BACKUP_DIR/<database name>/, newest BACKUP_KEEP kept
+BACKUP_DIR = os.environ.get("LIBRARY_BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.environ.get("LIBRARY_BACKUP_KEEP", "14"))
+# A snapshot is taken when the newest one is older than this; 0 turns the
+# schedule off
+BACKUP_HOURS = float(os.environ.get("LIBRARY_BACKUP_HOURS", "24"))
+SCHEDULE_CHECK_SECONDS = 600
+# Pages copied per backup step. The source is only read, inside one read
+# transaction, so in WAL mode neither readers nor the writer wait on it.
+BACKUP_PAGES = 1024
+COMPRESS_LEVEL = 6
+COPY_CHUNK = 1024 * 1024
+SUFFIX = ".db.gz"
+STAMP_FORMAT = "%Y%m%dT%H%M%SZ"
+
+Snapshot = namedtuple("Snapshot", "path created size")
+
+log = logging.getLogger("library.backup")
+
+
+class BackupError(ValueError):
+    pass
+
+
+def backup_dir(path=None):
+    return os.path.join(BACKUP_DIR, db.database_name(path))
+
+
+def list_backups(path=None):
+    # Newest first
+    directory = backup_dir(path)
+    prefix = db.database_name(path) + "-"
+    snapshots = []
+    for entry in os.scandir(directory) if os.path.isdir(directory) else ():
+        if not (entry.name.startswith(prefix) and entry.name.endswith(SUFFIX)):
+            continue
+        try:
+            created = datetime.strptime(entry.name[len(prefix):-len(SUFFIX)], STAMP_FORMAT)
+        except ValueError:
+            continue
+        snapshots.append(Snapshot(entry.path, created.replace(tzinfo=timezone.utc), entry.stat().st_size))
+    snapshots.sort(key=lambda snapshot: snapshot.created, reverse=True)
+    return snapshots
+
+
+def rotate(path=None, keep=BACKUP_KEEP):
+    for snapshot in list_backups(path)[keep:]:
+        os.remove(snapshot.path)
+
+
+@traced
+def create_backup(path=None, progress=None):
+    # Copies the live database page by page with the backup API, then gzips
+    # the copy. progress(copied_pages, total_pages) is called after each step.
+    path = path or db.current_path()
+    directory = backup_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    created = datetime.now(timezone.utc).replace(microsecond=0)
+    target = os.path.join(directory, f"{db.database_name(path)}-{created.strftime(STAMP_FORMAT)}{SUFFIX}")
+    while os.path.exists(target):
+        # Two snapshots within a second, e.g. a restore right after a backup
+        created += timedelta(seconds=1)
+        target = os.path.join(directory, f"{db.database_name(path)}-{created.strftime(STAMP_FORMAT)}{SUFFIX}")
+    fd, raw = tempfile.mkstemp(suffix=".db", dir=directory)
+    os.close(fd)
+    try:
+        dest = sqlite3.connect(raw)
+        try:
+            with db.connection(path) as source:
+                # Without a read transaction around the steps, every commit
+                # by the writer thread restarts the copy from page one
+                source.execute("BEGIN")
+                source.execute("SELECT 1 FROM catalog_meta").fetchone()
+                try:
+                    source.backup(dest, pages=BACKUP_PAGES,
+                                  progress=progress and (lambda _, remaining, total: progress(total - remaining, total)))
+                finally:
+                    source.rollback()
+        finally:
+            dest.close()
+        with open(raw, "rb") as src, gzip.open(target + ".part", "wb", compresslevel=COMPRESS_LEVEL) as out:
+            shutil.copyfileobj(src, out, COPY_CHUNK)
+        os.replace(target + ".part", target)
+    finally:
+        os.remove(raw)
+        if os.path.exists(target + ".part"):
+            os.remove(target + ".part")
+    rotate(path)
+    snapshot = Snapshot(target, created, os.path.getsize(target))
+    log.info("backed up %s to %s (%d bytes)", path, target, snapshot.size)
+    return snapshot
+
+
+@traced
+def restore_backup(snapshot_path, path=None):
+    # Replaces the live database with a snapshot, after taking a snapshot of
+    # the current state so the restore itself can be undone. Other sessions
+    # keep their connections; SQLite sees the restore as one big commit.
+    path = path or db.current_path()
+    directory = backup_dir(path)
+    # The snapshot may come from elsewhere, before this database has any
+    os.makedirs(directory, exist_ok=True)
+    fd, raw = tempfile.mkstemp(suffix=".db", dir=directory)
+    os.close(fd)
+    try:
+        try:
+            with gzip.open(snapshot_path, "rb") as src, open(raw, "wb") as out:
+                shutil.copyfileobj(src, out, COPY_CHUNK)
+        except (OSError, EOFError) as e:
+            raise BackupError(f"{os.path.basename(snapshot_path)} is not a readable snapshot: {e}") from None
+        source = sqlite3.connect(raw)
+        try:
+            try:
+                ok = source.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+            except sqlite3.DatabaseError:
+                ok = False
+            if not ok:
+                raise BackupError(f"{os.path.basename(snapshot_path)} is damaged")
+            before = create_backup(path)
+            with db.use_database(path):
+                generation, change_id = catalog_generation(), latest_change_id()
+            with db.connection(path) as conn:
+                jobs = _jobs_in_flight(conn)
+            dest = db.connect(path)
+            try:
+                # One step: the copy holds the write lock until it's done
+                source.backup(dest)
+            finally:
+                dest.close()
+        finally:
+            source.close()
+    finally:
+        os.remove(raw)
+
+    with db.use_database(path):
+        # The snapshot may predate the current schema
+        init_db()
+        write(_after_restore, generation, change_id, *jobs)
+    clear_cache()
+    log.info("restored %s from %s (previous state saved as %s)", path, snapshot_path, before.path)
+    return before
+
+
+def _jobs_in_flight(conn):
+    # The last job id handed out and the jobs still queued or running, which
+    # go on updating their rows by id after the restore
+    last_id = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'jobs'").fetchone()[0]
+    rows = conn.execute("SELECT * FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+    return last_id, rows
+
+
+def _after_restore(conn, generation, change_id, last_job_id, jobs):
+    # Sessions key their caches on the generation and poll the change feed
+    # from the last id they saw; the restored values are older, so both are
+    # moved past what sessions already have
+    conn.execute("UPDATE catalog_meta SET value = MAX(value, ?) + 1 WHERE key = 'generation'", (generation,))
+    conn.execute('''
+        INSERT INTO catalog_changes (category, change_id) SELECT name, ? FROM categories WHERE true
+        ON CONFLICT (category) DO UPDATE SET change_id = excluded.change_id
+    ''', (change_id + 1,))
+    # Jobs the snapshot caught in flight were cut off by the restore, so
+    # they would show as running forever. The ones really in flight are put
+    # back, and new jobs start past every id already handed out, so a job
+    # never updates a row that isn't its own.
+    conn.execute('''
+        UPDATE jobs SET status = 'failed', message = 'interrupted by a restore', finished_at = datetime('now')
+        WHERE status IN ('queued', 'running')
+    ''')
+    if jobs:
+        conn.executemany(f"INSERT OR REPLACE INTO jobs VALUES ({','.join('?' * len(jobs[0]))})", jobs)
+    conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'jobs'", (last_job_id,))
+    conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'jobs', ? WHERE NOT EXISTS "
+                 "(SELECT 1 FROM sqlite_sequence WHERE name = 'jobs')", (last_job_id,))
+
+
+class BackupScheduler:
+    # Checks every few minutes and backs up any database whose newest
+    # snapshot is older than BACKUP_HOURS, including at startup
+
+    def __init__(self, paths, hours=BACKUP_HOURS):
+        self.paths = list(paths)
+        self.hours = hours
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            for path in self.paths:
+                latest = list_backups(path)[:1]
+                age = (datetime.now(timezone.utc) - latest[0].created).total_seconds() if latest else None
+                if age is None or age >= self.hours * 3600:
+                    try:
+                        create_backup(path)
+                    except Exception:
+                        log.exception("scheduled backup of %s failed", path)
+            if self._stop.wait(SCHEDULE_CHECK_SECONDS):
+                return
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_backups(paths):
+    global _scheduler
+    if BACKUP_HOURS <= 0:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BackupScheduler(paths)
+    return _scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up the catalog, list snapshots or restore one.")
+    parser.add_argument("--db", default=db.DB_FILE)
+    parser.add_argument("--branch", help="use this branch's database (see LIBRARY_BRANCHES) instead of --db")
+    parser.add_argument("--list", action="store_true", help="list snapshots, newest first")
+    parser.add_argument("--restore", metavar="SNAPSHOT", help="replace the database with this snapshot")
+    args = parser.parse_args()
+
+    db.DB_FILE = branch_path(args.branch) if args.branch else args.db
+    if args.list:
+        for snapshot in list_backups():
+            print(f"{snapshot.created:%Y-%m-%d %H:%M} UTC  {snapshot.size / 1e6:8.1f} MB  {snapshot.path}")
+    elif args.restore:
+        init_db()
+        before = restore_backup(args.restore)
+        print(f"restored {db.DB_FILE}; the previous state is in {before.path}")
+    else:
+        init_db()
+        snapshot = create_backup()
+        print(f"{snapshot.path} ({snapshot.size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Benchmark sessions start the app, which would otherwise snapshot the
+# synthetic catalog into backups/
+os.environ["LIBRARY_BACKUP_HOURS"] = "0"
+
+import db  # noqa: E402
+import catalog  # noqa: E402
+from cache import clear_cache  # noqa: E402
+from importer import import_books  # noqa: E402
+from search import search_books  # noqa: E402
+from writer import close_writers  # noqa: E402
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+CATEGORIES = 40
+
+ENGLISH = ("education", "psychology", "teaching", "child", "development", "history", "science", "mathematics",
+           "language", "learning", "school", "curriculum", "evaluation", "methods", "principles", "modern",
+           "india", "society", "philosophy", "guidance", "primary", "environment", "health", "physical")
+HINDI = ("शिक्षा", "मनोविज्ञान", "शिक्षण", "बाल", "विकास", "इतिहास", "विज्ञान", "गणित", "भाषा", "अधिगम",
+         "विद्यालय", "पाठ्यक्रम", "मूल्यांकन", "विधियाँ", "सिद्धांत", "आधुनिक", "भारत", "समाज", "दर्शन")
+SURNAMES = ("Sharma", "Gupta", "Verma", "Singh", "Rawat", "Negi", "Joshi", "Bisht", "Pandey", "Mishra",
+            "शर्मा", "गुप्ता", "वर्मा", "सिंह", "जोशी", "NCERT", "SCERT")
+
+
+def synthetic_books(count, seed=1983):
+    rng = random.Random(seed)
+    for i in range(count):
+        words = HINDI if rng.random() < 0.5 else ENGLISH
+        title = " ".join(rng.choice(words) for _ in range(rng.randint(2, 5)))
+        author = f"{rng.choice('ABCDEFGHJKLMNPRST')}.{rng.choice('ABCDEFGHJKLMNPRST')}. {rng.choice(SURNAMES)}"
+        yield {"name": title, "number": str(i + 1), "author": author, "category": str(i % CATEGORIES + 1)}
+
+
+def build_catalog(path, size):
+    close_writers()
+    db.close_pools()
+    clear_cache()
+    db.DB_FILE = path
+    catalog.init_db()
+    result = import_books(synthetic_books(size), skip_duplicates=False, batch_size=20_000)
+    return result.seconds
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples) * 1e3,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e3,
+        "runs": repeat,
+    }
+
+
+def bench_hot_paths(repeat):
+    category = "1"
+    _, cursor = catalog.get_books_page.uncached(category)
+    # A cursor deep into the largest category, to show page cost stays flat
+    deep = cursor
+    for _ in range(20):
+        _, next_cursor = catalog.get_books_page.uncached(category, deep)
+        if next_cursor is None:
+            break
+        deep = next_cursor
+
+    results = {
+        # get_categories reads the cached get_category_counts, so the cache
+        # is cleared each run to time the query rather than a cache hit
+        "get_categories": timed(lambda: clear_cache() or catalog.get_categories.uncached(), repeat),
+        "get_category_counts": timed(catalog.get_category_counts.uncached, repeat),
+        "get_total_books": timed(catalog.get_total_books.uncached, repeat),
+        "get_books_page_first": timed(lambda: catalog.get_books_page.uncached(category), repeat),
+        "get_books_page_deep": timed(lambda: catalog.get_books_page.uncached(category, deep), repeat),
+        "search_prefix": timed(lambda: search_books("शिक्ष"), repeat),
+        "search_two_terms": timed(lambda: search_books("child devel"), repeat),
+        "cached_get_books_page": timed(lambda: catalog.get_books_page(category), repeat),
+    }
+
+    added = []
+
+    def add():
+        catalog.add_book("Benchmark Book", f"BENCH-{len(added)}", "Bench", category)
+        added.append(None)
+
+    results["add_book"] = timed(add, repeat)
+    with db.connection() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM books WHERE number LIKE 'BENCH-%'")]
+    results["delete_book"] = timed(lambda: catalog.delete_book(ids.pop()), len(ids))
+    return results
+
+
+def _session_worker(path):
+    os.environ["LIBRARY_DB"] = path
+    db.DB_FILE = path
+
+
+def run_session(app_path, category):
+    from streamlit.testing.v1 import AppTest
+
+    timings = []
+    # The app runs as __main__; the worker needs its own back to unpickle
+    # the next session it is sent
+    main_module = sys.modules["__main__"]
+    try:
+        at = AppTest.from_file(app_path, default_timeout=60)
+        for action in ("login", "view", "category", "search", "clear"):
+            if action == "view":
+                at.button(key="view_catalog").click()
+            elif action == "category":
+                at.button(key=f"cat_{category}").click()
+            elif action == "search":
+                at.text_input[0].input("education")
+            elif action == "clear":
+                at.text_input[0].input("")
+            start = time.perf_counter()
+            at.run()
+            timings.append((action, time.perf_counter() - start))
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+    finally:
+        sys.modules["__main__"] = main_module
+    return timings
+
+
+def bench_sessions(path, sessions, rounds):
+    # AppTest drives a process-wide Streamlit runtime, so each concurrent
+    # session gets a process of its own
+    app_path = os.path.join(ROOT, "app.py")
+    reruns = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(sessions, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_session_worker, initargs=(path,)) as pool:
+        jobs = [pool.submit(run_session, app_path, str(i % CATEGORIES + 1)) for i in range(sessions * rounds)]
+        for job in jobs:
+            for action, seconds in job.result():
+                reruns.setdefault(action, []).append(seconds)
+    wall = time.perf_counter() - start
+    summary = {
+        action: {
+            "median_ms": statistics.median(samples) * 1e3,
+            "max_ms": max(samples) * 1e3,
+            "runs": len(samples),
+        }
+        for action, samples in reruns.items()
+    }
+    summary["sessions"] = sessions
+    summary["wall_seconds"] = wall
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark catalog hot paths on synthetic catalogs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent AppTest sessions, 0 to skip")
+    parser.add_argument("--rounds", type=int, default=2, help="sessions started per concurrent slot")
+    parser.add_argument("--output", default="bench_catalog.json")
+    args = parser.parse_args()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"catalog-{size}.db")
+            print(f"building {size:,} books...", flush=True)
+            entry = {"build_seconds": build_catalog(path, size)}
+            entry["hot_paths"] = bench_hot_paths(args.repeat)
+            if args.sessions:
+                clear_cache()
+                entry["sessions"] = bench_sessions(path, args.sessions, args.rounds)
+            report["sizes"][str(size)] = entry
+            for name, stats in entry["hot_paths"].items():
+                print(f"  {name:24} {stats['median_ms']:9.3f} ms  (p95 {stats['p95_ms']:.3f})")
+            for action, stats in entry.get("sessions", {}).items():
+                if isinstance(stats, dict):
+                    print(f"  rerun:{action:18} {stats['median_ms']:9.1f} ms  (max {stats['max_ms']:.1f})")
+        close_writers()
+        db.close_pools()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
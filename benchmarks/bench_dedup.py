@@ -0,0 +1,48 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_catalog import synthetic_books  # noqa: E402
+from dedup import find_duplicates  # noqa: E402
+
+
+def catalog_with_duplicates(size, duplicates, missing_numbers, seed=1983):
+    # Synthetic books, some without a number, plus re-entered copies of
+    # random books with the title's case and spelling changed
+    rng = random.Random(seed)
+    books = []
+    for i, book in enumerate(synthetic_books(size, seed)):
+        number = None if rng.random() < missing_numbers else book["number"]
+        books.append((i + 1, book["name"], number, book["author"]))
+    planted = set()
+    for _ in range(duplicates):
+        book_id, name, number, author = books[rng.randrange(size)]
+        books.append((len(books) + 1, name.upper().replace("SH", "S"), number, author))
+        planted.add((book_id, len(books)))
+    return books, planted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the full duplicate scan on synthetic catalogs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--duplicates", type=float, default=0.005, help="share of books re-entered")
+    parser.add_argument("--missing-numbers", type=float, default=0.1, help="share of books without a number")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        books, planted = catalog_with_duplicates(size, int(size * args.duplicates), args.missing_numbers)
+        start = time.perf_counter()
+        pairs = find_duplicates(books)
+        seconds = time.perf_counter() - start
+        found = {(pair.book_id, pair.other_id) for pair in pairs}
+        print(f"{len(books):>9} books  {seconds:6.2f} s  {len(pairs):6} pairs  "
+              f"{len(planted & found)}/{len(planted)} planted duplicates found")
+
+
+if __name__ == "__main__":
+    main()
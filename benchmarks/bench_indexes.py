@@ -0,0 +1,79 @@
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import LATEST_VERSION, migrate  # noqa: E402
+
+QUERIES = {
+    "categories": ("SELECT category FROM books GROUP BY category ORDER BY MIN(id)", ()),
+    "distinct_categories": ("SELECT DISTINCT category FROM books", ()),
+    "books_by_category": ("SELECT * FROM books WHERE category = ?", ("category",)),
+    "listing_columns": ("SELECT id, name, author FROM books WHERE category = ? ORDER BY name, id LIMIT 51", ("category",)),
+    "by_number": ("SELECT * FROM books WHERE number = ?", ("number",)),
+}
+
+
+def sample_params(conn):
+    category, number = conn.execute(
+        "SELECT category, number FROM books GROUP BY category ORDER BY COUNT(*) DESC LIMIT 1"
+    ).fetchone()
+    return {"category": category, "number": number}
+
+
+def measure(conn, repeat):
+    samples = sample_params(conn)
+    results = {}
+    for label, (sql, names) in QUERIES.items():
+        params = tuple(samples[n] for n in names)
+        plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append(time.perf_counter() - start)
+        results[label] = (plan, statistics.median(timings))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query plans and latency before/after the index migration.")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A fresh v1 database holding --db's books, so every later migration
+        # runs from the start; --db itself is only read
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"), uri=True)
+        migrate(conn, 1)
+        conn.execute("ATTACH DATABASE ? AS source", (f"file:{os.path.abspath(args.db)}?mode=ro",))
+        conn.execute('''
+            INSERT INTO books (id, name, number, author, category)
+            SELECT id, name, COALESCE(number, ''), author, category FROM source.books
+        ''')
+        conn.commit()
+        conn.execute("DETACH DATABASE source")
+        total = conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+        before = measure(conn, args.repeat)
+        migrate(conn, LATEST_VERSION)
+        after = measure(conn, args.repeat)
+        conn.close()
+
+    print(f"{total} books, median of {args.repeat} runs\n")
+    for label in QUERIES:
+        plan_before, t_before = before[label]
+        plan_after, t_after = after[label]
+        print(f"{label}: {t_before * 1e3:.3f} ms -> {t_after * 1e3:.3f} ms ({t_before / t_after:.1f}x)")
+        print(f"  before: {'; '.join(plan_before)}")
+        print(f"  after:  {'; '.join(plan_after)}")
+
+
+if __name__ == "__main__":
+    main()
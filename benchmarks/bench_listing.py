@@ -0,0 +1,78 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+from streamlit import dataframe_util  # noqa: E402
+
+import db  # noqa: E402
+import catalog  # noqa: E402
+from app import listing_table  # noqa: E402
+
+COLUMNS = ["id", "name", "number", "author"]
+
+
+# What one rerun of the listing did before: a DataFrame for the page, the
+# two shown columns converted to Arrow for st.dataframe, and iterrows() for
+# the admin delete picker.
+def rerun_dataframe(category, limit):
+    with db.connection() as conn:
+        rows = conn.execute(
+            "SELECT id, name, number, author FROM books WHERE category = ? ORDER BY name, id LIMIT ?", (category, limit)
+        ).fetchall()
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    dataframe_util.convert_anything_to_arrow_bytes(df[["name", "author"]])
+    return [(row["id"], f"{row['name']} by {row['author'] or 'Unknown'}") for _, row in df.iterrows()]
+
+
+def rerun_tuples(category, limit):
+    books, _ = catalog.get_books_page.uncached(category, None, limit)
+    dataframe_util.convert_anything_to_arrow_bytes(listing_table(books))
+    return [(book.id, f"{book.name} by {book.author or 'Unknown'}") for book in books]
+
+
+def measure(fn, category, limit, repeat):
+    fn(category, limit)
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    for _ in range(repeat):
+        fn(category, limit)
+    cpu = (time.process_time() - cpu) / repeat
+    wall = (time.perf_counter() - wall) / repeat
+    tracemalloc.start()
+    fn(category, limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ms": cpu * 1e3, "wall_ms": wall * 1e3, "peak_kib": peak / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-rerun cost of the DataFrame and tuple listing paths.")
+    parser.add_argument("--db", default="library.db")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--limits", type=int, nargs="+", default=[catalog.PAGE_SIZE, 1000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_FILE = os.path.join(tmp, "bench.db")
+        shutil.copy(args.db, db.DB_FILE)
+        catalog.init_db()
+        with db.connection() as conn:
+            category = conn.execute("SELECT name FROM categories ORDER BY book_count DESC LIMIT 1").fetchone()[0]
+        for limit in args.limits:
+            print(f"category {category!r}, {limit} rows per rerun")
+            for label, fn in (("dataframe", rerun_dataframe), ("tuples", rerun_tuples)):
+                stats = measure(fn, category, limit, args.repeat)
+                print(f"  {label:10} cpu {stats['cpu_ms']:8.3f} ms  wall {stats['wall_ms']:8.3f} ms"
+                      f"  peak {stats['peak_kib']:8.1f} KiB")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
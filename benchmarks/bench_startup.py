@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each sample runs in a fresh interpreter so nothing is already imported.
+# streamlit itself is imported first and timed separately: a server has it
+# loaded before any session connects, so only the app's own modules count.
+IMPORT_PROBE = """
+import sys, time
+sys.path.insert(0, {root!r})
+import streamlit
+start = time.perf_counter()
+import app
+print(time.perf_counter() - start, "pandas" in sys.modules)
+"""
+
+FIRST_PAINT_PROBE = """
+import os, sys, time
+sys.path.insert(0, {root!r})
+import streamlit
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(os.path.join({root!r}, "app.py"), default_timeout=60)
+start = time.perf_counter()
+at.run()
+first = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+second = time.perf_counter() - start
+if at.exception:
+    raise SystemExit(at.exception[0].message)
+print(first, second)
+"""
+
+
+def probe(code, env):
+    out = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True)
+    return out.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import time and time to first paint of the login page.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--root", default=ROOT, help="checkout to measure, e.g. a worktree of an older commit")
+    parser.add_argument("--output", default=None, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    imports, first_paint, rerun = [], [], []
+    pandas_loaded = False
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, LIBRARY_DB=os.path.join(tmp, "startup.db"))
+        for _ in range(args.repeat):
+            seconds, loaded = probe(IMPORT_PROBE.format(root=args.root), env)
+            imports.append(float(seconds))
+            pandas_loaded = loaded == "True"
+            first, second = probe(FIRST_PAINT_PROBE.format(root=args.root), env)
+            first_paint.append(float(first))
+            rerun.append(float(second))
+
+    report = {
+        "import_app_ms": statistics.median(imports) * 1e3,
+        "pandas_imported_by_app": pandas_loaded,
+        "first_paint_ms": statistics.median(first_paint) * 1e3,
+        "login_rerun_ms": statistics.median(rerun) * 1e3,
+        "runs": args.repeat,
+    }
+    for name, value in report.items():
+        print(f"{name:24} {value:.1f}" if isinstance(value, float) else f"{name:24} {value}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import heapq
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+import db
+from catalog import init_db
+from instrument import traced
+from search import SEARCH_LIMIT, ranked_search
+
+# Multi-branch mode: LIBRARY_BRANCHES="DIET=library.db,GHS Kolar=branches/ghs-kolar.db"
+# Each branch is its own SQLite file with its own schema, pool, write queue
+# and read cache, so a branch's data never mixes with another's and each
+# file can be copied, backed up or restored on its own. Unset means the
+# single catalog in LIBRARY_DB.
+BRANCHES_ENV = "LIBRARY_BRANCHES"
+SEARCH_WORKERS = int(os.environ.get("LIBRARY_SEARCH_WORKERS", "4"))
+
+# relevance is the hit's bm25 score over the best score in its branch, so
+# every branch's best match is 1.0
+BranchHit = namedtuple("BranchHit", "branch relevance hit")
+
+
+class BranchError(ValueError):
+    pass
+
+
+def parse_branches(spec):
+    # "name=path,name=path" -> {name: path}, in the order given
+    branches = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, sep, path = (part.strip() for part in entry.partition("="))
+        if not sep or not name or not path:
+            raise BranchError(f"{BRANCHES_ENV} entry {entry!r} should look like name=path")
+        if name in branches:
+            raise BranchError(f"branch {name!r} is listed twice")
+        for other, other_path in branches.items():
+            if os.path.abspath(path) == os.path.abspath(other_path):
+                raise BranchError(f"branches {other!r} and {name!r} share the database {path!r}")
+            # Backups and exports are filed by database name, and branches
+            # sharing one would rotate away and restore each other's snapshots
+            if db.database_name(path) == db.database_name(other_path):
+                raise BranchError(f"branches {other!r} and {name!r} need database files with different names")
+        branches[name] = path
+    return branches
+
+
+BRANCHES = parse_branches(os.environ.get(BRANCHES_ENV, ""))
+
+
+def branch_names():
+    return list(BRANCHES)
+
+
+def branch_path(name):
+    try:
+        return BRANCHES[name]
+    except KeyError:
+        raise BranchError(f"no branch named {name!r}") from None
+
+
+@contextmanager
+def use_branch(name):
+    with db.use_database(branch_path(name)):
+        yield
+
+
+def init_branches():
+    for path in BRANCHES.values():
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with db.use_database(path):
+            init_db()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(SEARCH_WORKERS, thread_name_prefix="branch-search")
+    return _executor
+
+
+def _search_branch(name, text, category, limit):
+    # Runs on a search worker, which doesn't inherit the caller's database
+    with use_branch(name):
+        ranked = ranked_search(text, category, limit)
+    best = ranked[0][0] if ranked else 0
+    return [BranchHit(name, score / best if best < 0 else 1.0, hit) for score, hit in ranked]
+
+
+@traced
+def search_branches(text, names=None, category=None, limit=SEARCH_LIMIT):
+    # Union search: every branch is queried at once on the shared worker
+    # pool and the per-branch rankings, each already sorted, are merged.
+    # Raw bm25 can't be compared across branches: it weighs terms by each
+    # file's own statistics, and a small school library scores everything
+    # near zero. Relative scores put each branch's best matches side by side.
+    names = branch_names() if names is None else list(names)
+    futures = [_get_executor().submit(_search_branch, name, text, category, limit) for name in names]
+    ranked = [future.result() for future in futures]
+    return list(islice(heapq.merge(*ranked, key=lambda hit: -hit.relevance), limit))
@@ -0,0 +1,110 @@
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import db
+
+CACHE_SIZE = 256
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.generation = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, generation):
+        with self._lock:
+            if generation != self.generation:
+                # A write happened since these entries were stored
+                if self._data:
+                    self.invalidations += 1
+                self._data.clear()
+                self.generation = generation
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value, generation):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.generation = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._data),
+                "maxsize": self.maxsize,
+                "generation": self.generation,
+            }
+
+
+# One cache per database: each branch has its own generation, so a write
+# to one branch must not throw away the others' entries
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _cache_for(path):
+    cache = _caches.get(path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(path, LRUCache())
+    return cache
+
+
+def cached(generation):
+    # Memoize a read helper until generation() changes. Cached values are
+    # shared between sessions, so callers must treat them as read-only.
+    def decorator(func):
+        # Qualified by module too: helpers in different modules may share a name
+        name = (func.__module__, func.__qualname__)
+
+        @wraps(func)
+        def wrapper(*args):
+            cache = _cache_for(db.current_path())
+            current = generation()
+            key = (name, args)
+            value = cache.get(key, current)
+            if value is _MISSING:
+                value = func(*args)
+                cache.put(key, value, current)
+            return value
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+def cache_stats(path=None):
+    return _cache_for(path or db.current_path()).stats()
+
+
+def clear_cache():
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.clear()
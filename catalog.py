@@ -0,0 +1,466 @@
+import json
+from collections import namedtuple
+from contextlib import contextmanager
+
+from cache import cached
+from db import connection
+from dedup import check_book, find_duplicates, number_key, set_number_keys
+from fuzzy import index_books, unindex_books
+from instrument import traced
+from migrations import (
+    AUTHOR_KEY,
+    BOOKS_CHANGES_INSERT_TRIGGER,
+    BOOKS_COUNT_INSERT_TRIGGER,
+    BOOKS_STATS_INSERT_TRIGGER,
+    migrate,
+)
+from writer import write
+
+PAGE_SIZE = 50
+# Deleted books can be restored from the trash for this long
+TRASH_DAYS = 30
+DUPLICATE_LIMIT = 50
+# Books inserted in bulk are checked for duplicates this many per write,
+# so each write holds the write queue for a fraction of a second. Above
+# CHECK_ALL_ABOVE new books one full scan is cheaper than checking each.
+CHECK_BATCH = 20
+CHECK_ALL_ABOVE = 1000
+
+# Listing rows are plain tuples: no per-row dict, and no DataFrame built
+# on every rerun just to show two columns. due_at is set while the book is
+# on loan.
+Book = namedtuple("Book", "id name number author due_at")
+TrashEntry = namedtuple("TrashEntry", "id deleted_at label category book_count")
+DuplicateSuggestion = namedtuple(
+    "DuplicateSuggestion",
+    "score book_id name number author category other_id other_name other_number other_author other_category",
+)
+
+
+class MergeError(ValueError):
+    pass
+
+
+class DeleteError(ValueError):
+    pass
+
+
+# The open-loan join probes the partial index on loans, which only holds
+# books currently out, so its cost doesn't grow with loan history
+BOOK_COLUMNS = '''
+    SELECT b.id, b.name, b.number, b.author, l.due_at
+    FROM books b LEFT JOIN loans l ON l.book_id = b.id AND l.returned_at IS NULL
+'''
+
+
+@traced
+def init_db():
+    with connection() as conn:
+        migrate(conn)
+
+
+def catalog_generation():
+    with connection() as conn:
+        return conn.execute("SELECT value FROM catalog_meta WHERE key = 'generation'").fetchone()[0]
+
+
+def bump_generation(conn):
+    conn.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'generation'")
+
+
+@contextmanager
+def deferred_book_triggers(conn):
+    # For bulk inserts inside an explicit transaction, like
+    # search.deferred_fts_index: the per-row triggers keeping the category
+    # counts, the change feed and the statistics aggregates are replaced by
+    # one set-based update of each for all the books inserted in the block.
+    if not conn.in_transaction:
+        raise RuntimeError("deferred_book_triggers needs an open transaction")
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM books").fetchone()[0]
+    for trigger in ("books_count_ai", "books_changes_ai", "books_stats_ai"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    yield
+    added = conn.execute("SELECT COUNT(*) FROM books WHERE id > ?", (last_id,)).fetchone()[0]
+    if added:
+        _count_new_books(conn, last_id, added)
+    for sql in (BOOKS_COUNT_INSERT_TRIGGER, BOOKS_CHANGES_INSERT_TRIGGER, BOOKS_STATS_INSERT_TRIGGER):
+        conn.execute(sql)
+
+
+def _count_new_books(conn, last_id, added):
+    author = AUTHOR_KEY.format(row="books")
+    conn.execute('''
+        UPDATE categories SET book_count = book_count + (
+            SELECT COUNT(*) FROM books WHERE id > :last AND category = categories.name
+        )
+        WHERE name IN (SELECT category FROM books WHERE id > :last)
+    ''', {"last": last_id})
+    # One stamp per category, numbered in the order of each one's last new
+    # book, which is where the row trigger would have left them
+    base = conn.execute("SELECT COALESCE(MAX(change_id), 0) FROM catalog_changes").fetchone()[0]
+    conn.execute('''
+        INSERT INTO catalog_changes (category, change_id)
+        SELECT category, ? + ROW_NUMBER() OVER (ORDER BY MAX(id)) FROM books WHERE id > ? GROUP BY category
+        ON CONFLICT (category) DO UPDATE SET change_id = excluded.change_id
+    ''', (base, last_id))
+
+    # The catalog_meta counters move for authors new to the catalog and for
+    # numbers reaching a second book, so they are counted before the upserts
+    conn.execute(f'''
+        UPDATE catalog_meta SET value = value + (
+            SELECT COUNT(DISTINCT {author}) FROM books
+            WHERE id > ? AND {author} != '' AND {author} NOT IN (SELECT author FROM author_counts)
+        )
+        WHERE key = 'authors'
+    ''', (last_id,))
+    conn.execute('''
+        UPDATE catalog_meta SET value = value + (
+            SELECT COUNT(*) FROM (
+                SELECT number, COUNT(*) AS added FROM books WHERE id > ? AND number IS NOT NULL GROUP BY number
+            ) new LEFT JOIN number_counts old USING (number)
+            WHERE IFNULL(old.book_count, 0) < 2 AND IFNULL(old.book_count, 0) + new.added >= 2
+        )
+        WHERE key = 'duplicate_numbers'
+    ''', (last_id,))
+    conn.execute(f'''
+        INSERT INTO author_counts (author, book_count)
+        SELECT {author}, COUNT(*) FROM books WHERE id > ? GROUP BY 1
+        ON CONFLICT (author) DO UPDATE SET book_count = book_count + excluded.book_count
+    ''', (last_id,))
+    conn.execute('''
+        INSERT INTO number_counts (number, book_count)
+        SELECT number, COUNT(*) FROM books WHERE id > ? AND number IS NOT NULL GROUP BY number
+        ON CONFLICT (number) DO UPDATE SET book_count = book_count + excluded.book_count
+    ''', (last_id,))
+    conn.execute('''
+        INSERT INTO catalog_growth (month, added) VALUES (strftime('%Y-%m', 'now'), ?)
+        ON CONFLICT (month) DO UPDATE SET added = added + excluded.added
+    ''', (added,))
+
+
+def latest_change_id():
+    with connection() as conn:
+        return conn.execute("SELECT COALESCE(MAX(change_id), 0) FROM catalog_changes").fetchone()[0]
+
+
+def changed_categories(since):
+    # Categories whose books changed after change id `since`, and the id to
+    # poll from next. Not cached: it is what tells a session to look again.
+    with connection() as conn:
+        rows = conn.execute("SELECT category, change_id FROM catalog_changes WHERE change_id > ?", (since,)).fetchall()
+    return {category for category, _ in rows}, max((change_id for _, change_id in rows), default=since)
+
+
+@traced
+@cached(catalog_generation)
+def get_categories():
+    return [name for name, _ in get_category_counts()]
+
+
+@traced
+@cached(catalog_generation)
+def get_category_counts():
+    # book_count is maintained by triggers on books, so this never touches books
+    with connection() as conn:
+        return conn.execute("SELECT name, book_count FROM categories ORDER BY id").fetchall()
+
+
+@traced
+@cached(catalog_generation)
+def get_books_page(category, after=None, limit=PAGE_SIZE):
+    # Keyset pagination: `after` is the (name, id) of the last row on the
+    # previous page, so every page is one index range scan however deep it is.
+    if after is None:
+        sql = f"{BOOK_COLUMNS} WHERE b.category = ? ORDER BY b.name, b.id LIMIT ?"
+        params = (category, limit + 1)
+    else:
+        sql = f"{BOOK_COLUMNS} WHERE b.category = ? AND (b.name, b.id) > (?, ?) ORDER BY b.name, b.id LIMIT ?"
+        params = (category, after[0], after[1], limit + 1)
+    with connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][1], rows[-1][0])
+    return [Book._make(row) for row in rows], next_cursor
+
+
+@traced
+@cached(catalog_generation)
+def get_category_count(category):
+    with connection() as conn:
+        row = conn.execute("SELECT book_count FROM categories WHERE name = ?", (category,)).fetchone()
+    return row[0] if row else 0
+
+
+@traced
+@cached(catalog_generation)
+def get_total_books():
+    with connection() as conn:
+        return conn.execute("SELECT COALESCE(SUM(book_count), 0) FROM categories").fetchone()[0]
+
+
+# Writes go through the single writer thread (writer.py), which group-commits
+# concurrent requests. Each _helper runs there inside the batch transaction.
+@traced
+def add_book(name, number, author, category):
+    # Returns the existing books the new one looks like a duplicate of
+    return write(_add_book, name, number, author, category)
+
+
+def _add_book(conn, name, number, author, category):
+    cursor = conn.execute("INSERT INTO books (name, number, author, category, number_key) VALUES (?, ?, ?, ?, ?)",
+                          (name, number, author, category, number_key(number)))
+    index_books(conn, [(cursor.lastrowid, name, author)], replace=False)
+    pairs = check_book(conn, cursor.lastrowid, name, number, author)
+    conn.executemany("INSERT OR IGNORE INTO duplicate_pairs (book_id, other_id, score) VALUES (?, ?, ?)", pairs)
+    bump_generation(conn)
+    return pairs
+
+
+@traced
+def delete_book(book_id):
+    write(_delete_books, [book_id])
+
+
+@traced
+def add_category(category_name):
+    write(_add_category, category_name)
+
+
+def _add_category(conn, category_name):
+    conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (category_name,))
+    bump_generation(conn)
+
+
+@traced
+def delete_category(category_name):
+    write(_delete_category, category_name)
+
+
+def _delete_category(conn, category_name):
+    _refuse_on_loan(conn, "category = ?", (category_name,))
+    _trash(conn, "category = ?", (category_name,), category_name)
+    book_ids = [row[0] for row in conn.execute("SELECT id FROM books WHERE category = ?", (category_name,))]
+    unindex_books(conn, book_ids)
+    conn.execute("DELETE FROM books WHERE category = ?", (category_name,))
+    conn.execute("DELETE FROM categories WHERE name = ?", (category_name,))
+    bump_generation(conn)
+
+
+# Batch operations: one request and one generation bump however many rows
+# are touched, so the admin grid costs a single cache invalidation.
+@traced
+def delete_books(book_ids):
+    write(_delete_books, book_ids)
+
+
+def _delete_books(conn, book_ids):
+    _refuse_on_loan(conn, "id IN (SELECT value FROM json_each(?))", (json.dumps(book_ids),))
+    _trash(conn, "id IN (SELECT value FROM json_each(?))", (json.dumps(book_ids),))
+    unindex_books(conn, book_ids)
+    conn.executemany("DELETE FROM books WHERE id = ?", [(book_id,) for book_id in book_ids])
+    bump_generation(conn)
+
+
+@traced
+def move_books(book_ids, category):
+    write(_move_books, book_ids, category)
+
+
+def _move_books(conn, book_ids, category):
+    conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (category,))
+    conn.executemany("UPDATE books SET category = ? WHERE id = ?", [(category, book_id) for book_id in book_ids])
+    bump_generation(conn)
+
+
+@traced
+def update_books(rows):
+    # rows: (id, name, number, author) tuples
+    write(_update_books, rows)
+
+
+def _update_books(conn, rows):
+    conn.executemany("UPDATE books SET name = ?, number = ?, author = ?, number_key = ? WHERE id = ?",
+                     [(name, number, author, number_key(number), book_id) for book_id, name, number, author in rows])
+    index_books(conn, [(book_id, name, author) for book_id, name, _, author in rows])
+    bump_generation(conn)
+
+
+# Deletions keep a copy of the books in the trash for TRASH_DAYS, so a
+# deletion can be undone without restoring a whole backup. Loans of deleted
+# books are not kept, so books out on loan can't be deleted (see
+# _refuse_on_loan).
+def _refuse_on_loan(conn, where, params):
+    # Deleting a book cascades to its loans; an open one would vanish and
+    # the library would lose track of a book a member still holds
+    on_loan = conn.execute(f'''
+        SELECT COUNT(*) FROM loans
+        WHERE returned_at IS NULL AND book_id IN (SELECT id FROM books WHERE {where})
+    ''', params).fetchone()[0]
+    if on_loan:
+        if on_loan == 1:
+            raise DeleteError("1 book is on loan; return it before deleting")
+        raise DeleteError(f"{on_loan} books are on loan; return them before deleting")
+
+
+def _trash(conn, where, params, category=None):
+    conn.execute("DELETE FROM trash WHERE deleted_at < datetime('now', ?)", (f"-{TRASH_DAYS} days",))
+    trash_id = conn.execute("INSERT INTO trash (label, category) VALUES ('', ?)", (category,)).lastrowid
+    count = conn.execute(f'''
+        INSERT INTO trash_books (trash_id, id, name, number, author, category)
+        SELECT ?, id, name, number, author, category FROM books WHERE {where}
+    ''', (trash_id, *params)).rowcount
+    if category is not None:
+        label = f"category '{category}'"
+    elif count == 1:
+        label = f"'{conn.execute('SELECT name FROM trash_books WHERE trash_id = ?', (trash_id,)).fetchone()[0]}'"
+    else:
+        label = f"{count} books"
+    conn.execute("UPDATE trash SET label = ?, book_count = ? WHERE id = ?", (label, count, trash_id))
+
+
+@traced
+@cached(catalog_generation)
+def get_trash():
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT id, deleted_at, label, category, book_count FROM trash
+            WHERE deleted_at >= datetime('now', ?) ORDER BY id DESC
+        ''', (f"-{TRASH_DAYS} days",)).fetchall()
+    return [TrashEntry._make(row) for row in rows]
+
+
+@traced
+def restore_trash(trash_id):
+    # Returns how many books came back
+    return write(_restore_trash, trash_id)
+
+
+def _restore_trash(conn, trash_id):
+    row = conn.execute("SELECT category FROM trash WHERE id = ?", (trash_id,)).fetchone()
+    if row is None:
+        raise KeyError(f"no trash entry {trash_id}")
+    if row[0] is not None:
+        conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (row[0],))
+    conn.execute("INSERT OR IGNORE INTO categories (name) SELECT DISTINCT category FROM trash_books WHERE trash_id = ?",
+                 (trash_id,))
+    # Books keep their ids: AUTOINCREMENT never hands them out again, so an
+    # id is only taken if the book is already back, e.g. after a backup restore
+    restored = conn.execute('''
+        INSERT OR IGNORE INTO books (id, name, number, author, category)
+        SELECT id, name, number, author, category FROM trash_books WHERE trash_id = ?
+    ''', (trash_id,)).rowcount
+    book_ids = [row[0] for row in conn.execute("SELECT id FROM trash_books WHERE trash_id = ?", (trash_id,))]
+    set_number_keys(conn, book_ids)
+    index_books(conn, conn.execute("SELECT id, name, author FROM trash_books WHERE trash_id = ?", (trash_id,)).fetchall())
+    conn.execute("DELETE FROM trash WHERE id = ?", (trash_id,))
+    bump_generation(conn)
+    return restored
+
+
+# Duplicate detection (dedup.py). add_book checks each new book as it goes
+# in, check_duplicates does the same for books inserted in bulk, and
+# scan_duplicates rescans the whole catalog.
+@traced
+def scan_duplicates():
+    with connection() as conn:
+        books = conn.execute("SELECT id, name, number, author FROM books").fetchall()
+    pairs = find_duplicates(books)
+    write(_store_duplicates, pairs)
+    return len(pairs)
+
+
+@traced
+def check_duplicates(book_ids, progress=None):
+    # Returns the number of pairs found for the given new books.
+    # progress(checked, total) is called after each write.
+    book_ids = list(book_ids)
+    if len(book_ids) > CHECK_ALL_ABOVE:
+        # The scan reads and compares outside the write queue; only storing
+        # the pairs is a write
+        scan_duplicates()
+        if progress:
+            progress(len(book_ids), len(book_ids))
+        with connection() as conn:
+            return conn.execute('''
+                SELECT COUNT(*) FROM duplicate_pairs
+                WHERE NOT dismissed AND (book_id IN (SELECT value FROM json_each(?1))
+                                         OR other_id IN (SELECT value FROM json_each(?1)))
+            ''', (json.dumps(book_ids),)).fetchone()[0]
+    found = 0
+    for start in range(0, len(book_ids), CHECK_BATCH):
+        found += write(_check_books, book_ids[start:start + CHECK_BATCH])
+        if progress:
+            progress(min(start + CHECK_BATCH, len(book_ids)), len(book_ids))
+    return found
+
+
+def _check_books(conn, book_ids):
+    rows = conn.execute("SELECT id, name, number, author FROM books WHERE id IN (SELECT value FROM json_each(?))",
+                        (json.dumps(book_ids),)).fetchall()
+    # Two new copies of one book find each other, so the pairs are merged
+    pairs = {pair[:2]: pair for row in rows for pair in check_book(conn, *row)}
+    if pairs:
+        conn.executemany("INSERT OR IGNORE INTO duplicate_pairs (book_id, other_id, score) VALUES (?, ?, ?)",
+                         pairs.values())
+        bump_generation(conn)
+    return len(pairs)
+
+
+def _store_duplicates(conn, pairs):
+    # Dismissed pairs are kept, so they aren't suggested again
+    conn.execute("DELETE FROM duplicate_pairs WHERE NOT dismissed")
+    conn.executemany("INSERT OR IGNORE INTO duplicate_pairs (book_id, other_id, score) VALUES (?, ?, ?)", pairs)
+    bump_generation(conn)
+
+
+@traced
+@cached(catalog_generation)
+def get_duplicates(limit=DUPLICATE_LIMIT):
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT d.score, a.id, a.name, a.number, a.author, a.category,
+                   b.id, b.name, b.number, b.author, b.category
+            FROM duplicate_pairs d INDEXED BY idx_duplicate_pairs_open
+            JOIN books a ON a.id = d.book_id
+            JOIN books b ON b.id = d.other_id
+            WHERE NOT d.dismissed
+            ORDER BY d.score DESC
+            LIMIT ?
+        ''', (limit,)).fetchall()
+    return [DuplicateSuggestion._make(row) for row in rows]
+
+
+@traced
+def dismiss_duplicate(book_id, other_id):
+    write(_dismiss_duplicate, min(book_id, other_id), max(book_id, other_id))
+
+
+def _dismiss_duplicate(conn, book_id, other_id):
+    conn.execute("UPDATE duplicate_pairs SET dismissed = 1 WHERE book_id = ? AND other_id = ?", (book_id, other_id))
+    bump_generation(conn)
+
+
+@traced
+def merge_books(keep_id, drop_id):
+    # Keeps one record: it takes over the other's loan history, and its own
+    # missing number or author. The other goes to the trash.
+    write(_merge_books, keep_id, drop_id)
+
+
+def _merge_books(conn, keep_id, drop_id):
+    open_loans = conn.execute("SELECT COUNT(*) FROM loans WHERE book_id IN (?, ?) AND returned_at IS NULL",
+                              (keep_id, drop_id)).fetchone()[0]
+    if open_loans > 1:
+        raise MergeError("both books are on loan; return one first")
+    conn.execute('''
+        UPDATE books SET
+            number = COALESCE(NULLIF(number, ''), (SELECT number FROM books WHERE id = :drop)),
+            author = COALESCE(NULLIF(author, ''), (SELECT author FROM books WHERE id = :drop))
+        WHERE id = :keep
+    ''', {"keep": keep_id, "drop": drop_id})
+    set_number_keys(conn, [keep_id])
+    conn.execute("UPDATE loans SET book_id = ? WHERE book_id = ?", (keep_id, drop_id))
+    index_books(conn, conn.execute("SELECT id, name, author FROM books WHERE id = ?", (keep_id,)).fetchall())
+    _delete_books(conn, [drop_id])
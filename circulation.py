@@ -0,0 +1,158 @@
+import sqlite3
+from collections import namedtuple
+from datetime import date, timedelta
+
+from cache import cached
+from catalog import bump_generation, catalog_generation
+from db import connection
+from dedup import number_key
+from instrument import traced
+from writer import write
+
+LOAN_DAYS = 14
+MAX_RENEWALS = 2
+
+Member = namedtuple("Member", "id name card phone")
+Loan = namedtuple("Loan", "id book_id name number member card issued_at due_at renewals")
+OverdueLoan = namedtuple("OverdueLoan", "id book_id name number category member card phone due_at days_overdue")
+
+
+class CirculationError(ValueError):
+    pass
+
+
+def _today(today):
+    return today or date.today()
+
+
+@traced
+@cached(catalog_generation)
+def get_members():
+    with connection() as conn:
+        rows = conn.execute("SELECT id, name, card, phone FROM members ORDER BY name, id").fetchall()
+    return [Member._make(row) for row in rows]
+
+
+@traced
+def add_member(name, card, phone=None):
+    try:
+        return write(_add_member, name, card, phone)
+    except sqlite3.IntegrityError:
+        raise CirculationError(f"card {card!r} is already registered") from None
+
+
+def _add_member(conn, name, card, phone):
+    cursor = conn.execute("INSERT INTO members (name, card, phone) VALUES (?, ?, ?)", (name, card, phone))
+    bump_generation(conn)
+    return cursor.lastrowid
+
+
+@traced
+def issue_book(book_id, member_id, today=None, days=LOAN_DAYS):
+    today = _today(today)
+    try:
+        write(_issue_book, book_id, member_id, today.isoformat(), (today + timedelta(days=days)).isoformat())
+    except sqlite3.IntegrityError:
+        # idx_loans_open_book allows one open loan per book; the foreign keys
+        # catch unknown books and members
+        raise CirculationError("book is already on loan, or the book or member doesn't exist") from None
+
+
+def _issue_book(conn, book_id, member_id, issued_at, due_at):
+    conn.execute("INSERT INTO loans (book_id, member_id, issued_at, due_at) VALUES (?, ?, ?, ?)",
+                 (book_id, member_id, issued_at, due_at))
+    bump_generation(conn)
+
+
+@traced
+def return_book(book_id, today=None):
+    write(_return_book, book_id, _today(today).isoformat())
+
+
+def _return_book(conn, book_id, returned_at):
+    cursor = conn.execute("UPDATE loans SET returned_at = ? WHERE book_id = ? AND returned_at IS NULL",
+                          (returned_at, book_id))
+    if not cursor.rowcount:
+        raise CirculationError("book is not on loan")
+    bump_generation(conn)
+
+
+@traced
+def renew_loan(book_id, today=None, days=LOAN_DAYS):
+    # The new due date counts from today, not from the old due date, so a
+    # late renewal doesn't come back already overdue
+    write(_renew_loan, book_id, (_today(today) + timedelta(days=days)).isoformat())
+
+
+def _renew_loan(conn, book_id, due_at):
+    row = conn.execute("SELECT id, renewals FROM loans WHERE book_id = ? AND returned_at IS NULL", (book_id,)).fetchone()
+    if row is None:
+        raise CirculationError("book is not on loan")
+    if row[1] >= MAX_RENEWALS:
+        raise CirculationError(f"loan was already renewed {MAX_RENEWALS} times")
+    conn.execute("UPDATE loans SET due_at = ?, renewals = renewals + 1 WHERE id = ?", (due_at, row[0]))
+    bump_generation(conn)
+
+
+@traced
+@cached(catalog_generation)
+def get_open_loans(book_ids):
+    # Open loans for a tuple of book ids, e.g. the page being shown
+    if not book_ids:
+        return []
+    placeholders = ",".join("?" * len(book_ids))
+    with connection() as conn:
+        rows = conn.execute(f'''
+            SELECT l.id, l.book_id, b.name, b.number, m.name, m.card, l.issued_at, l.due_at, l.renewals
+            FROM loans l
+            JOIN books b ON b.id = l.book_id
+            JOIN members m ON m.id = l.member_id
+            WHERE l.book_id IN ({placeholders}) AND l.returned_at IS NULL
+            ORDER BY l.due_at
+        ''', book_ids).fetchall()
+    return [Loan._make(row) for row in rows]
+
+
+@traced
+@cached(catalog_generation)
+def find_open_loans(code):
+    # Open loans of the book with this accession number, or of the member
+    # with this card, so a return can start from the book or card in hand.
+    # Each half is an index probe: idx_books_number_key then
+    # idx_loans_open_book, or the card's unique index then idx_loans_member.
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT l.id, l.book_id, b.name, b.number, m.name, m.card, l.issued_at, l.due_at, l.renewals
+            FROM books b
+            JOIN loans l INDEXED BY idx_loans_open_book ON l.book_id = b.id AND l.returned_at IS NULL
+            JOIN members m ON m.id = l.member_id
+            WHERE b.number_key = :key
+            UNION
+            SELECT l.id, l.book_id, b.name, b.number, m.name, m.card, l.issued_at, l.due_at, l.renewals
+            FROM members m
+            JOIN loans l ON l.member_id = m.id AND l.returned_at IS NULL
+            JOIN books b ON b.id = l.book_id
+            WHERE m.card = :card
+            ORDER BY 8, 1
+        ''', {"key": number_key(code), "card": code.strip()}).fetchall()
+    return [Loan._make(row) for row in rows]
+
+
+@traced
+def get_overdue_loans(today=None):
+    # One range scan of idx_loans_open_due, which only holds open loans. The
+    # planner otherwise likes to walk every book and probe for a loan, which
+    # grows with the catalog. Not cached: the answer changes at midnight
+    # without any write.
+    today = _today(today)
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT l.id, l.book_id, b.name, b.number, b.category, m.name, m.card, m.phone, l.due_at,
+                   CAST(julianday(?) - julianday(l.due_at) AS INTEGER)
+            FROM loans l INDEXED BY idx_loans_open_due
+            JOIN books b ON b.id = l.book_id
+            JOIN members m ON m.id = l.member_id
+            WHERE l.returned_at IS NULL AND l.due_at < ?
+            ORDER BY l.due_at
+        ''', (today.isoformat(), today.isoformat())).fetchall()
+    return [OverdueLoan._make(row) for row in rows]
@@ -0,0 +1,200 @@
+import contextvars
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import instrument
+
+DB_FILE = os.environ.get("LIBRARY_DB", "library.db")
+
+POOL_SIZE = int(os.environ.get("LIBRARY_DB_POOL_SIZE", "4"))
+POOL_TIMEOUT = 10.0
+BUSY_TIMEOUT = 5.0
+
+# Applied once when a pooled connection is opened, not on every checkout.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+# The database the current session or thread works on. Unset means DB_FILE;
+# in multi-branch mode (branches.py) it is the selected branch's file.
+_current_path = contextvars.ContextVar("library_db", default=None)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    pass
+
+
+def current_path():
+    return _current_path.get() or DB_FILE
+
+
+def database_name(path=None):
+    # Backups and exports of a database are filed under this name, so no two
+    # branches may share it (see branches.parse_branches)
+    return os.path.splitext(os.path.basename(path or current_path()))[0]
+
+
+@contextmanager
+def use_database(path):
+    # Everything that defaults to "the" database inside the block, i.e.
+    # connection(), the write queue and the read cache, uses `path`
+    token = _current_path.set(path)
+    try:
+        yield
+    finally:
+        _current_path.reset(token)
+
+
+def connect(path=None):
+    conn = sqlite3.connect(path or current_path(), timeout=BUSY_TIMEOUT, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if instrument.ENABLED:
+        conn.set_trace_callback(instrument.trace_sql)
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "discarded": 0,
+        }
+
+    def _connect(self):
+        return connect(self.path)
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.stats["hits"] += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+                self.stats["misses"] += 1
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise PoolTimeout(f"no free connection to {self.path} after {self.timeout}s")
+        with self._lock:
+            self.stats["waits"] += 1
+            self.stats["wait_seconds"] += time.perf_counter() - start
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn):
+        conn.close()
+        with self._lock:
+            self._opened -= 1
+            self.stats["discarded"] += 1
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["open"] = self._opened
+        stats["idle"] = self._idle.qsize()
+        stats["size"] = self.size
+        return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=None):
+    path = path or current_path()
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = _pools[path] = ConnectionPool(path)
+    return pool
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def pool_stats(path=None):
+    return get_pool(path).snapshot()
+
+
+@contextmanager
+def connection(path=None):
+    pool = get_pool(path)
+    conn = pool.acquire()
+    try:
+        yield conn
+    except BaseException:
+        if _is_usable(conn):
+            pool.release(conn)
+        else:
+            pool._discard(conn)
+        raise
+    else:
+        pool.release(conn)
+
+
+def _is_usable(conn):
+    try:
+        conn.execute("SELECT 1")
+        return True
+    except sqlite3.Error:
+        return False
@@ -0,0 +1,172 @@
+import json
+import math
+import re
+from collections import Counter, defaultdict, namedtuple
+from functools import lru_cache
+
+from fuzzy import candidate_keys, normalize, similarity, trigrams
+
+# Pairs scoring at least this are suggested for merging
+DUPLICATE_SCORE = 0.75
+# Pairs that don't share an accession number need at least this much
+# title trigram overlap (Jaccard) to reach DUPLICATE_SCORE, so title
+# blocking only has to find those
+TITLE_OVERLAP = 0.8
+# A key shared by more books than this isn't evidence of anything: numbers
+# like "NCERT" are publishers, not accession numbers. Such number blocks
+# are dropped; title blocks are split by author token instead.
+MAX_BLOCK = 100
+# Weights of title, author and number similarity
+WEIGHTS = (0.5, 0.2, 0.3)
+# Titles looked at when checking one new book
+CHECK_CANDIDATES = 500
+CHECK_SCORED = 50
+
+Record = namedtuple("Record", "id grams authors number")
+DuplicatePair = namedtuple("DuplicatePair", "book_id other_id score")
+
+_NUMBER_JUNK = re.compile(r"[^0-9a-z]+")
+_LEADING_ZEROS = re.compile(r"(?<![0-9])0+(?=[0-9])")
+
+
+def number_key(number):
+    # "Acc. 00123", "acc-123" and "ACC123" are the same accession number
+    key = _NUMBER_JUNK.sub("", (number or "").lower())
+    return _LEADING_ZEROS.sub("", key) or None
+
+
+def set_number_keys(conn, book_ids):
+    # For writes that copy numbers in SQL; the others set books.number_key
+    # as they insert or update
+    conn.executemany("UPDATE books SET number_key = ? WHERE id = ?", [
+        (number_key(number), book_id) for book_id, number in conn.execute(
+            "SELECT id, number FROM books WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(list(book_ids)),))
+    ])
+
+
+def make_record(book_id, name, number, author, normalize=normalize):
+    return Record(book_id, frozenset(trigrams(normalize(name))), frozenset(normalize(author).split()),
+                  number_key(number))
+
+
+def _jaccard(a, b):
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared) if a or b else 0.0
+
+
+def _numberless(record, common_numbers):
+    return record.number is None or record.number in common_numbers
+
+
+def score_pair(a, b, common_numbers=frozenset()):
+    # Missing authors and numbers, or numbers too common to tell books
+    # apart, count as half a match. Different accession numbers count
+    # against: copies bought together have the same title and author and
+    # often consecutive numbers, and they aren't duplicates.
+    title = _jaccard(a.grams, b.grams)
+    author = _jaccard(a.authors, b.authors) if a.authors and b.authors else 0.5
+    if _numberless(a, common_numbers) or _numberless(b, common_numbers):
+        number = 0.5
+    else:
+        number = 1.0 if a.number == b.number else 0.0
+    return WEIGHTS[0] * title + WEIGHTS[1] * author + WEIGHTS[2] * number
+
+
+def _title_blocks(records):
+    # Prefix filtering: with each record's grams ordered rarest first, two
+    # sets overlapping by TITLE_OVERLAP must share one of the first
+    # len - ceil(TITLE_OVERLAP * len) + 1 grams. Only those are indexed, and
+    # since they are the rare ones the blocks stay small.
+    # The whole gram set is a key too, so identical titles meet even when
+    # their rare grams are common in this catalog.
+    frequency = Counter(gram for record in records for gram in record.grams)
+    blocks = defaultdict(list)
+    for i, record in enumerate(records):
+        blocks[record.grams].append(i)
+        grams = sorted(record.grams, key=lambda gram: (frequency[gram], gram))
+        for gram in grams[:len(grams) - math.ceil(TITLE_OVERLAP * len(grams)) + 1]:
+            blocks[gram].append(i)
+    for members in blocks.values():
+        if len(members) <= MAX_BLOCK:
+            yield members
+            continue
+        by_author = defaultdict(list)
+        for i in members:
+            for token in records[i].authors:
+                by_author[token].append(i)
+        yield from (split for split in by_author.values() if len(split) <= MAX_BLOCK)
+
+
+def find_duplicates(books, min_score=DUPLICATE_SCORE):
+    # books: (id, name, number, author) rows. Compares only pairs that share
+    # a blocking key, never all n² of them; best pairs first.
+    # Authors and many titles repeat, and normalizing is most of the cost
+    cached_normalize = lru_cache(maxsize=None)(normalize)
+    records = [make_record(*book, normalize=cached_normalize) for book in books]
+    numbers = defaultdict(list)
+    for i, record in enumerate(records):
+        if record.number is not None:
+            numbers[record.number].append(i)
+    common = frozenset(number for number, members in numbers.items() if len(members) > MAX_BLOCK)
+
+    pairs = set()
+    for members in numbers.values():
+        if 1 < len(members) <= MAX_BLOCK:
+            pairs.update((i, j) for i in members for j in members if i < j)
+    # Books with different accession numbers can't reach DUPLICATE_SCORE,
+    # so a title block only pairs its numberless books with the rest
+    # Jaccard can't exceed the ratio of the set sizes, which rules most
+    # pairs out before any set operation
+    sizes = [len(record.grams) for record in records]
+    for members in _title_blocks(records):
+        loose = [i for i in members if _numberless(records[i], common)]
+        pairs.update((min(i, j), max(i, j)) for i in loose for j in members
+                     if i != j and min(sizes[i], sizes[j]) >= TITLE_OVERLAP * max(sizes[i], sizes[j]))
+
+    found = []
+    for i, j in pairs:
+        score = score_pair(records[i], records[j], common)
+        if score >= min_score:
+            a, b = sorted((records[i].id, records[j].id))
+            found.append(DuplicatePair(a, b, round(score, 3)))
+    found.sort(key=lambda pair: pair.score, reverse=True)
+    return found
+
+
+def check_book(conn, book_id, name, number, author, min_score=DUPLICATE_SCORE):
+    # The same scoring for one new book, against the books with its number
+    # and at most CHECK_SCORED of CHECK_CANDIDATES fuzzy-index candidates.
+    # The caps keep the cost nearly flat as the catalog grows: about 10 ms
+    # per book at both 5k and 100k synthetic books, mostly spent scoring
+    # candidates. Run inside the insert's transaction.
+    record = make_record(book_id, name, number, author)
+    common = frozenset()
+    candidates = set()
+    if record.number:
+        # By normalized number, like the full scan; a key more than
+        # MAX_BLOCK books share is ignored there too
+        others = [other_id for other_id, in conn.execute(
+            "SELECT id FROM books WHERE number_key = ? AND id != ? LIMIT ?", (record.number, book_id, MAX_BLOCK))]
+        if len(others) >= MAX_BLOCK:
+            common = frozenset([record.number])
+        else:
+            candidates.update(others)
+    if record.grams:
+        key_grams = trigrams(normalize(f"{name} {author or ''}"))
+        scored = sorted(((similarity(key_grams, key), other_id)
+                         for other_id, key in candidate_keys(conn, key_grams, CHECK_CANDIDATES)
+                         if other_id != book_id), reverse=True)
+        candidates.update(other_id for _, other_id in scored[:CHECK_SCORED])
+    if not candidates:
+        return []
+    rows = conn.execute(
+        f"SELECT id, name, number, author FROM books WHERE id IN ({','.join('?' * len(candidates))})",
+        list(candidates),
+    ).fetchall()
+    found = []
+    for row in rows:
+        score = score_pair(record, make_record(*row), common)
+        if score >= min_score:
+            a, b = sorted((book_id, row[0]))
+            found.append(DuplicatePair(a, b, round(score, 3)))
+    return found
@@ -0,0 +1,150 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import tempfile
+
+import db
+from branches import branch_path
+
+FETCH_SIZE = 2000
+COLUMNS = ("id", "name", "number", "author", "category")
+FORMATS = ("csv", "jsonl", "parquet")
+FORMAT_LABELS = {"csv": "CSV", "jsonl": "JSON Lines", "parquet": "Parquet"}
+MIME_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Exports up to this size stay in memory, larger ones spill to a temp file
+SPOOL_SIZE = 8 * 1024 * 1024
+
+
+def iter_books(category=None, fetch_size=FETCH_SIZE):
+    # Yields lists of row tuples; only one batch is held at a time.
+    sql = f"SELECT {', '.join(COLUMNS)} FROM books"
+    params = ()
+    if category is not None:
+        sql += " WHERE category = ?"
+        params = (category,)
+    sql += " ORDER BY id"
+    with db.connection() as conn:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield rows
+
+
+def write_csv(out, batches):
+    writer = csv.writer(out)
+    writer.writerow(COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+
+
+def write_jsonl(out, batches):
+    for rows in batches:
+        out.writelines(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows)
+
+
+def write_parquet(out, batches, compression="snappy"):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("name", pa.string()),
+        ("number", pa.string()),
+        ("author", pa.string()),
+        ("category", pa.string()),
+    ])
+    # One row group per fetched batch keeps memory bounded by FETCH_SIZE
+    with pq.ParquetWriter(out, schema, compression=compression) as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_batch(pa.record_batch([list(col) for col in columns], schema=schema))
+
+
+def _counted(batches, progress):
+    written = 0
+    for rows in batches:
+        yield rows
+        written += len(rows)
+        progress(written)
+
+
+def export_books(out, fmt="csv", category=None, compress=False, progress=None):
+    # `out` is a binary file object. Text formats are gzipped when compress
+    # is set; Parquet switches from snappy to zstd column compression.
+    # progress(rows_written) is called after each fetched batch.
+    batches = iter_books(category)
+    if progress:
+        batches = _counted(batches, progress)
+    if fmt == "parquet":
+        write_parquet(out, batches, "zstd" if compress else "snappy")
+        return
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}")
+    raw = gzip.GzipFile(fileobj=out, mode="wb") if compress else out
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    try:
+        if fmt == "csv":
+            write_csv(text, batches)
+        else:
+            write_jsonl(text, batches)
+    finally:
+        text.flush()
+        text.detach()
+        if compress:
+            raw.close()
+
+
+def export_filename(fmt, category=None, compress=False):
+    name = f"catalog-{category}" if category is not None else "catalog"
+    name += f".{fmt}"
+    if compress and fmt != "parquet":
+        name += ".gz"
+    return name
+
+
+def export_mime(fmt, compress=False):
+    if compress and fmt != "parquet":
+        return "application/gzip"
+    return MIME_TYPES[fmt]
+
+
+def export_bytes(fmt="csv", category=None, compress=False):
+    # st.download_button needs the finished payload; building it in a spooled
+    # file keeps only the encoded output in memory, never the row objects.
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as out:
+        export_books(out, fmt, category, compress)
+        out.seek(0)
+        return out.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the catalog as CSV, JSON Lines or Parquet.")
+    parser.add_argument("output")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--category", help="export only this category")
+    parser.add_argument("--compress", action="store_true", help="gzip text formats, zstd for Parquet")
+    parser.add_argument("--db", default=db.DB_FILE)
+    parser.add_argument("--branch", help="use this branch's database (see LIBRARY_BRANCHES) instead of --db")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        suffixes = args.output.lower().removesuffix(".gz").rsplit(".", 1)
+        fmt = suffixes[-1] if suffixes[-1] in FORMATS else "csv"
+    db.DB_FILE = branch_path(args.branch) if args.branch else args.db
+    with open(args.output, "wb") as out:
+        export_books(out, fmt, args.category, args.compress or args.output.endswith(".gz"))
+
+
+if __name__ == "__main__":
+    main()
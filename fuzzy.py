@@ -0,0 +1,248 @@
+import re
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+from db import connection
+from instrument import traced
+
+FUZZY_LIMIT = 20
+MIN_SCORE = 0.45
+# How many of the query's rarest trigrams are used to collect candidates,
+# and the cap on candidates scored per query
+SEED_GRAMS = 6
+MAX_CANDIDATES = 5000
+REBUILD_BATCH = 20000
+# Distinct words whose normalized form and trigrams are kept
+WORD_CACHE = 100000
+
+FuzzyHit = namedtuple("FuzzyHit", "id name author number category score")
+
+# Devanagari -> Latin, close to how people type Hindi titles in English
+_CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "व": "v",
+    "श": "sh", "ष": "sh", "स": "s", "ह": "h",
+    "क़": "q", "ख़": "kh", "ग़": "g", "ज़": "z", "ड़": "r", "ढ़": "rh", "फ़": "f", "य़": "y",
+}
+_VOWELS = {
+    "अ": "a", "आ": "aa", "इ": "i", "ई": "ii", "उ": "u", "ऊ": "uu", "ऋ": "ri",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au", "ऍ": "e", "ऑ": "o",
+}
+_MATRAS = {
+    "ा": "aa", "ि": "i", "ी": "ii", "ु": "u", "ू": "uu", "ृ": "ri",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au", "ॅ": "e", "ॉ": "o",
+}
+_SIGNS = {"ं": "n", "ँ": "n", "ः": "h", "ॐ": "om", "।": " ", "॥": " "}
+_VIRAMA = "्"
+_NUKTA = "़"
+_DIGITS = {chr(0x0966 + i): str(i) for i in range(10)}
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_ASPIRATED = re.compile(r"([bcdgjkpt])h")
+_DOUBLED = re.compile(r"(.)\1+")
+_FOLDS = (("ee", "i"), ("oo", "u"), ("w", "v"), ("z", "j"), ("q", "k"), ("x", "ks"), ("y", "i"))
+
+
+def transliterate(text):
+    if text.isascii():
+        return text
+    out = []
+    pending_a = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if i + 1 < len(text) and text[i + 1] == _NUKTA:
+            ch += _NUKTA
+            i += 1
+        if ch == _NUKTA:
+            i += 1
+            continue
+        if ch in _CONSONANTS or ch[0] in _CONSONANTS:
+            if pending_a:
+                out.append("a")
+            # ज्ञ is pronounced (and usually typed) "gy"
+            if text.startswith("ज्ञ", i):
+                out.append("gy")
+                i += 2
+            else:
+                out.append(_CONSONANTS.get(ch) or _CONSONANTS[ch[0]])
+            pending_a = True
+        elif ch in _MATRAS:
+            out.append(_MATRAS[ch])
+            pending_a = False
+        elif ch == _VIRAMA:
+            pending_a = False
+        else:
+            if pending_a:
+                # Schwa deletion: the inherent vowel isn't pronounced at the
+                # end of a word (शिक्षण -> shikshan)
+                if ch.isalnum() or ch in _SIGNS:
+                    out.append("a")
+            pending_a = False
+            if ch in _VOWELS:
+                out.append(_VOWELS[ch])
+            elif ch in _SIGNS:
+                out.append(_SIGNS[ch])
+            else:
+                out.append(_DIGITS.get(ch, ch))
+        i += 1
+    return "".join(out)
+
+
+def normalize(text):
+    # Fold spelling variants so "shikshan", "Shiksan" and "शिक्षण" meet on the
+    # same key: transliterate, drop aspiration and doubled letters, and
+    # merge the vowels romanizations disagree on. None of that reaches
+    # across a space, so it is done once per distinct word.
+    return " ".join(filter(None, map(_normalize_word, (text or "").split())))
+
+
+@lru_cache(maxsize=WORD_CACHE)
+def _normalize_word(text):
+    text = transliterate(text).lower()
+    text = _NON_WORD.sub(" ", text)
+    text = _ASPIRATED.sub(r"\1", text)
+    text = text.replace("sh", "s").replace("ph", "p")
+    for old, new in _FOLDS:
+        text = text.replace(old, new)
+    text = _DOUBLED.sub(r"\1", text)
+    return " ".join(text.split())
+
+
+def trigrams(key):
+    return set().union(*map(_word_trigrams, key.split()))
+
+
+@lru_cache(maxsize=WORD_CACHE)
+def _word_trigrams(word):
+    padded = f" {word} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def book_key(name, author):
+    return normalize(f"{name} {author or ''}")
+
+
+def index_books(conn, books, replace=True):
+    # books: (id, name, author) rows. replace=False skips deleting existing
+    # entries, for rows that were just inserted. Keys are space-padded so the
+    # trigram tokenizer emits the same word-boundary grams as trigrams().
+    books = list(books)
+    if replace:
+        unindex_books(conn, [book[0] for book in books])
+    keys = [(book_id, book_key(name, author)) for book_id, name, author in books]
+    conn.executemany("INSERT INTO book_fuzzy (rowid, key) VALUES (?, ?)", [(book_id, f" {key} ") for book_id, key in keys])
+    _count_grams(conn, [key for _, key in keys], 1)
+
+
+def unindex_books(conn, book_ids):
+    keys = []
+    for book_id in book_ids:
+        row = conn.execute("SELECT key FROM book_fuzzy WHERE rowid = ?", (book_id,)).fetchone()
+        if row:
+            keys.append(row[0])
+    conn.executemany("DELETE FROM book_fuzzy WHERE rowid = ?", [(book_id,) for book_id in book_ids])
+    _count_grams(conn, keys, -1)
+
+
+def _count_grams(conn, keys, sign):
+    # fuzzy_grams holds the number of keys each trigram is in, so finding a
+    # query's rarest grams is a few primary-key probes. fts5vocab counts
+    # them by walking the whole posting list of every gram asked about.
+    counts = Counter()
+    for key in keys:
+        counts.update(trigrams(key))
+    conn.executemany('''
+        INSERT INTO fuzzy_grams (gram, doc_count) VALUES (?, ?)
+        ON CONFLICT (gram) DO UPDATE SET doc_count = doc_count + excluded.doc_count
+    ''', [(gram, sign * count) for gram, count in counts.items()])
+    if sign < 0:
+        conn.executemany("DELETE FROM fuzzy_grams WHERE gram = ? AND doc_count <= 0", [(gram,) for gram in counts])
+
+
+def rebuild_index(conn):
+    conn.execute("DELETE FROM book_fuzzy")
+    conn.execute("DELETE FROM fuzzy_grams")
+    cursor = conn.execute("SELECT id, name, author FROM books")
+    while True:
+        rows = cursor.fetchmany(REBUILD_BATCH)
+        if not rows:
+            break
+        index_books(conn, rows, replace=False)
+
+
+def reindex_after(conn, after, limit=REBUILD_BATCH):
+    # One keyset step of an online rebuild: replaces the entries of the next
+    # `limit` books after id `after`, and drops entries for deleted books in
+    # that range. Returns the last id done, or None past the last book. Other
+    # books keep their entries, so searches work while the steps run.
+    rows = conn.execute("SELECT id, name, author FROM books WHERE id > ? ORDER BY id LIMIT ?",
+                        (after, limit)).fetchall()
+    where, params = ("rowid > ? AND rowid <= ?", (after, rows[-1][0])) if rows else ("rowid > ?", (after,))
+    keys = [key for key, in conn.execute(f"SELECT key FROM book_fuzzy WHERE {where}", params)]
+    conn.execute(f"DELETE FROM book_fuzzy WHERE {where}", params)
+    _count_grams(conn, keys, -1)
+    index_books(conn, rows, replace=False)
+    return rows[-1][0] if rows else None
+
+
+def merge_index(conn, pages=500):
+    # One bounded step of FTS5's incremental merge; False once there is
+    # nothing left to merge
+    before = conn.total_changes
+    conn.execute("INSERT INTO book_fuzzy (book_fuzzy, rank) VALUES ('merge', ?)", (pages,))
+    return conn.total_changes - before >= 2
+
+
+def similarity(query_grams, key):
+    grams = trigrams(key)
+    shared = len(query_grams & grams)
+    if not shared:
+        return 0.0
+    # Mostly "how much of the query is in this title", with a little dice so
+    # shorter, tighter titles win ties
+    coverage = shared / len(query_grams)
+    dice = 2 * shared / (len(query_grams) + len(grams))
+    return 0.75 * coverage + 0.25 * dice
+
+
+def candidate_keys(conn, query_grams, limit=MAX_CANDIDATES):
+    # (rowid, key) of indexed books sharing one of the query's rarest
+    # trigrams. Common ones like " th" would pull in half the catalog
+    # without improving recall much.
+    grams = sorted(query_grams)
+    placeholders = ",".join("?" * len(grams))
+    seeds = conn.execute(
+        f"SELECT gram FROM fuzzy_grams WHERE gram IN ({placeholders}) ORDER BY doc_count LIMIT ?",
+        (*grams, SEED_GRAMS),
+    ).fetchall()
+    if not seeds:
+        return []
+    match = " OR ".join(f'"{seed[0]}"' for seed in seeds)
+    return conn.execute("SELECT rowid, key FROM book_fuzzy WHERE book_fuzzy MATCH ? LIMIT ?", (match, limit)).fetchall()
+
+
+@traced
+def fuzzy_search(text, limit=FUZZY_LIMIT, min_score=MIN_SCORE):
+    query_grams = trigrams(normalize(text))
+    if not query_grams:
+        return []
+    with connection() as conn:
+        candidates = candidate_keys(conn, query_grams)
+        scored = sorted(
+            ((similarity(query_grams, key), book_id) for book_id, key in candidates),
+            reverse=True,
+        )
+        best = [(score, book_id) for score, book_id in scored[:limit] if score >= min_score]
+        if not best:
+            return []
+        rows = conn.execute(
+            f"SELECT id, name, author, number, category FROM books WHERE id IN ({','.join('?' * len(best))})",
+            [book_id for _, book_id in best],
+        ).fetchall()
+    by_id = {row[0]: row for row in rows}
+    return [FuzzyHit(*by_id[book_id], round(score, 3)) for score, book_id in best if book_id in by_id]
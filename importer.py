@@ -0,0 +1,231 @@
+import argparse
+import csv
+import io
+import os
+import time
+from collections import namedtuple
+
+import db
+from branches import branch_path
+from catalog import bump_generation, check_duplicates, deferred_book_triggers, init_db
+from dedup import number_key
+from fuzzy import index_books
+from migrations import analyze
+from search import deferred_fts_index
+from writer import write
+
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+
+# Header spellings seen in accession registers, mapped to books columns
+COLUMN_ALIASES = {
+    "name": "name",
+    "title": "name",
+    "book name": "name",
+    "book title": "name",
+    "number": "number",
+    "book number": "number",
+    "accession": "number",
+    "accession number": "number",
+    "accession no": "number",
+    "acc no": "number",
+    "author": "author",
+    "author/publication": "author",
+    "publication": "author",
+    "publisher": "author",
+    "category": "category",
+}
+
+# duplicates counts rows skipped for an existing number; book_ids are the
+# inserted books, for the duplicate check that runs after the import
+ImportResult = namedtuple("ImportResult", "read inserted duplicates invalid errors seconds book_ids")
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def _normalize_header(header):
+    columns = []
+    for cell in header:
+        key = str(cell or "").strip().lower().rstrip(".")
+        columns.append(COLUMN_ALIASES.get(key))
+    if "name" not in columns or "number" not in columns:
+        raise ImportFileError("file needs at least a name/title and a number/accession column")
+    return columns
+
+
+def _records(header, rows):
+    columns = _normalize_header(header)
+    for row in rows:
+        yield {col: value for col, value in zip(columns, row) if col}
+
+
+def read_csv(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="", encoding="utf-8-sig") as f:
+            yield from read_csv(f)
+        return
+    if not isinstance(source, io.TextIOBase):
+        source = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    reader = csv.reader(source)
+    header = next(reader, None)
+    if header is None:
+        return
+    yield from _records(header, reader)
+
+
+def read_xlsx(source):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError("reading .xlsx files needs openpyxl (pip install openpyxl)") from None
+    # read_only streams rows from the sheet XML instead of loading it whole
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield from _records(header, rows)
+    finally:
+        workbook.close()
+
+
+def read_rows(source, filename=None):
+    filename = filename or (source if isinstance(source, (str, os.PathLike)) else "")
+    if str(filename).lower().endswith((".xlsx", ".xlsm")):
+        return read_xlsx(source)
+    return read_csv(source)
+
+
+def _clean(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def validate(record, default_category=None):
+    name = _clean(record.get("name"))
+    number = _clean(record.get("number"))
+    author = _clean(record.get("author")) or None
+    category = _clean(record.get("category")) or default_category
+    if not name:
+        return None, "missing book name"
+    if not number:
+        return None, "missing book number"
+    if not category:
+        return None, "missing category"
+    return (name, number, author, category), None
+
+
+def _existing_numbers(conn):
+    # Walks idx_books_number only
+    return {row[0] for row in conn.execute("SELECT number FROM books WHERE number IS NOT NULL")}
+
+
+def insert_batch(conn, batch):
+    # Inserts (name, number, author, category) rows, indexes them and returns
+    # their ids; also used by barcode intake. Runs on the writer thread, so
+    # admins adding books by hand during an import queue behind a batch
+    # instead of hitting "database is locked"
+    conn.executemany("INSERT OR IGNORE INTO categories (name) VALUES (?)", {(row[3],) for row in batch})
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM books").fetchone()[0]
+    with deferred_fts_index(conn), deferred_book_triggers(conn):
+        conn.executemany("INSERT INTO books (name, number, author, category, number_key) VALUES (?, ?, ?, ?, ?)",
+                         [(*row, number_key(row[1])) for row in batch])
+    new_books = conn.execute("SELECT id, name, author FROM books WHERE id > ?", (last_id,)).fetchall()
+    index_books(conn, new_books, replace=False)
+    bump_generation(conn)
+    return [book[0] for book in new_books]
+
+
+def import_books(records, default_category=None, batch_size=BATCH_SIZE, skip_duplicates=True, progress=None):
+    start = time.perf_counter()
+    read = inserted = duplicates = invalid = 0
+    errors = []
+    with db.connection() as conn:
+        seen = _existing_numbers(conn) if skip_duplicates else set()
+
+    batch = []
+    new_ids = []
+    # Data rows start on line 2, after the header
+    for line, record in enumerate(records, start=2):
+        read += 1
+        row, error = validate(record, default_category)
+        if error:
+            invalid += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append((line, error))
+            continue
+        if skip_duplicates:
+            if row[1] in seen:
+                duplicates += 1
+                continue
+            seen.add(row[1])
+        batch.append(row)
+        if len(batch) >= batch_size:
+            new_ids += write(insert_batch, batch)
+            inserted += len(batch)
+            batch = []
+            if progress:
+                progress(read, inserted)
+
+    if batch:
+        new_ids += write(insert_batch, batch)
+        inserted += len(batch)
+    if inserted:
+        with db.connection() as conn:
+            analyze(conn)
+    if progress:
+        progress(read, inserted)
+    # The duplicate check is left to the caller (check_duplicates), so its
+    # cost isn't counted in the import's time
+    return ImportResult(read, inserted, duplicates, invalid, errors, time.perf_counter() - start, new_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import books from a CSV or XLSX accession register.")
+    parser.add_argument("file")
+    parser.add_argument("--category", help="category for rows that don't have one")
+    parser.add_argument("--db", default=db.DB_FILE)
+    parser.add_argument("--branch", help="use this branch's database (see LIBRARY_BRANCHES) instead of --db")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--allow-duplicates", action="store_true",
+                        help="insert rows whose number is already in the catalog")
+    parser.add_argument("--no-duplicate-check", action="store_true",
+                        help="don't check the inserted books for likely duplicates afterwards")
+    args = parser.parse_args()
+
+    db.DB_FILE = branch_path(args.branch) if args.branch else args.db
+    init_db()
+
+    def report(read, inserted):
+        print(f"\r{read} rows read, {inserted} inserted", end="", flush=True)
+
+    result = import_books(read_rows(args.file), args.category, args.batch_size,
+                          not args.allow_duplicates, report)
+    print()
+    for line, error in result.errors:
+        print(f"line {line}: {error}")
+    rate = result.read / result.seconds if result.seconds else 0
+    print(f"{result.inserted} inserted, {result.duplicates} duplicate numbers skipped, "
+          f"{result.invalid} invalid rows in {result.seconds:.2f}s ({rate:,.0f} rows/s)")
+    if args.no_duplicate_check or not result.book_ids:
+        return
+
+    def report_check(checked, total):
+        print(f"\r{checked} of {total} books checked for duplicates", end="", flush=True)
+
+    start = time.perf_counter()
+    suspected = check_duplicates(result.book_ids, report_check)
+    print()
+    print(f"{suspected} likely duplicate pairs found in {time.perf_counter() - start:.2f}s")
+    if suspected:
+        print("Review them in the app's Duplicates panel")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Opt-in: with LIBRARY_PROFILE unset, traced() returns helpers unwrapped and
+# connections get no trace callback, so there is no overhead at all.
+ENABLED = os.environ.get("LIBRARY_PROFILE", "") not in ("", "0")
+# Also emit one JSON log line per rerun on the "library.profile" logger
+LOG_JSON = os.environ.get("LIBRARY_PROFILE_LOG", "") not in ("", "0")
+
+MAX_STATEMENTS = 200
+
+logger = logging.getLogger("library.profile")
+
+
+class RerunProfile:
+    def __init__(self, label):
+        self.label = label
+        self.started = self.last_mark = time.perf_counter()
+        self.seconds = None
+        self.phases = []
+        self.calls = []
+        self.statements = []
+        self.dropped_statements = 0
+
+    def as_dict(self):
+        return {
+            "label": self.label,
+            "seconds": self.seconds,
+            "phases": [{"phase": name, "ms": seconds * 1e3} for name, seconds in self.phases],
+            "calls": [
+                {"helper": name, "ms": seconds * 1e3, "rows": rows, "statements": statements}
+                for name, seconds, rows, statements in self.calls
+            ],
+            "statements": self.statements,
+            "dropped_statements": self.dropped_statements,
+        }
+
+
+# A context variable rather than a thread-local, so the write queue can run
+# a helper in its submitter's context and the helper's SQL is counted there
+_profile = contextvars.ContextVar("library_profile", default=None)
+_lock = threading.Lock()
+# name -> [calls, seconds, rows]
+_helper_totals = {}
+_phase_totals = {}
+_rerun_totals = {"reruns": 0, "seconds": 0.0}
+
+
+def current():
+    return _profile.get()
+
+
+@contextmanager
+def profile_rerun(label):
+    if not ENABLED:
+        yield None
+        return
+    profile = RerunProfile(label)
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+        profile.seconds = time.perf_counter() - profile.started
+        with _lock:
+            _rerun_totals["reruns"] += 1
+            _rerun_totals["seconds"] += profile.seconds
+        if LOG_JSON:
+            logger.info(json.dumps(profile.as_dict(), ensure_ascii=False))
+
+
+def mark(name):
+    # Closes the render phase that started at the previous mark (or at the
+    # start of the rerun). The script runs top to bottom, so calling mark()
+    # after each section times it without re-indenting the page code.
+    profile = current()
+    if profile is None:
+        return
+    now = time.perf_counter()
+    seconds = now - profile.last_mark
+    profile.last_mark = now
+    profile.phases.append((name, seconds))
+    with _lock:
+        _phase_totals[name] = _phase_totals.get(name, 0.0) + seconds
+
+
+def _row_count(result):
+    # Page helpers return (rows, cursor); counts and writes return scalars
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    if result is None:
+        return None
+    try:
+        return len(result)
+    except TypeError:
+        return 1
+
+
+def traced(func):
+    if not ENABLED:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = current()
+        if profile is None:
+            return func(*args, **kwargs)
+        statements_before = len(profile.statements) + profile.dropped_statements
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        rows = _row_count(result)
+        statements = len(profile.statements) + profile.dropped_statements - statements_before
+        profile.calls.append((func.__name__, seconds, rows, statements))
+        with _lock:
+            totals = _helper_totals.setdefault(func.__name__, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += rows or 0
+        return result
+    return wrapper
+
+
+def trace_sql(statement):
+    # sqlite3 trace callback; runs on the thread executing the statement, in
+    # the context of the rerun that asked for it (see WriteQueue.submit)
+    profile = current()
+    if profile is None:
+        return
+    if len(profile.statements) < MAX_STATEMENTS:
+        profile.statements.append(" ".join(statement.split()))
+    else:
+        profile.dropped_statements += 1
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(extra_gauges=None):
+    # Process-wide totals in Prometheus text exposition format.
+    # extra_gauges maps a metric name to (help text, {kind: value}), for
+    # snapshots such as pool_stats() and cache_stats().
+    lines = []
+    with _lock:
+        helpers = {name: list(totals) for name, totals in _helper_totals.items()}
+        phases = dict(_phase_totals)
+        reruns = dict(_rerun_totals)
+
+    def metric(name, kind, help_text, samples, label=None):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in samples:
+            labels = f'{{{label}="{_escape_label(key)}"}}' if label else ""
+            lines.append(f"{name}{labels} {value}")
+
+    metric("library_reruns_total", "counter", "Profiled script reruns.", [(None, reruns["reruns"])])
+    metric("library_rerun_seconds_total", "counter", "Wall time spent in profiled reruns.",
+           [(None, reruns["seconds"])])
+    metric("library_helper_calls_total", "counter", "Calls to catalog data helpers.",
+           [(name, totals[0]) for name, totals in sorted(helpers.items())], "helper")
+    metric("library_helper_seconds_total", "counter", "Wall time spent in catalog data helpers.",
+           [(name, totals[1]) for name, totals in sorted(helpers.items())], "helper")
+    metric("library_helper_rows_total", "counter", "Rows returned by catalog data helpers.",
+           [(name, totals[2]) for name, totals in sorted(helpers.items())], "helper")
+    metric("library_phase_seconds_total", "counter", "Wall time spent in each render phase.",
+           sorted(phases.items()), "phase")
+    for name, (help_text, samples) in (extra_gauges or {}).items():
+        numeric = [(key, value) for key, value in sorted(samples.items()) if isinstance(value, (int, float))]
+        metric(name, "gauge", help_text, numeric, "kind")
+    return "\n".join(lines) + "\n"
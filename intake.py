@@ -0,0 +1,319 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import re
+import time
+from collections import namedtuple
+
+import db
+from branches import branch_path
+from cache import cached
+from catalog import bump_generation, catalog_generation, init_db
+from db import connection
+from importer import insert_batch
+from instrument import traced
+from jobs import submit_job
+from writer import write
+
+# Scanned books are saved this many at a time: one write-queue request and
+# one transaction per batch instead of one per book
+INTAKE_BATCH = 25
+SEED_BATCH = 5000
+
+# Header spellings seen in metadata dumps, mapped to isbn_metadata columns
+METADATA_ALIASES = {
+    "isbn": "isbn",
+    "isbn13": "isbn",
+    "isbn_13": "isbn",
+    "isbn 13": "isbn",
+    "isbn10": "isbn",
+    "isbn_10": "isbn",
+    "ean": "isbn",
+    "title": "title",
+    "name": "title",
+    "book name": "title",
+    "author": "author",
+    "authors": "author",
+    "author/publication": "author",
+    "publisher": "author",
+}
+
+Metadata = namedtuple("Metadata", "isbn title author source")
+# found is the cached Metadata the title and author were filled from, if any
+IntakeItem = namedtuple("IntakeItem", "isbn name number author category found")
+SeedResult = namedtuple("SeedResult", "read seeded seconds")
+
+_ISBN_JUNK = re.compile(r"[\s-]+")
+_TRAILING_DIGITS = re.compile(r"^(.*?)(\d+)$")
+
+
+class IntakeError(ValueError):
+    pass
+
+
+def _ean_check(digits):
+    return str(-sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10)
+
+
+def isbn13(code):
+    # The ISBN-13 of a scanned or typed ISBN, or None if code isn't one.
+    # Book barcodes are EAN-13 (978/979); ISBN-10s come from typing the
+    # copyright page and are converted so both spellings share one key.
+    code = _ISBN_JUNK.sub("", code or "").upper()
+    if len(code) == 13 and code.isdigit() and code.startswith(("978", "979")):
+        return code if _ean_check(code[:12]) == code[12] else None
+    if len(code) == 10 and code[:9].isdigit() and (code[9].isdigit() or code[9] == "X"):
+        total = sum((10 - i) * (10 if d == "X" else int(d)) for i, d in enumerate(code))
+        if total % 11:
+            return None
+        return "978" + code[:9] + _ean_check("978" + code[:9])
+    return None
+
+
+@traced
+@cached(catalog_generation)
+def lookup_isbn(isbn):
+    # One primary-key probe; repeat copies of a title hit the read cache
+    with connection() as conn:
+        row = conn.execute("SELECT isbn, title, author, source FROM isbn_metadata WHERE isbn = ?",
+                           (isbn,)).fetchone()
+    return Metadata._make(row) if row else None
+
+
+def number_in_catalog(number):
+    # Not cached: it has to see books saved by other sessions a moment ago
+    with connection() as conn:
+        return conn.execute("SELECT 1 FROM books WHERE number = ? LIMIT 1", (number,)).fetchone() is not None
+
+
+def _next_number(number):
+    # "ACC-0999" -> "ACC-1000"
+    match = _TRAILING_DIGITS.match(number)
+    if not match:
+        raise IntakeError(f"can't count on from {number!r}: it doesn't end in digits")
+    prefix, digits = match.groups()
+    return prefix + str(int(digits) + 1).zfill(len(digits))
+
+
+class IntakeQueue:
+    # Scanned books waiting to be saved, kept in one admin's session. A
+    # scan is a metadata-cache lookup and a number check; the inserts are
+    # queued and written INTAKE_BATCH at a time. Titles staff type for
+    # ISBNs the cache doesn't know are saved to it with the books, so the
+    # next copy fills itself in.
+
+    def __init__(self, path, batch_size=INTAKE_BATCH):
+        self.path = path
+        self.batch_size = batch_size
+        self.items = []
+        # With a starting number set, each ISBN scan takes the next free
+        # accession number instead of waiting for its accession barcode
+        self.next_number = None
+        self.saved = 0
+        # The job checking the last saved batch for duplicates
+        self.check_job = None
+        # Bumped whenever rows are added or removed, so the review grid
+        # can't apply an old edit to a row that has moved
+        self.version = 0
+
+    def _taken(self, number):
+        return any(item.number == number for item in self.items) or number_in_catalog(number)
+
+    def _take_number(self):
+        if not self.next_number:
+            return None
+        number = self.next_number
+        while self._taken(number):
+            number = _next_number(number)
+        self.next_number = _next_number(number)
+        return number
+
+    def scan(self, code, category):
+        # An ISBN starts a new book; anything else is an accession number
+        # for the last book still without one, or a book of its own
+        code = code.strip()
+        with db.use_database(self.path):
+            isbn = isbn13(code)
+            if isbn:
+                found = lookup_isbn(isbn)
+                item = IntakeItem(isbn, found and found.title, self._take_number(), found and found.author,
+                                  category, found)
+                self.items.append(item)
+                self.version += 1
+                return item
+            if self._taken(code):
+                raise IntakeError(f"accession number {code} is already catalogued or scanned")
+        if self.items and self.items[-1].number is None:
+            item = self.items[-1] = self.items[-1]._replace(number=code)
+        else:
+            item = IntakeItem(None, None, code, None, category, None)
+            self.items.append(item)
+            self.version += 1
+        return item
+
+    def edit(self, index, name, number, author):
+        item = self.items[index]
+        if number and number != item.number:
+            with db.use_database(self.path):
+                if self._taken(number):
+                    raise IntakeError(f"accession number {number} is already catalogued or scanned")
+        self.items[index] = item._replace(name=name, number=number, author=author)
+
+    def undo(self):
+        if self.items:
+            self.items.pop()
+            self.version += 1
+
+    def ready(self):
+        return [item for item in self.items if item.name and item.number]
+
+    def flush(self, force=False):
+        # Saves the complete books once a batch has built up, or now when
+        # forced; books still missing a title or number stay queued
+        ready = self.ready()
+        if not ready or (len(ready) < self.batch_size and not force):
+            return 0
+        rows = [(item.name, item.number, item.author, item.category) for item in ready]
+        learned = [(item.isbn, item.name, item.author) for item in ready
+                   if item.isbn and (item.found is None or (item.name, item.author) != item.found[1:3])]
+        with db.use_database(self.path):
+            book_ids = write(_add_scanned, rows, learned)
+            # Off the queue before anything else can fail, so a retry
+            # doesn't save them twice
+            self.items = [item for item in self.items if not (item.name and item.number)]
+            self.saved += len(rows)
+            self.version += 1
+            # Checked in a job, like an import's books, so the scan that
+            # filled the batch doesn't wait for it
+            self.check_job = submit_job("check_duplicates", f"Check {len(rows)} scanned books for duplicates",
+                                        book_ids)
+        return len(rows)
+
+
+def _add_scanned(conn, rows, learned):
+    book_ids = insert_batch(conn, rows)
+    # Staff corrections overwrite dump entries, and the other way round
+    # only when reseeding (see _seed_batch)
+    conn.executemany('''
+        INSERT INTO isbn_metadata (isbn, title, author, source) VALUES (?, ?, ?, 'staff')
+        ON CONFLICT (isbn) DO UPDATE SET
+            title = excluded.title, author = excluded.author, source = 'staff', updated_at = datetime('now')
+    ''', learned)
+    return book_ids
+
+
+def _seed_batch(conn, batch):
+    conn.executemany('''
+        INSERT INTO isbn_metadata (isbn, title, author, source) VALUES (?, ?, ?, 'dump')
+        ON CONFLICT (isbn) DO UPDATE SET
+            title = excluded.title, author = excluded.author, updated_at = datetime('now')
+        WHERE isbn_metadata.source = 'dump'
+    ''', batch)
+    bump_generation(conn)
+
+
+def _open_text(path):
+    if str(path).lower().endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, encoding="utf-8-sig", newline="")
+
+
+def _read_metadata_csv(f):
+    reader = csv.reader(f)
+    header = next(reader, None)
+    columns = [METADATA_ALIASES.get(str(cell or "").strip().lower()) for cell in header or ()]
+    if "isbn" not in columns or "title" not in columns:
+        raise IntakeError("metadata file needs at least an isbn and a title column")
+    for row in reader:
+        record = {col: value.strip() for col, value in zip(columns, row) if col}
+        # Short or blank rows are skipped, like rows seed_metadata can't use
+        if record.get("isbn") and record.get("title"):
+            yield record["isbn"], record["title"], record.get("author") or None
+
+
+def _read_open_library(f):
+    # Open Library editions dump: type, key, revision, last_modified and the
+    # record as JSON, tab-separated. Most editions have no ISBN, and the
+    # substring test skips them without parsing the JSON.
+    for line in f:
+        if '"isbn_' not in line:
+            continue
+        try:
+            record = json.loads(line.rsplit("\t", 1)[-1])
+        except ValueError:
+            # A truncated or garbled line is skipped, like a short CSV row
+            continue
+        if not isinstance(record, dict):
+            continue
+        title = record.get("title")
+        if not title:
+            continue
+        if record.get("subtitle"):
+            title = f"{title}: {record['subtitle']}"
+        # Author names are separate records; the statement of responsibility
+        # or the publisher fills the catalog's author/publication column
+        author = record.get("by_statement") or next(iter(record.get("publishers") or ()), None)
+        for isbn in record.get("isbn_13", []) + record.get("isbn_10", []):
+            yield isbn, title, author
+
+
+def read_metadata(path):
+    # (isbn, title, author) rows from a CSV with isbn/title/author columns,
+    # or from an Open Library editions dump (ol_dump_editions_*.txt.gz)
+    with _open_text(path) as f:
+        name = os.path.basename(str(path)).lower()
+        rows = _read_open_library(f) if name.endswith((".txt", ".txt.gz")) else _read_metadata_csv(f)
+        yield from rows
+
+
+def seed_metadata(rows, batch_size=SEED_BATCH, progress=None):
+    start = time.perf_counter()
+    read = seeded = 0
+    batch = {}
+    for isbn, title, author in rows:
+        read += 1
+        isbn = isbn13(isbn)
+        title = (title or "").strip()
+        if not isbn or not title:
+            continue
+        # The same ISBN twice in one batch would update its own new row
+        batch[isbn] = (isbn, title, (author or "").strip() or None)
+        if len(batch) >= batch_size:
+            write(_seed_batch, list(batch.values()))
+            seeded += len(batch)
+            batch = {}
+            if progress:
+                progress(read, seeded)
+    if batch:
+        write(_seed_batch, list(batch.values()))
+        seeded += len(batch)
+    if progress:
+        progress(read, seeded)
+    return SeedResult(read, seeded, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the ISBN metadata cache used by barcode intake.")
+    parser.add_argument("file", help="CSV with isbn,title,author columns or an Open Library editions dump "
+                                     "(.csv, .txt, optionally .gz)")
+    parser.add_argument("--db", default=db.DB_FILE)
+    parser.add_argument("--branch", help="use this branch's database (see LIBRARY_BRANCHES) instead of --db")
+    parser.add_argument("--batch-size", type=int, default=SEED_BATCH)
+    args = parser.parse_args()
+
+    db.DB_FILE = branch_path(args.branch) if args.branch else args.db
+    init_db()
+
+    def report(read, seeded):
+        print(f"\r{read} rows read, {seeded} ISBNs seeded", end="", flush=True)
+
+    result = seed_metadata(read_metadata(args.file), args.batch_size, report)
+    print()
+    rate = result.read / result.seconds if result.seconds else 0
+    print(f"{result.seeded} ISBNs seeded from {result.read} rows in {result.seconds:.2f}s ({rate:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
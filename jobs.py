@@ -0,0 +1,243 @@
+import io
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from backup import create_backup
+from catalog import check_duplicates, delete_category, get_category_count, get_total_books, scan_duplicates
+from exporter import export_books, export_filename
+from fuzzy import merge_index, reindex_after
+from importer import import_books, read_rows
+from migrations import analyze
+from writer import write
+
+# Long admin work runs on this pool instead of in the session's rerun. The
+# jobs mostly wait on SQLite and the write queue, which release the GIL, so
+# threads are enough and share the process's pools, writers and caches.
+JOB_WORKERS = int(os.environ.get("LIBRARY_JOB_WORKERS", "2"))
+# Finished exports wait here for download, newest EXPORT_KEEP per database
+EXPORT_DIR = os.environ.get("LIBRARY_EXPORT_DIR", "exports")
+EXPORT_KEEP = 10
+# Progress is written at most this often, however often a job reports it
+PROGRESS_INTERVAL = 0.5
+JOB_LIMIT = 10
+# Finished jobs beyond the newest JOB_KEEP are pruned as new ones start
+JOB_KEEP = 100
+REPORTED_ERRORS = 5
+# Books re-keyed per write when rebuilding the similar-titles index; each
+# write holds the write queue for a fraction of a second
+REINDEX_BATCH = 5000
+
+Job = namedtuple("Job", "id kind label status progress message output created_at finished_at")
+
+log = logging.getLogger("library.jobs")
+
+
+class JobError(ValueError):
+    pass
+
+
+class JobProgress:
+    # Handed to job functions as progress(fraction, message=None). Updates
+    # go through the write queue like any other write.
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._last = 0.0
+
+    def __call__(self, fraction, message=None):
+        now = time.monotonic()
+        if now - self._last < PROGRESS_INTERVAL:
+            return
+        self._last = now
+        write(_update_job, self.job_id, min(max(fraction, 0.0), 1.0), message)
+
+
+def get_jobs(limit=JOB_LIMIT):
+    # Not cached: progress changes without a catalog write, and polling
+    # sessions read only the newest few rows by rowid
+    with db.connection() as conn:
+        rows = conn.execute('''
+            SELECT id, kind, label, status, progress, message, output, created_at, finished_at
+            FROM jobs ORDER BY id DESC LIMIT ?
+        ''', (limit,)).fetchall()
+    return [Job._make(row) for row in rows]
+
+
+def _create_job(conn, kind, label):
+    job_id = conn.execute("INSERT INTO jobs (kind, label) VALUES (?, ?)", (kind, label)).lastrowid
+    conn.execute("DELETE FROM jobs WHERE id <= ? AND status IN ('done', 'failed')", (job_id - JOB_KEEP,))
+    return job_id
+
+
+def _start_job(conn, job_id):
+    conn.execute("UPDATE jobs SET status = 'running', started_at = datetime('now') WHERE id = ?", (job_id,))
+
+
+def _update_job(conn, job_id, progress, message):
+    conn.execute("UPDATE jobs SET progress = ?, message = COALESCE(?, message) WHERE id = ?",
+                 (progress, message, job_id))
+
+
+def _finish_job(conn, job_id, status, message, output):
+    conn.execute('''
+        UPDATE jobs SET status = ?1, progress = IIF(?1 = 'done', 1, progress), message = ?2, output = ?3,
+                        finished_at = datetime('now')
+        WHERE id = ?4
+    ''', (status, message, output, job_id))
+
+
+def _fail_interrupted(conn):
+    conn.execute('''
+        UPDATE jobs SET status = 'failed', message = 'interrupted by a restart', finished_at = datetime('now')
+        WHERE status IN ('queued', 'running')
+    ''')
+
+
+def fail_interrupted_jobs():
+    # Jobs live in the app process; any still queued or running when it
+    # starts were cut off by the last shutdown
+    write(_fail_interrupted)
+
+
+def _run(path, job_id, fn, args):
+    # Runs on a job worker, which doesn't inherit the submitter's database
+    with db.use_database(path):
+        try:
+            write(_start_job, job_id)
+            message, output = fn(JobProgress(job_id), *args)
+        except Exception as e:
+            log.exception("job %d (%s) failed", job_id, fn.__name__)
+            write(_finish_job, job_id, "failed", str(e) or type(e).__name__, None)
+        else:
+            write(_finish_job, job_id, "done", message, output)
+
+
+def _import_job(progress, data, filename, category, skip_duplicates):
+    source = io.BytesIO(data)
+
+    def report(read, inserted):
+        # The CSV reader's text wrapper closes source once the rows run out
+        done = 1.0 if source.closed else source.tell() / max(len(data), 1)
+        progress(done, f"{read} rows read, {inserted} inserted")
+
+    result = import_books(read_rows(source, filename), category, skip_duplicates=skip_duplicates, progress=report)
+    message = (f"Imported {result.inserted} of {result.read} rows in {result.seconds:.1f}s "
+               f"({result.duplicates} duplicate numbers skipped, {result.invalid} invalid).")
+    if result.book_ids:
+        # A job of its own, so the import is reported as done once its rows are in
+        submit_job("check_duplicates", f"Check {len(result.book_ids)} imported books for duplicates",
+                   result.book_ids)
+        message += " The new books are being checked for duplicates in a separate job."
+    if result.errors:
+        message += " " + "; ".join(f"Line {line}: {error}" for line, error in result.errors[:REPORTED_ERRORS])
+    return message, None
+
+
+def _export_dir():
+    return os.path.join(EXPORT_DIR, db.database_name())
+
+
+def _export_job(progress, fmt, category, compress):
+    # One directory per job keeps the download's file name plain
+    directory = _export_dir()
+    target = os.path.join(directory, str(progress.job_id), export_filename(fmt, category, compress))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    total = get_category_count(category) if category is not None else get_total_books()
+    with open(target + ".part", "wb") as out:
+        export_books(out, fmt, category, compress,
+                     progress=lambda written: progress(written / max(total, 1), f"{written} of {total} books"))
+    os.replace(target + ".part", target)
+    jobs = sorted((entry for entry in os.scandir(directory) if entry.name.isdigit()),
+                  key=lambda entry: int(entry.name), reverse=True)
+    for entry in jobs[EXPORT_KEEP:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+    return f"Exported {total} books as {os.path.basename(target)}.", target
+
+
+def _backup_job(progress):
+    snapshot = create_backup(progress=lambda copied, total: progress(copied / max(total, 1)))
+    return f"Saved {snapshot.size / 1e6:.1f} MB snapshot.", None
+
+
+def _rebuild_fts(conn):
+    conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO books_fts (books_fts) VALUES ('optimize')")
+
+
+def _reindex_job(progress):
+    # The similar-titles keys are computed in Python, so that rebuild is the
+    # slow part; it goes in keyset batches, each its own write, and sessions'
+    # writes get in between
+    progress(0.0, "Rebuilding the search index")
+    write(_rebuild_fts)
+    total, done, after = get_total_books(), 0, 0
+    while after is not None:
+        progress(0.1 + 0.7 * done / max(total, 1), f"Rebuilding the similar-titles index: {done} of {total} books")
+        after = write(reindex_after, after, REINDEX_BATCH)
+        done = min(done + REINDEX_BATCH, total)
+    progress(0.8, "Merging the similar-titles index")
+    while write(merge_index):
+        pass
+    progress(0.9, "Updating query planner statistics")
+    with db.connection() as conn:
+        analyze(conn)
+    return "Rebuilt the search indexes.", None
+
+
+def _delete_category_job(progress, name):
+    count = get_category_count(name)
+    delete_category(name)
+    return f"Deleted category '{name}' and its {count} books; they can be restored from the Trash.", None
+
+
+def _duplicates_job(progress):
+    return f"Found {scan_duplicates()} likely duplicate pairs.", None
+
+
+def _check_duplicates_job(progress, book_ids):
+    found = check_duplicates(book_ids, lambda checked, total: progress(checked / total, f"{checked} of {total} books"))
+    message = f"Found {found} likely duplicate pairs among {len(book_ids)} new books."
+    if found:
+        message += " Review them under 🔁 Duplicates."
+    return message, None
+
+
+# kind -> fn(progress, *args) returning (message, output path or None)
+JOB_KINDS = {
+    "import": _import_job,
+    "export": _export_job,
+    "backup": _backup_job,
+    "reindex": _reindex_job,
+    "delete_category": _delete_category_job,
+    "duplicates": _duplicates_job,
+    "check_duplicates": _check_duplicates_job,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(JOB_WORKERS, thread_name_prefix="job")
+    return _executor
+
+
+def submit_job(kind, label, *args):
+    # Records the job and queues it on the pool; returns its id at once
+    fn = JOB_KINDS.get(kind)
+    if fn is None:
+        raise JobError(f"unknown job kind {kind!r}")
+    path = db.current_path()
+    job_id = write(_create_job, kind, label)
+    _get_executor().submit(_run, path, job_id, fn, args)
+    return job_id
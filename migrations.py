@@ -0,0 +1,549 @@
+import dedup
+import fuzzy
+
+# Each migration takes an open connection and runs inside the transaction
+# opened by migrate(); its position in MIGRATIONS is its schema version.
+# Append new steps, never edit or reorder shipped ones.
+
+
+def _v1_books(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            number TEXT NOT NULL,
+            author TEXT,
+            category TEXT NOT NULL
+        )
+    ''')
+
+
+def _v2_books_indexes(conn):
+    # Covers the category listing and the sidebar category scan
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_category_name ON books (category, name, author)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_number ON books (number)")
+
+
+# Devanagari vowel signs and viramas are combining marks, which unicode61
+# treats as separators; without them Hindi words get split mid-syllable.
+DEVANAGARI_MARKS = "".join(
+    chr(cp)
+    for start, end in ((0x0900, 0x0903), (0x093A, 0x094F), (0x0951, 0x0957), (0x0962, 0x0963))
+    for cp in range(start, end + 1)
+)
+
+
+# Also recreated by search.deferred_fts_index() after bulk inserts
+BOOKS_FTS_INSERT_TRIGGER = '''
+    CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, name, author, number)
+        VALUES (new.id, new.name, new.author, new.number);
+    END
+'''
+
+
+def _v3_books_fts(conn):
+    # External-content index: the text lives only in books, the triggers keep
+    # the FTS postings in step with every insert/update/delete.
+    conn.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            name, author, number,
+            content='books', content_rowid='id',
+            tokenize="unicode61 remove_diacritics 2 tokenchars '{DEVANAGARI_MARKS}'",
+            prefix='2 3'
+        )
+    ''')
+    conn.execute(BOOKS_FTS_INSERT_TRIGGER)
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, name, author, number)
+            VALUES ('delete', old.id, old.name, old.author, old.number);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF name, author, number ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, name, author, number)
+            VALUES ('delete', old.id, old.name, old.author, old.number);
+            INSERT INTO books_fts (rowid, name, author, number)
+            VALUES (new.id, new.name, new.author, new.number);
+        END
+    ''')
+    conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
+
+def _v4_catalog_meta(conn):
+    # generation is bumped by every catalog write; readers key caches on it
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('generation', 0)")
+
+
+def _v5_books_page_index(conn):
+    # (category, name, id) matches the listing's keyset order exactly, so a
+    # page is one range scan with no sort. The page query also reads number
+    # and joins loans, so it still looks up each of its rows in books; author
+    # only keeps reads of id, name and author index-only.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_category_page ON books (category, name, id, author)")
+    conn.execute("DROP INDEX IF EXISTS idx_books_category_name")
+
+
+# The insert triggers of v6, v8 and v10 are also recreated by
+# catalog.deferred_book_triggers() after bulk inserts
+BOOKS_COUNT_INSERT_TRIGGER = '''
+    CREATE TRIGGER IF NOT EXISTS books_count_ai AFTER INSERT ON books BEGIN
+        UPDATE categories SET book_count = book_count + 1 WHERE name = new.category;
+    END
+'''
+
+
+def _v6_categories(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            book_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Keep the order categories were first used in
+    conn.execute('''
+        INSERT OR IGNORE INTO categories (name)
+        SELECT category FROM books GROUP BY category ORDER BY MIN(id)
+    ''')
+    # add_category used to insert these just to make a category exist
+    conn.execute("DELETE FROM books WHERE name = 'New Book' AND number = '000' AND author IS NULL")
+
+    # SQLite can't add a foreign key in place, so rebuild books and put its
+    # indexes and triggers back. Ids are copied, which keeps books_fts valid.
+    dependents = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = 'books' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+    )]
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'books'").fetchone()
+    next_seq = row[0] if row else 0
+    # number stays nullable: library.db predates the NOT NULL in v1 and
+    # has rows without one.
+    conn.execute('''
+        CREATE TABLE books_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            number TEXT,
+            author TEXT,
+            category TEXT NOT NULL REFERENCES categories (name)
+        )
+    ''')
+    conn.execute("INSERT INTO books_new (id, name, number, author, category) SELECT id, name, number, author, category FROM books")
+    conn.execute("DROP TABLE books")
+    conn.execute("ALTER TABLE books_new RENAME TO books")
+    for sql in dependents:
+        conn.execute(sql)
+    conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'books'", (next_seq,))
+
+    conn.execute("UPDATE categories SET book_count = (SELECT COUNT(*) FROM books WHERE books.category = categories.name)")
+    conn.execute(BOOKS_COUNT_INSERT_TRIGGER)
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_count_ad AFTER DELETE ON books BEGIN
+            UPDATE categories SET book_count = book_count - 1 WHERE name = old.category;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_count_au AFTER UPDATE OF category ON books
+        WHEN old.category IS NOT new.category BEGIN
+            UPDATE categories SET book_count = book_count - 1 WHERE name = old.category;
+            UPDATE categories SET book_count = book_count + 1 WHERE name = new.category;
+        END
+    ''')
+
+
+def _v7_fuzzy_index(conn):
+    # Trigram index over normalized (transliterated, spelling-folded) title +
+    # author keys. The keys are computed in Python, so the catalog write
+    # helpers maintain it rather than triggers. It is filled by v15, together
+    # with the gram counts that replaced the vocab table.
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS book_fuzzy USING fts5(
+            key, tokenize = 'trigram', detail = 'none'
+        )
+    ''')
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS book_fuzzy_vocab USING fts5vocab(book_fuzzy, row)")
+
+
+# Stamps a category with the next change id. One row per category keeps
+# the feed bounded, and a poll only needs the rows stamped after the last
+# id a session has seen.
+CHANGE_STAMP = '''
+    INSERT INTO catalog_changes (category, change_id)
+    VALUES ({category}, (SELECT COALESCE(MAX(change_id), 0) + 1 FROM catalog_changes))
+    ON CONFLICT (category) DO UPDATE SET change_id = excluded.change_id;
+'''
+BOOKS_CHANGES_INSERT_TRIGGER = f'''
+    CREATE TRIGGER IF NOT EXISTS books_changes_ai AFTER INSERT ON books BEGIN
+        {CHANGE_STAMP.format(category="new.category")}
+    END
+'''
+
+
+def _v8_catalog_changes(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_changes (
+            category TEXT PRIMARY KEY,
+            change_id INTEGER NOT NULL
+        )
+    ''')
+    conn.execute(BOOKS_CHANGES_INSERT_TRIGGER)
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS books_changes_ad AFTER DELETE ON books BEGIN
+            {CHANGE_STAMP.format(category="old.category")}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS books_changes_au AFTER UPDATE ON books BEGIN
+            {CHANGE_STAMP.format(category="old.category")}
+            {CHANGE_STAMP.format(category="new.category")}
+        END
+    ''')
+
+
+def _v9_circulation(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS members (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            card TEXT NOT NULL UNIQUE,
+            phone TEXT,
+            joined_at TEXT NOT NULL DEFAULT (date('now'))
+        )
+    ''')
+    # Dates are ISO 'YYYY-MM-DD' text, so they compare correctly as strings.
+    # Loans go with their book; members with loans can't be removed.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS loans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL REFERENCES books (id) ON DELETE CASCADE,
+            member_id INTEGER NOT NULL REFERENCES members (id),
+            issued_at TEXT NOT NULL,
+            due_at TEXT NOT NULL,
+            returned_at TEXT,
+            renewals INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Both partial indexes only hold open loans, so the listing's
+    # availability join and the overdue report stay the same size however
+    # much history piles up. The unique one also stops a book being issued
+    # twice.
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_loans_open_book ON loans (book_id) WHERE returned_at IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_loans_open_due ON loans (due_at) WHERE returned_at IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_loans_member ON loans (member_id, issued_at)")
+    # For the ON DELETE CASCADE lookup when a book is deleted
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_loans_book ON loans (book_id)")
+
+    # Availability shows in the listing, so loans feed the change log too
+    book_category = "(SELECT category FROM books WHERE id = {}.book_id)"
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS loans_changes_ai AFTER INSERT ON loans BEGIN
+            {CHANGE_STAMP.format(category=book_category.format("new"))}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS loans_changes_au AFTER UPDATE OF due_at, returned_at ON loans BEGIN
+            {CHANGE_STAMP.format(category=book_category.format("new"))}
+        END
+    ''')
+
+
+# Statements shared by the statistics triggers. {row} is new or old.
+AUTHOR_KEY = "IFNULL(TRIM({row}.author), '')"
+# The authors and duplicate_numbers counters in catalog_meta move when a
+# count crosses 0/1 and 1/2 respectively, so reading them is one lookup
+AUTHOR_ADD = f"""
+    INSERT INTO author_counts (author, book_count) VALUES ({AUTHOR_KEY}, 1)
+    ON CONFLICT (author) DO UPDATE SET book_count = book_count + 1;
+    UPDATE catalog_meta SET value = value + 1
+    WHERE key = 'authors' AND {AUTHOR_KEY} != ''
+      AND (SELECT book_count FROM author_counts WHERE author = {AUTHOR_KEY}) = 1;
+"""
+AUTHOR_REMOVE = f"""
+    UPDATE author_counts SET book_count = book_count - 1 WHERE author = {AUTHOR_KEY};
+    UPDATE catalog_meta SET value = value - 1
+    WHERE key = 'authors' AND {AUTHOR_KEY} != ''
+      AND (SELECT book_count FROM author_counts WHERE author = {AUTHOR_KEY}) = 0;
+    DELETE FROM author_counts WHERE author = {AUTHOR_KEY} AND book_count = 0;
+"""
+NUMBER_ADD = """
+    INSERT INTO number_counts (number, book_count) SELECT {row}.number, 1 WHERE {row}.number IS NOT NULL
+    ON CONFLICT (number) DO UPDATE SET book_count = book_count + 1;
+    UPDATE catalog_meta SET value = value + 1
+    WHERE key = 'duplicate_numbers' AND (SELECT book_count FROM number_counts WHERE number = {row}.number) = 2;
+"""
+NUMBER_REMOVE = """
+    UPDATE catalog_meta SET value = value - 1
+    WHERE key = 'duplicate_numbers' AND (SELECT book_count FROM number_counts WHERE number = {row}.number) = 2;
+    UPDATE number_counts SET book_count = book_count - 1 WHERE number = {row}.number;
+    DELETE FROM number_counts WHERE number = {row}.number AND book_count = 0;
+"""
+GROWTH_STAMP = """
+    INSERT INTO catalog_growth (month, {column}) VALUES (strftime('%Y-%m', 'now'), 1)
+    ON CONFLICT (month) DO UPDATE SET {column} = {column} + 1;
+"""
+BOOKS_STATS_INSERT_TRIGGER = f"""
+    CREATE TRIGGER IF NOT EXISTS books_stats_ai AFTER INSERT ON books BEGIN
+        {AUTHOR_ADD.format(row="new")}
+        {NUMBER_ADD.format(row="new")}
+        {GROWTH_STAMP.format(column="added")}
+    END
+"""
+
+
+def _v10_statistics(conn):
+    # Aggregates for the statistics view, kept by triggers so the view only
+    # reads small tables and indexes whatever the size of the catalog
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS author_counts (
+            author TEXT PRIMARY KEY,
+            book_count INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_author_counts_top ON author_counts (book_count)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS number_counts (
+            number TEXT PRIMARY KEY,
+            book_count INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_number_counts_dups ON number_counts (book_count) WHERE book_count > 1")
+    # Books have no added date, so growth is only known from here on: one
+    # row per month of books added and removed
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_growth (
+            month TEXT PRIMARY KEY,
+            added INTEGER NOT NULL DEFAULT 0,
+            removed INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+
+    conn.execute("DELETE FROM author_counts")
+    conn.execute(f"""
+        INSERT INTO author_counts (author, book_count)
+        SELECT {AUTHOR_KEY.format(row="books")}, COUNT(*) FROM books GROUP BY 1
+    """)
+    conn.execute("DELETE FROM number_counts")
+    conn.execute("""
+        INSERT INTO number_counts (number, book_count)
+        SELECT number, COUNT(*) FROM books WHERE number IS NOT NULL GROUP BY number
+    """)
+    conn.execute("""
+        INSERT OR REPLACE INTO catalog_meta (key, value)
+        SELECT 'duplicate_numbers', COUNT(*) FROM number_counts WHERE book_count > 1
+    """)
+    conn.execute("""
+        INSERT OR REPLACE INTO catalog_meta (key, value)
+        SELECT 'authors', COUNT(*) FROM author_counts WHERE author != ''
+    """)
+
+    conn.execute(BOOKS_STATS_INSERT_TRIGGER)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS books_stats_ad AFTER DELETE ON books BEGIN
+            {AUTHOR_REMOVE.format(row="old")}
+            {NUMBER_REMOVE.format(row="old")}
+            {GROWTH_STAMP.format(column="removed")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS books_stats_author_au AFTER UPDATE OF author ON books
+        WHEN old.author IS NOT new.author BEGIN
+            {AUTHOR_REMOVE.format(row="old")}
+            {AUTHOR_ADD.format(row="new")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS books_stats_number_au AFTER UPDATE OF number ON books
+        WHEN old.number IS NOT new.number BEGIN
+            {NUMBER_REMOVE.format(row="old")}
+            {NUMBER_ADD.format(row="new")}
+        END
+    """)
+
+
+def _v11_trash(conn):
+    # Deleted books are kept here for a while so a deletion can be undone
+    # without restoring a whole backup. category is set when a whole
+    # category was deleted, so undoing it brings back an empty one too.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS trash (
+            id INTEGER PRIMARY KEY,
+            deleted_at TEXT NOT NULL DEFAULT (datetime('now')),
+            label TEXT NOT NULL,
+            category TEXT,
+            book_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trash_deleted ON trash (deleted_at)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS trash_books (
+            trash_id INTEGER NOT NULL REFERENCES trash (id) ON DELETE CASCADE,
+            id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            number TEXT,
+            author TEXT,
+            category TEXT NOT NULL,
+            PRIMARY KEY (trash_id, id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _v12_duplicates(conn):
+    # Merge suggestions from dedup.py, stored as book_id < other_id.
+    # Dismissed pairs stay so a rescan doesn't suggest them again.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS duplicate_pairs (
+            book_id INTEGER NOT NULL REFERENCES books (id) ON DELETE CASCADE,
+            other_id INTEGER NOT NULL REFERENCES books (id) ON DELETE CASCADE,
+            score REAL NOT NULL,
+            dismissed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (book_id, other_id)
+        ) WITHOUT ROWID
+    ''')
+    # For the cascade when other_id is deleted
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_duplicate_pairs_other ON duplicate_pairs (other_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_duplicate_pairs_open ON duplicate_pairs (score) WHERE NOT dismissed")
+
+
+def _v13_isbn_metadata(conn):
+    # Title and author by ISBN-13 for barcode intake (intake.py), seeded
+    # from an offline dump and added to as staff catalog unknown ISBNs
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS isbn_metadata (
+            isbn TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            author TEXT,
+            source TEXT NOT NULL,
+            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        ) WITHOUT ROWID
+    ''')
+
+
+def _v14_jobs(conn):
+    # Background admin jobs (jobs.py). Sessions poll the newest rows, so
+    # the rowid order is all the table needs.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            label TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            output TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            started_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+
+
+def _v15_fuzzy_grams(conn):
+    # Per-trigram key counts for picking a query's rarest grams, kept by
+    # fuzzy.index_books. The fts5vocab table gave the same counts, but only
+    # by reading every posting list of the grams asked about, which cost
+    # tens of milliseconds per lookup at 100k books.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fuzzy_grams (
+            gram TEXT PRIMARY KEY,
+            doc_count INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("DROP TABLE IF EXISTS book_fuzzy_vocab")
+    fuzzy.rebuild_index(conn)
+
+
+def _v16_number_key(conn):
+    # dedup.number_key of each book's number ("Acc. 00123" -> "acc123"), so
+    # the check on a new book matches numbers the way the full scan does.
+    # Computed in Python, so the write helpers set it, like the fuzzy keys.
+    conn.execute("ALTER TABLE books ADD COLUMN number_key TEXT")
+    conn.executemany("UPDATE books SET number_key = ? WHERE id = ?", [
+        (dedup.number_key(number), book_id)
+        for book_id, number in conn.execute("SELECT id, number FROM books WHERE number IS NOT NULL").fetchall()
+    ])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_number_key ON books (number_key)")
+
+
+def _v17_jobs_autoincrement(conn):
+    # Job ids are never handed out twice, not even after a restore brings
+    # back an older jobs table (see backup._after_restore): a job still
+    # running updates its row by id. SQLite can't add AUTOINCREMENT in
+    # place, so the table is rebuilt with the same columns.
+    conn.execute('''
+        CREATE TABLE jobs_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            label TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            output TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            started_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    conn.execute("INSERT INTO jobs_new SELECT * FROM jobs")
+    conn.execute("DROP TABLE jobs")
+    conn.execute("ALTER TABLE jobs_new RENAME TO jobs")
+
+
+MIGRATIONS = [
+    _v1_books,
+    _v2_books_indexes,
+    _v3_books_fts,
+    _v4_catalog_meta,
+    _v5_books_page_index,
+    _v6_categories,
+    _v7_fuzzy_index,
+    _v8_catalog_changes,
+    _v9_circulation,
+    _v10_statistics,
+    _v11_trash,
+    _v12_duplicates,
+    _v13_isbn_metadata,
+    _v14_jobs,
+    _v15_fuzzy_grams,
+    _v16_number_key,
+    _v17_jobs_autoincrement,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=LATEST_VERSION):
+    applied = []
+    while schema_version(conn) < target:
+        # IMMEDIATE takes the write lock up front so two processes starting
+        # together can't both apply the same step.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)
+            if version >= target:
+                conn.rollback()
+                break
+            MIGRATIONS[version](conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version + 1)
+    if applied:
+        analyze(conn)
+    return applied
+
+
+def analyze(conn):
+    conn.execute("ANALYZE")
+    conn.commit()
@@ -0,0 +1,77 @@
+from collections import namedtuple
+from contextlib import contextmanager
+
+from db import connection
+from instrument import traced
+from migrations import BOOKS_FTS_INSERT_TRIGGER
+
+SEARCH_LIMIT = 50
+
+# Markers wrapped around matched terms by highlight(); control characters
+# can't appear in catalog text, so callers can swap them for real markup
+# after escaping.
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+SearchHit = namedtuple("SearchHit", "id name author number category name_hl author_hl")
+
+# bm25 column weights for (name, author, number)
+RANK_WEIGHTS = (10.0, 4.0, 1.0)
+
+
+def build_match_query(text):
+    # Every whitespace-separated term must match, each as a prefix. Terms are
+    # quoted so FTS5 operators and punctuation in user input are taken literally.
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"*' for term in terms if term.strip('"'))
+
+
+@traced
+def search_books(text, category=None, limit=SEARCH_LIMIT):
+    return [hit for _, hit in ranked_search(text, category, limit)]
+
+
+def ranked_search(text, category=None, limit=SEARCH_LIMIT):
+    # (score, hit) pairs, best first. Scores are bm25, where lower is better.
+    match = build_match_query(text)
+    if not match:
+        return []
+
+    sql = f'''
+        SELECT b.id, b.name, b.author, b.number, b.category,
+               highlight(books_fts, 0, :start, :end),
+               highlight(books_fts, 1, :start, :end),
+               bm25(books_fts, {", ".join(map(str, RANK_WEIGHTS))}) AS score
+        FROM books_fts
+        JOIN books b ON b.id = books_fts.rowid
+        WHERE books_fts MATCH :match {"AND b.category = :category" if category is not None else ""}
+        ORDER BY score
+        LIMIT :limit
+    '''
+    params = {
+        "match": match,
+        "category": category,
+        "start": HIGHLIGHT_START,
+        "end": HIGHLIGHT_END,
+        "limit": limit,
+    }
+    with connection() as conn:
+        return [(row[-1], SearchHit(*row[:-1])) for row in conn.execute(sql, params)]
+
+
+@contextmanager
+def deferred_fts_index(conn):
+    # For bulk inserts inside an explicit transaction: indexing the new rows
+    # with one INSERT ... SELECT is several times faster than the per-row
+    # trigger. The DROP/CREATE are part of the caller's transaction, so other
+    # connections never see the trigger missing, and a rollback restores it.
+    if not conn.in_transaction:
+        raise RuntimeError("deferred_fts_index needs an open transaction")
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM books").fetchone()[0]
+    conn.execute("DROP TRIGGER IF EXISTS books_fts_ai")
+    yield
+    conn.execute('''
+        INSERT INTO books_fts (rowid, name, author, number)
+        SELECT id, name, author, number FROM books WHERE id > ?
+    ''', (last_id,))
+    conn.execute(BOOKS_FTS_INSERT_TRIGGER)
@@ -0,0 +1,67 @@
+from collections import namedtuple
+
+from cache import cached
+from catalog import catalog_generation
+from db import connection
+from instrument import traced
+
+TOP_AUTHORS = 20
+TOP_DUPLICATES = 50
+
+Summary = namedtuple("Summary", "total_books categories authors duplicate_numbers")
+GrowthMonth = namedtuple("GrowthMonth", "month added removed total")
+
+# Everything here reads the trigger-kept aggregates from schema v10 (and
+# categories.book_count), never books itself, so the statistics view costs
+# the same for a thousand books or a million.
+
+
+@traced
+@cached(catalog_generation)
+def get_summary():
+    with connection() as conn:
+        return Summary(*conn.execute('''
+            SELECT
+                (SELECT COALESCE(SUM(book_count), 0) FROM categories),
+                (SELECT COUNT(*) FROM categories),
+                (SELECT value FROM catalog_meta WHERE key = 'authors'),
+                (SELECT value FROM catalog_meta WHERE key = 'duplicate_numbers')
+        ''').fetchone())
+
+
+@traced
+@cached(catalog_generation)
+def get_top_authors(limit=TOP_AUTHORS):
+    # Walks idx_author_counts_top backwards; '' collects books without one
+    with connection() as conn:
+        return conn.execute(
+            "SELECT author, book_count FROM author_counts WHERE author != '' ORDER BY book_count DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+
+@traced
+@cached(catalog_generation)
+def get_duplicate_numbers(limit=TOP_DUPLICATES):
+    # idx_number_counts_dups only holds numbers used more than once
+    with connection() as conn:
+        return conn.execute(
+            "SELECT number, book_count FROM number_counts WHERE book_count > 1 ORDER BY book_count DESC, number LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+
+@traced
+@cached(catalog_generation)
+def get_growth():
+    # Months since tracking started, with the running total. Books that were
+    # already in the catalog then count towards the first month's baseline.
+    with connection() as conn:
+        months = conn.execute("SELECT month, added, removed FROM catalog_growth ORDER BY month").fetchall()
+        total = conn.execute("SELECT COALESCE(SUM(book_count), 0) FROM categories").fetchone()[0]
+    running = total - sum(added - removed for _, added, removed in months)
+    growth = []
+    for month, added, removed in months:
+        running += added - removed
+        growth.append(GrowthMonth(month, added, removed, running))
+    return growth
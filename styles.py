@@ -0,0 +1,438 @@
+# Page CSS and static HTML. This module is imported once per process, so the
+# strings are built and compacted once instead of on every rerun of app.py.
+
+
+def _compact(markup):
+    # Leading indentation is dropped so markdown never reads a line as a code
+    # block, and it trims what every rerun sends to the browser
+    return "\n".join(line.strip() for line in markup.strip().splitlines() if line.strip())
+
+
+LOGIN_HTML = _compact("""
+<style>
+.title-center {
+    text-align: center;
+    font-size: 48px;
+    font-weight: bold;
+    margin-top: 40px;
+    margin-bottom: 60px;
+    color: #ffffff;
+    text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
+}
+.center-container {
+    display: flex;
+    justify-content: center;
+    gap: 50px;
+    margin-bottom: 40px;
+}
+/* Custom button styling */
+.stButton > button {
+    width: 100%;
+    height: 80px;
+    border-radius: 20px;
+    font-size: 28px;
+    font-weight: 700;
+    transition: all 0.3s ease;
+    box-shadow: 0 8px 15px rgba(0, 0, 0, 0.2);
+    border: none;
+    margin: 15px 0;
+    text-transform: uppercase;
+    letter-spacing: 1px;
+}
+/* View Catalog button - Green */
+.stButton > button[kind="view_catalog"] {
+    background: linear-gradient(135deg, #2ecc71, #27ae60);
+    color: white;
+    text-shadow: 1px 1px 2px rgba(0,0,0,0.2);
+}
+.stButton > button[kind="view_catalog"]:hover {
+    background: linear-gradient(135deg, #27ae60, #2ecc71);
+    transform: translateY(-3px) scale(1.02);
+    box-shadow: 0 12px 20px rgba(46, 204, 113, 0.3);
+}
+/* Admin Login button - Red */
+.stButton > button[kind="admin_login"] {
+    background: linear-gradient(135deg, #e74c3c, #c0392b);
+    color: white;
+    text-shadow: 1px 1px 2px rgba(0,0,0,0.2);
+}
+.stButton > button[kind="admin_login"]:hover {
+    background: linear-gradient(135deg, #c0392b, #e74c3c);
+    transform: translateY(-3px) scale(1.02);
+    box-shadow: 0 12px 20px rgba(231, 76, 60, 0.3);
+}
+/* Admin login form minimalist styling */
+.stTextInput > div > div > input {
+    border: none;
+    border-radius: 7px;
+    padding: 10px 8px;
+    font-size: 18px;
+    text-align: center;
+    box-sizing: border-box;
+    background: none;
+    box-shadow: none;
+    transition: border-color 0.2s;
+}
+.stTextInput > div > div > input:focus {
+    border: none;
+    box-shadow: none;
+}
+/* Login button in admin form */
+.stButton > button[kind="login"] {
+    background: linear-gradient(135deg, #e74c3c, #c0392b);
+    color: white;
+    border-radius: 15px;
+    height: 60px;
+    font-size: 22px;
+    font-weight: 700;
+    text-transform: uppercase;
+    letter-spacing: 1px;
+}
+.stButton > button[kind="login"]:hover {
+    background: linear-gradient(135deg, #c0392b, #e74c3c);
+    transform: translateY(-2px) scale(1.02);
+    box-shadow: 0 8px 15px rgba(231, 76, 60, 0.3);
+}
+/* Admin login title */
+.admin-login-title {
+    text-align: center;
+    color: #ffffff;
+    margin-bottom: 40px;
+    font-size: 36px;
+    font-weight: bold;
+    text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
+}
+/* Center the text input labels */
+.stTextInput > label {
+    text-align: center;
+    font-size: 20px;
+    font-weight: 600;
+    margin-bottom: 10px;
+    color: #ffffff;
+}
+</style>
+<div class="title-center">DIET Dehradun 📚Library Catalog</div>
+""")
+
+ADMIN_LOGIN_HTML = _compact("""
+<style>
+.admin-login-title {
+    text-align: center;
+    color: #ff0000;
+    margin-bottom: 40px;
+    font-size: 36px;
+    font-weight: bold;
+    text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
+}
+</style>
+<h2 class="admin-login-title">🔐 Admin Login</h2>
+""")
+
+CATALOG_HTML = _compact("""
+<style>
+/* Main container styling */
+.main {
+    background: linear-gradient(135deg, #1a1a1a 0%, #2c3e50 100%);
+    padding: 20px;
+    border-radius: 15px;
+}
+
+/* Title styling */
+.catalog-title {
+    text-align: center;
+    font-size: 48px;
+    font-weight: bold;
+    margin-top: 40px;
+    margin-bottom: 20px;
+    color: #ffffff;
+    text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
+    background: linear-gradient(135deg, #ffffff 0%, #f0f0f0 100%);
+    -webkit-background-clip: text;
+    -webkit-text-fill-color: transparent;
+}
+
+/* Total books counter */
+.total-books {
+    text-align: center;
+    font-size: 24px;
+    color: #ffffff;
+    margin-bottom: 40px;
+    padding: 10px;
+    background: rgba(255, 255, 255, 0.1);
+    border-radius: 10px;
+    backdrop-filter: blur(5px);
+}
+
+/* Sidebar styling */
+.sidebar .sidebar-content {
+    background: linear-gradient(135deg, #2c3e50 0%, #1a1a1a 100%);
+    padding: 20px;
+    border-radius: 15px;
+}
+
+.sidebar-title {
+    font-size: 24px;
+    font-weight: bold;
+    color: #ffffff;
+    margin-bottom: 20px;
+    text-align: center;
+    text-shadow: 1px 1px 2px rgba(0,0,0,0.2);
+    padding: 10px;
+    background: rgba(255, 255, 255, 0.1);
+    border-radius: 10px;
+}
+
+/* Modernize Streamlit radio buttons for categories - no circles, rounded rectangles, smooth color transition */
+.stRadio [role="radiogroup"] {
+    display: flex;
+    flex-direction: column;
+    gap: 16px;
+}
+.stRadio [role="radiogroup"] > label {
+    display: flex;
+    align-items: center;
+    justify-content: center;
+    width: 220px;
+    min-height: 44px;
+    border-radius: 22px;
+    background: #23242a;
+    color: #fff;
+    font-size: 1.1em;
+    font-weight: 600;
+    letter-spacing: 1px;
+    box-shadow: 0 2px 12px rgba(0,0,0,0.08);
+    position: relative;
+    transition: background 0.4s, box-shadow 0.3s, transform 0.2s;
+    cursor: pointer;
+    text-align: center;
+    padding: 0 32px 0 24px;
+    margin: 0 auto;
+}
+.stRadio [role="radiogroup"] > label:hover,
+.stRadio [role="radiogroup"] > label[data-selected="true"] {
+    background: #ff6a88;
+    color: #fff;
+    box-shadow: 0 6px 24px rgba(255, 204, 112, 0.18);
+    transform: translateY(-2px) scale(1.03);
+}
+/* Hide the radio input and its visual circle */
+.stRadio [role="radiogroup"] input[type="radio"] {
+    display: none !important;
+}
+/* Do NOT hide label > div, so category names remain visible */
+.stRadio [role="radiogroup"] > label span, .stRadio [role="radiogroup"] > label div {
+    flex: 1;
+    text-align: center;
+    font-size: 1.1em;
+    font-weight: 600;
+    letter-spacing: 1px;
+    z-index: 2;
+}
+.stRadio [role="radiogroup"] > label::after {
+    content: "→";
+    position: absolute;
+    right: 18px;
+    font-size: 1.3em;
+    opacity: 0.7;
+    transition: opacity 0.2s;
+}
+.stRadio [role="radiogroup"] > label[data-selected="true"]::after,
+.stRadio [role="radiogroup"] > label:hover::after {
+    opacity: 1;
+}
+
+/* Logout button styling */
+.stButton > button[kind="logout"] {
+    background: linear-gradient(135deg, #e74c3c, #c0392b);
+    color: white;
+    border-radius: 15px;
+    height: 50px;
+    font-size: 18px;
+    font-weight: 700;
+    text-transform: uppercase;
+    letter-spacing: 1px;
+    margin-top: 20px;
+    width: 100%;
+    transition: all 0.3s ease;
+}
+
+.stButton > button[kind="logout"]:hover {
+    background: linear-gradient(135deg, #c0392b, #e74c3c);
+    transform: translateY(-2px) scale(1.02);
+    box-shadow: 0 8px 15px rgba(231, 76, 60, 0.3);
+}
+
+/* Search box styling */
+.stTextInput > div > div > input {
+    background: rgba(255, 255, 255, 0.1);
+    border: none;
+    border-radius: 10px;
+    color: white;
+    padding: 10px;
+}
+
+/* Expander styling */
+.streamlit-expanderHeader {
+    background: rgba(255, 255, 255, 0.1);
+    border-radius: 10px;
+    color: white;
+}
+
+/* Dataframe styling */
+.stDataFrame {
+    background: rgba(255, 255, 255, 0.05);
+    border-radius: 10px;
+    padding: 10px;
+}
+
+/* Form styling */
+.stForm {
+    background: rgba(255, 255, 255, 0.05);
+    border-radius: 10px;
+    padding: 20px;
+}
+
+/* Button styling */
+.stButton > button {
+    background: linear-gradient(135deg, #3498db, #2980b9);
+    color: white;
+    border-radius: 10px;
+    transition: all 0.3s ease;
+}
+
+.stButton > button:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 5px 15px rgba(52, 152, 219, 0.3);
+}
+
+/* Info and warning messages */
+.stInfo, .stWarning, .stSuccess, .stError {
+    background: rgba(255, 255, 255, 0.1);
+    border-radius: 10px;
+    padding: 10px;
+}
+.category-btn {
+    display: flex;
+    align-items: center;
+    justify-content: center;
+    width: 220px;
+    min-height: 44px;
+    border-radius: 22px;
+    background: #23242a;
+    color: #fff;
+    font-size: 1.1em;
+    font-weight: 600;
+    letter-spacing: 1px;
+    box-shadow: 0 2px 12px rgba(0,0,0,0.08);
+    position: relative;
+    transition: background 0.4s, box-shadow 0.3s, transform 0.2s;
+    cursor: pointer;
+    text-align: center;
+    padding: 0 32px 0 24px;
+    margin: 0 auto 12px auto;
+    border: none;
+}
+.category-btn.selected {
+    background: #ff6a88 !important;
+    color: #fff !important;
+    box-shadow: 0 6px 24px rgba(255, 204, 112, 0.18);
+    transform: translateY(-2px) scale(1.03);
+}
+.category-btn:hover {
+    background: #ff6a88;
+    color: #fff;
+}
+
+/* Page navigation */
+.page-status {
+    text-align: center;
+    color: #ffffff;
+    padding-top: 8px;
+    opacity: 0.8;
+}
+
+/* Search results */
+.search-hit {
+    padding: 10px 14px;
+    margin-bottom: 8px;
+    background: rgba(255, 255, 255, 0.05);
+    border-radius: 10px;
+}
+.search-hit-title {
+    font-size: 1.05em;
+    font-weight: 600;
+}
+.search-hit-meta {
+    font-size: 0.9em;
+    opacity: 0.75;
+}
+.search-hit mark {
+    background: #ff6a88;
+    color: #fff;
+    border-radius: 3px;
+    padding: 0 2px;
+}
+</style>
+<div class="catalog-title">DIET Dehradun 📚Library Catalog</div>
+""")
+
+PDF_BUTTON_HTML = _compact("""
+<style>
+.pdf-button {
+    display: flex;
+    justify-content: center;
+    margin: 20px 0;
+}
+.pdf-button a {
+    background: linear-gradient(135deg, #4CAF50, #45a049);
+    color: white;
+    padding: 12px 24px;
+    text-decoration: none;
+    border-radius: 25px;
+    font-weight: bold;
+    font-size: 18px;
+    transition: all 0.3s ease;
+    box-shadow: 0 4px 15px rgba(0,0,0,0.2);
+}
+.pdf-button a:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 6px 20px rgba(0,0,0,0.3);
+    background: linear-gradient(135deg, #45a049, #4CAF50);
+}
+</style>
+<div class="pdf-button">
+    <a href="https://1024terabox.com/s/1UYnyARbZP_jGDSF77MxkZQ" target="_blank">📚 Access Book PDFs</a>
+</div>
+""")
+
+CATEGORY_BUTTON_CSS = _compact("""
+<style>
+[data-testid="stButton"] button.category-btn {
+    background: #23242a;
+    color: #fff;
+}
+[data-testid="stButton"] button.category-btn.selected {
+    background: #ff6a88 !important;
+    color: #fff !important;
+}
+</style>
+""")
+
+
+# Formatted per rerun with the selected category
+CATEGORY_HIGHLIGHT_SCRIPT = _compact("""
+<script>
+const btns = window.parent.document.querySelectorAll('[data-testid="stButton"] button.category-btn');
+btns.forEach(btn => {{
+    if(btn.innerText.trim() === "{selected}  →") {{
+        btn.classList.add('selected');
+    }} else {{
+        btn.classList.remove('selected');
+    }}
+}});
+</script>
+""")
+
+
+def category_highlight(selected):
+    return CATEGORY_BUTTON_CSS + "\n" + CATEGORY_HIGHLIGHT_SCRIPT.format(selected=selected)
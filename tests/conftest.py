@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from catalog import add_book, add_category, init_db  # noqa: E402
+
+
+@pytest.fixture
+def reference_books(tmp_path, monkeypatch):
+    # A fresh database with five books in "Reference"; returns their ids
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "library.db"))
+    init_db()
+    add_category("Reference")
+    for i in range(5):
+        add_book(f"Atlas volume {i}", f"R-{i}", "Oxford", "Reference")
+    with db.connection() as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM books ORDER BY id")]
+
+
+@pytest.fixture
+def wait_for_job():
+    # Background jobs run on the job pool; returns the finished Job
+    from jobs import get_jobs
+
+    def wait(job_id, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = next((job for job in get_jobs() if job.id == job_id), None)
+            if job and job.status in ("done", "failed"):
+                return job
+            time.sleep(0.02)
+        raise AssertionError(f"job {job_id} didn't finish")
+    return wait
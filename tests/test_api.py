@@ -0,0 +1,117 @@
+import base64
+import gzip
+import json
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+import api
+import db
+from catalog import add_book, add_category
+
+
+@pytest.fixture
+def catalog(reference_books, monkeypatch):
+    # The API serves db.DB_FILE when no branches are configured
+    monkeypatch.setattr(api, "BRANCHES", {})
+    add_category("Fiction " + "x" * 600)
+    return db.DB_FILE
+
+
+def call(path, query="", **headers):
+    environ = {"PATH_INFO": path, "QUERY_STRING": query}
+    environ.update({f"HTTP_{name.upper()}": value for name, value in headers.items()})
+    setup_testing_defaults(environ)
+    response = {}
+
+    def start_response(status, response_headers):
+        response["status"] = status
+        response["headers"] = dict(response_headers)
+
+    body = b"".join(api.application(environ, start_response))
+    return response["status"], response["headers"], body
+
+
+def cursor(value):
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+def test_etag_304_until_the_catalog_changes(catalog):
+    status, headers, _ = call("/api/total")
+    assert status == "200 OK"
+    etag = headers["ETag"]
+
+    status, _, body = call("/api/total", if_none_match=etag)
+    assert status == "304 Not Modified"
+    assert body == b""
+
+    add_book("Gazetteer", "R-99", None, "Reference")
+    status, headers, body = call("/api/total", if_none_match=etag)
+    assert status == "200 OK"
+    assert headers["ETag"] != etag
+    assert json.loads(body) == {"total": 6}
+
+
+def test_gzip_only_when_accepted(catalog):
+    status, headers, body = call("/api/categories", accept_encoding="gzip, deflate")
+    assert status == "200 OK"
+    assert headers["Content-Encoding"] == "gzip"
+    assert int(headers["Content-Length"]) == len(body)
+    compressed = json.loads(gzip.decompress(body))
+
+    status, headers, body = call("/api/categories")
+    assert "Content-Encoding" not in headers
+    assert json.loads(body) == compressed
+
+
+def test_small_responses_are_not_gzipped(catalog):
+    _, headers, body = call("/api/total", accept_encoding="gzip")
+    assert "Content-Encoding" not in headers
+    assert json.loads(body) == {"total": 5}
+
+
+def test_cursor_paging_walks_the_whole_category(catalog):
+    names, token, pages = [], None, 0
+    while True:
+        query = "limit=2" + (f"&cursor={token}" if token else "")
+        status, _, body = call("/api/categories/Reference/books", query)
+        assert status == "200 OK"
+        page = json.loads(body)
+        names += [book["name"] for book in page["books"]]
+        pages += 1
+        token = page["next_cursor"]
+        if token is None:
+            break
+    assert pages == 3
+    assert names == [f"Atlas volume {i}" for i in range(5)]
+
+
+@pytest.mark.parametrize("token", [
+    "not base64!",
+    cursor("not json"),
+    cursor('"one value"'),
+    cursor('["a", "x"]'),
+    cursor('["a", null]'),
+    cursor('["a", 1e999]'),
+    cursor('[1, 2]'),
+    cursor('["a", 1, 2]'),
+])
+def test_bad_cursors_are_400(catalog, token):
+    status, _, body = call("/api/categories/Reference/books", f"cursor={token}")
+    assert status == "400 Bad Request"
+    assert json.loads(body) == {"error": "invalid cursor"}
+
+
+def test_unknown_category_is_404(catalog):
+    status, _, _ = call("/api/categories/Nope/books")
+    assert status == "404 Not Found"
+
+
+def test_errors_ignore_a_matching_etag(catalog):
+    _, headers, _ = call("/api/total")
+    etag = headers["ETag"]
+    assert call("/api/nope", if_none_match=etag)[0] == "404 Not Found"
+    assert call("/api/categories/Nope/books", if_none_match=etag)[0] == "404 Not Found"
+    status, headers, _ = call("/api/categories/Reference/books", "cursor=not base64!", if_none_match=etag)
+    assert status == "400 Bad Request"
+    assert "ETag" not in headers
@@ -0,0 +1,54 @@
+import gzip
+
+import pytest
+
+import backup
+from backup import BackupError, create_backup, list_backups, restore_backup, rotate
+from catalog import add_book, get_total_books
+from jobs import _create_job, _start_job, get_jobs, submit_job
+from writer import write
+
+
+@pytest.fixture
+def catalog(reference_books, tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path / "backups"))
+    return reference_books
+
+
+def test_restore_brings_back_the_snapshot_and_can_be_undone(catalog):
+    snapshot = create_backup()
+    add_book("Gazetteer", "R-99", None, "Reference")
+    before = restore_backup(snapshot.path)
+    assert get_total_books() == len(catalog)
+    restore_backup(before.path)
+    assert get_total_books() == len(catalog) + 1
+
+
+def test_rotation_keeps_the_newest(catalog):
+    for _ in range(3):
+        create_backup()
+    newest = list_backups()[:2]
+    rotate(keep=2)
+    assert list_backups() == newest
+
+
+def test_damaged_snapshot_is_refused(catalog, tmp_path):
+    path = tmp_path / "library-20260101T000000Z.db.gz"
+    path.write_bytes(gzip.compress(b"not a database"))
+    with pytest.raises(BackupError):
+        restore_backup(str(path))
+    assert get_total_books() == len(catalog)
+
+
+def test_restore_fails_jobs_the_snapshot_caught_running(catalog, wait_for_job):
+    # A backup job's snapshot holds that job's own row as running
+    backup_job = wait_for_job(submit_job("backup", "Back up the catalog"))
+    # A job really in flight during the restore keeps its row
+    running = write(_create_job, "export", "Export")
+    write(_start_job, running)
+
+    restore_backup(list_backups()[0].path)
+    statuses = {job.id: job.status for job in get_jobs()}
+    assert statuses[backup_job.id] == "failed"
+    assert statuses[running] == "running"
+    assert write(_create_job, "backup", "Back up the catalog") > running
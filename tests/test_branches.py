@@ -0,0 +1,21 @@
+import pytest
+
+from branches import BranchError, parse_branches
+
+
+def test_branches_in_the_order_given():
+    branches = parse_branches("DIET=library.db, GHS Kolar=branches/ghs-kolar.db")
+    assert branches == {"DIET": "library.db", "GHS Kolar": "branches/ghs-kolar.db"}
+    assert list(branches) == ["DIET", "GHS Kolar"]
+
+
+@pytest.mark.parametrize("spec", [
+    "DIET=library.db,GHS=./library.db",
+    # Same file name in another directory: the branches would share a
+    # backup and export directory
+    "DIET=library.db,GHS=ghs/library.db",
+    "DIET=library.db,GHS=ghs/library.sqlite",
+])
+def test_branches_must_not_share_a_database_name(spec):
+    with pytest.raises(BranchError):
+        parse_branches(spec)
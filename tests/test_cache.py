@@ -0,0 +1,17 @@
+import db
+from cache import cached
+
+
+def _helper(module, value):
+    def lookup():
+        return value
+    lookup.__module__ = module
+    return cached(lambda: 0)(lookup)
+
+
+def test_same_name_in_different_modules_is_cached_apart(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "library.db"))
+    catalog_lookup = _helper("catalog", "books")
+    circulation_lookup = _helper("circulation", "loans")
+    assert catalog_lookup() == "books"
+    assert circulation_lookup() == "loans"
@@ -0,0 +1,52 @@
+import pytest
+
+from catalog import (
+    DeleteError,
+    delete_book,
+    delete_books,
+    delete_category,
+    get_categories,
+    get_total_books,
+)
+from circulation import add_member, find_open_loans, get_open_loans, issue_book, return_book
+
+
+@pytest.fixture
+def catalog(reference_books):
+    issue_book(reference_books[0], add_member("Asha", "C-1"))
+    return reference_books
+
+
+def test_book_on_loan_is_not_deleted(catalog):
+    with pytest.raises(DeleteError):
+        delete_book(catalog[0])
+    with pytest.raises(DeleteError):
+        delete_books(catalog)
+    assert get_total_books() == 5
+    assert len(get_open_loans(tuple(catalog))) == 1
+
+
+def test_category_with_a_book_on_loan_is_not_deleted(catalog):
+    with pytest.raises(DeleteError):
+        delete_category("Reference")
+    assert get_categories() == ["Reference"]
+    assert len(get_open_loans(tuple(catalog))) == 1
+
+
+def test_books_can_be_deleted_once_returned(catalog):
+    delete_books(catalog[1:])
+    return_book(catalog[0])
+    delete_category("Reference")
+    assert get_total_books() == 0
+
+
+def test_loans_are_found_from_the_book_or_the_card(catalog):
+    member = add_member("Ravi", "C-2")
+    issue_book(catalog[1], member)
+    issue_book(catalog[2], member)
+    # A typed number matches however the book's number is spelt
+    assert [loan.book_id for loan in find_open_loans("r 01")] == [catalog[1]]
+    assert [loan.book_id for loan in find_open_loans("C-2")] == [catalog[1], catalog[2]]
+    return_book(catalog[1])
+    assert find_open_loans("R-1") == []
+    assert [loan.member for loan in find_open_loans("R-0")] == ["Asha"]
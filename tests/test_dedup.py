@@ -0,0 +1,132 @@
+from collections import Counter
+
+import catalog
+import db
+from catalog import (
+    add_book,
+    check_duplicates,
+    delete_book,
+    delete_books,
+    dismiss_duplicate,
+    get_duplicates,
+    get_trash,
+    restore_trash,
+    scan_duplicates,
+    update_books,
+)
+from dedup import DUPLICATE_SCORE, find_duplicates, make_record, score_pair
+from fuzzy import reindex_after, trigrams
+from importer import insert_batch
+from writer import write
+
+
+def pairs(found):
+    return {(pair.book_id, pair.other_id) for pair in found}
+
+
+def test_scan_finds_a_re_entered_book():
+    # The copy is typed in capitals, with another spelling and no number
+    books = [
+        (1, "Shiksha Manovigyan", "M-1", "S.K. Mangal"),
+        (2, "Bal Vikas", "M-2", "Arun Sharma"),
+        (3, "SHIKSA MANOVIGYAN", None, "S.K. Mangal"),
+        (4, "Teaching of Science", "M-4", "NCERT"),
+    ]
+    assert pairs(find_duplicates(books)) == {(1, 3)}
+
+
+def test_copies_with_their_own_numbers_are_not_duplicates():
+    # Same title and author, but two accession numbers: copies bought together
+    books = [
+        (1, "Shiksha Manovigyan", "M-1", "S.K. Mangal"),
+        (2, "Shiksha Manovigyan", "M-2", "S.K. Mangal"),
+    ]
+    a, b = (make_record(*book) for book in books)
+    assert score_pair(a, b) < DUPLICATE_SCORE
+    assert find_duplicates(books) == []
+
+
+def test_accession_number_spellings_meet():
+    books = [
+        (1, "Bal Vikas", "Acc. 00123", "Arun Sharma"),
+        (2, "Bal Vikas", "acc-123", None),
+    ]
+    assert pairs(find_duplicates(books)) == {(1, 2)}
+
+
+def test_new_book_is_checked_against_the_catalog(reference_books):
+    add_book("Shiksha Manovigyan", "M-1", "S.K. Mangal", "Reference")
+    # Another copy with its own number is a near miss
+    assert add_book("Shiksha Manovigyan", "M-2", "S.K. Mangal", "Reference") == []
+    assert get_duplicates() == []
+
+    found = add_book("SHIKSA MANOVIGYAN", None, "S.K. Mangal", "Reference")
+    assert len(found) == 2
+    assert all(pair.score >= DUPLICATE_SCORE for pair in found)
+    suggestions = get_duplicates()
+    assert {(s.number, s.other_number) for s in suggestions} == {("M-1", None), ("M-2", None)}
+
+
+def test_new_book_meets_another_spelling_of_its_number(reference_books):
+    add_book("Bal Vikas", "Acc. 00123", "Arun Sharma", "Reference")
+    found = add_book("Bal Vikas", "acc-123", None, "Reference")
+    assert len(found) == 1
+
+    # Books back from the trash get their number key again
+    delete_books([found[0].book_id, found[0].other_id])
+    restore_trash(get_trash()[0].id)
+    assert len(add_book("Bal Vikas", "ACC123", None, "Reference")) == 2
+
+
+def test_pairs_go_with_their_books(reference_books):
+    add_book("Shiksha Manovigyan", "M-1", "S.K. Mangal", "Reference")
+    found = add_book("SHIKSA MANOVIGYAN", None, "S.K. Mangal", "Reference")
+    delete_book(found[0].other_id)
+    assert get_duplicates() == []
+    with db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM duplicate_pairs").fetchone()[0] == 0
+
+
+def test_dismissed_pairs_stay_hidden_after_a_rescan(reference_books):
+    add_book("Shiksha Manovigyan", "M-1", "S.K. Mangal", "Reference")
+    pair, = add_book("SHIKSA MANOVIGYAN", None, "S.K. Mangal", "Reference")
+    dismiss_duplicate(pair.other_id, pair.book_id)
+    assert get_duplicates() == []
+    scan_duplicates()
+    assert get_duplicates() == []
+
+
+def test_books_inserted_in_bulk_are_checked(reference_books):
+    add_book("Shiksha Manovigyan", "M-1", "S.K. Mangal", "Reference")
+    # Two new copies of the same book also find each other, once
+    book_ids = write(insert_batch, [
+        ("SHIKSA MANOVIGYAN", None, "S.K. Mangal", "Reference"),
+        ("Shiksha Manovigyan", "M-1", None, "Reference"),
+    ])
+    checked = []
+    assert check_duplicates(book_ids, lambda done, total: checked.append((done, total))) == 3
+    assert checked == [(2, 2)]
+    assert len(get_duplicates()) == 3
+
+
+def test_large_batches_are_checked_with_one_scan(reference_books, monkeypatch):
+    monkeypatch.setattr(catalog, "CHECK_ALL_ABOVE", 1)
+    add_book("Shiksha Manovigyan", "M-1", "S.K. Mangal", "Reference")
+    book_ids = write(insert_batch, [
+        ("SHIKSA MANOVIGYAN", None, "S.K. Mangal", "Reference"),
+        ("Bal Vikas", "B-1", "Arun Sharma", "Reference"),
+    ])
+    assert check_duplicates(book_ids) == 1
+    assert len(get_duplicates()) == 1
+
+
+def test_gram_counts_follow_the_fuzzy_index(reference_books):
+    add_book("Shiksha Manovigyan", "M-1", "S.K. Mangal", "Reference")
+    update_books([(reference_books[0], "Atlas of India", "R-0", "Oxford")])
+    delete_books(reference_books[1:3])
+    write(reindex_after, reference_books[2], 2)
+    with db.connection() as conn:
+        keys = [key for key, in conn.execute("SELECT key FROM book_fuzzy")]
+        counts = dict(conn.execute("SELECT gram, doc_count FROM fuzzy_grams"))
+    assert len(keys) == 4
+    assert counts == Counter(gram for key in keys for gram in trigrams(key))
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+import db
+from intake import IntakeError, IntakeQueue, isbn13, lookup_isbn, read_metadata, seed_metadata
+
+GODAN = "9788126713936"
+
+
+@pytest.mark.parametrize("code, expected", [
+    ("978-0-306-40615-7", "9780306406157"),
+    ("9780306406158", None),
+    # ISBN-10s become the ISBN-13 of the same book
+    ("0-306-40615-2", "9780306406157"),
+    ("043942089x", "9780439420891"),
+    ("0306406153", None),
+    # EAN-13 barcodes that aren't books, and accession numbers
+    ("1234567890128", None),
+    ("ACC-1001", None),
+])
+def test_isbn13(code, expected):
+    assert isbn13(code) == expected
+
+
+@pytest.fixture
+def queue(reference_books):
+    seed_metadata([(GODAN, "Godan", "Premchand")])
+    return IntakeQueue(db.DB_FILE, batch_size=2)
+
+
+def catalogued(number):
+    with db.connection() as conn:
+        return conn.execute("SELECT name, author FROM books WHERE number = ?", (number,)).fetchone()
+
+
+def test_scans_are_saved_a_batch_at_a_time(queue):
+    assert queue.scan(GODAN, "Reference").name == "Godan"
+    assert queue.scan("A-1", "Reference").number == "A-1"
+    assert queue.flush() == 0
+
+    # A wrong scan is taken back, title and number together
+    queue.scan("0-306-40615-2", "Reference")
+    queue.scan("A-2", "Reference")
+    queue.undo()
+    assert len(queue.items) == 1
+
+    queue.scan(GODAN, "Reference")
+    queue.scan("A-2", "Reference")
+    assert queue.flush() == 2
+    assert queue.items == []
+    assert catalogued("A-1") == catalogued("A-2") == ("Godan", "Premchand")
+    with pytest.raises(IntakeError):
+        queue.scan("A-1", "Reference")
+
+
+def test_typed_titles_are_cached_for_the_next_copy(queue):
+    queue.scan("0-306-40615-2", "Reference")
+    assert queue.items[0].name is None
+    queue.edit(0, "Measure Theory", "A-1", "Halmos")
+    assert queue.flush(force=True) == 1
+    assert lookup_isbn("9780306406157")[1:] == ("Measure Theory", "Halmos", "staff")
+
+
+def test_saved_books_are_checked_for_duplicates_in_a_job(queue, wait_for_job):
+    # Another spelling of the fixture's "R-0", typed in by hand
+    queue.scan("R-00", "Reference")
+    queue.edit(0, "Atlas volume 0", "R-00", "Oxford")
+    assert queue.flush(force=True) == 1
+    assert queue.items == []
+    job = wait_for_job(queue.check_job)
+    assert job.kind == "check_duplicates"
+    assert job.message.startswith("Found 1 likely duplicate pairs")
+
+
+def test_numbers_count_on_past_taken_ones(queue):
+    queue.next_number = "R-0"
+    assert [queue.scan(GODAN, "Reference").number for _ in range(2)] == ["R-5", "R-6"]
+    assert queue.next_number == "R-7"
+
+
+def test_malformed_open_library_lines_are_skipped(tmp_path):
+    def line(record):
+        return f"/type/edition\t/books/OL1M\t1\t2020-01-01\t{record}\n"
+
+    path = tmp_path / "ol_dump_editions.txt"
+    path.write_text("".join([
+        line(json.dumps({"title": "Godan", "isbn_13": [GODAN], "by_statement": "Premchand"})),
+        line('{"title": "Cut off", "isbn_10": ["03064'),
+        line('["isbn_10"]'),
+        line(json.dumps({"isbn_10": ["0306406152"]})),
+        line(json.dumps({"title": "Nirmala", "subtitle": "a novel", "isbn_10": ["0306406152"],
+                         "publishers": ["Rajkamal"]})),
+    ]), encoding="utf-8")
+    assert list(read_metadata(path)) == [
+        (GODAN, "Godan", "Premchand"),
+        ("0306406152", "Nirmala: a novel", "Rajkamal"),
+    ]
@@ -0,0 +1,55 @@
+import csv
+
+import pytest
+
+import jobs
+from catalog import get_total_books
+from jobs import JobError, fail_interrupted_jobs, get_jobs, submit_job
+from writer import write
+
+
+@pytest.fixture
+def catalog(reference_books, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "EXPORT_DIR", str(tmp_path / "exports"))
+    return reference_books
+
+
+def test_unknown_kind_is_refused(catalog):
+    with pytest.raises(JobError):
+        submit_job("nope", "Nothing")
+    assert get_jobs() == []
+
+
+def test_export_job_leaves_a_file_to_download(catalog, wait_for_job):
+    job = wait_for_job(submit_job("export", "Export", "csv", None, False))
+    assert job.status == "done"
+    assert job.progress == 1
+    with open(job.output, newline="", encoding="utf-8") as f:
+        assert len(list(csv.reader(f))) == 1 + len(catalog)
+
+
+def test_import_job_queues_a_duplicate_check(catalog, wait_for_job):
+    data = "title,accession no\nAtlas volume 0,R-0\nSHIKSA MANOVIGYAN,M-1\nShiksha Manovigyan,\n".encode()
+    job = wait_for_job(submit_job("import", "Import register.csv", data, "register.csv", "Reference", True))
+    assert job.status == "done"
+    assert job.message.startswith("Imported 1 of 3 rows")
+    assert get_total_books() == len(catalog) + 1
+    check = get_jobs()[0]
+    assert check.kind == "check_duplicates"
+    assert wait_for_job(check.id).status == "done"
+
+
+def test_failed_job_reports_its_error(catalog, monkeypatch, wait_for_job):
+    def broken(progress):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setitem(jobs.JOB_KINDS, "backup", broken)
+    job = wait_for_job(submit_job("backup", "Back up the catalog"))
+    assert (job.status, job.message) == ("failed", "disk full")
+
+
+def test_jobs_cut_off_by_a_restart_are_failed(catalog):
+    job_id = write(jobs._create_job, "backup", "Back up the catalog")
+    fail_interrupted_jobs()
+    job, = get_jobs()
+    assert (job.id, job.status, job.message) == (job_id, "failed", "interrupted by a restart")
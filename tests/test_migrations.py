@@ -0,0 +1,134 @@
+import sqlite3
+
+import pytest
+
+import db
+from catalog import (
+    add_book,
+    add_category,
+    changed_categories,
+    delete_books,
+    delete_category,
+    get_category_counts,
+    init_db,
+    latest_change_id,
+    move_books,
+    update_books,
+)
+from importer import insert_batch
+from migrations import LATEST_VERSION, migrate, schema_version
+from search import search_books
+from stats import get_duplicate_numbers, get_growth, get_summary, get_top_authors
+from writer import write
+
+
+@pytest.fixture
+def v1_catalog(tmp_path, monkeypatch):
+    # A library.db from before categories had a table: "New Book"/"000"
+    # rows made a category exist, and the last book added was deleted
+    path = str(tmp_path / "library.db")
+    monkeypatch.setattr(db, "DB_FILE", path)
+    conn = sqlite3.connect(path)
+    migrate(conn, 1)
+    conn.executemany("INSERT INTO books (name, number, author, category) VALUES (?, ?, ?, ?)", [
+        ("New Book", "000", None, "Fiction"),
+        ("Godan", "F-1", "Premchand", "Fiction"),
+        ("New Book", "000", None, "Poetry"),
+        ("Gitanjali", "P-1", "Tagore", "Poetry"),
+        ("Madhushala", "P-2", " Harivansh Rai Bachchan ", "Poetry"),
+        ("New Book", "000", None, "Reference"),
+        ("Nirmala", "F-2", "Premchand", "Fiction"),
+    ])
+    conn.execute("DELETE FROM books WHERE name = 'Nirmala'")
+    conn.commit()
+    conn.close()
+    init_db()
+    return path
+
+
+def books_query(sql, params=()):
+    with db.connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def assert_stats_match_books():
+    # Every trigger-kept aggregate against the same figure counted from books
+    counts = dict(books_query("SELECT category, COUNT(*) FROM books GROUP BY category"))
+    assert get_category_counts() == [(name, counts.get(name, 0)) for name, in books_query(
+        "SELECT name FROM categories ORDER BY id")]
+    total, = books_query("SELECT COUNT(*) FROM books")[0]
+    authors = books_query('''
+        SELECT TRIM(author), COUNT(*) FROM books WHERE TRIM(author) != ''
+        GROUP BY 1 ORDER BY 2 DESC, 1
+    ''')
+    duplicates = books_query('''
+        SELECT number, COUNT(*) FROM books WHERE number IS NOT NULL
+        GROUP BY number HAVING COUNT(*) > 1 ORDER BY 2 DESC, number
+    ''')
+    summary = get_summary()
+    assert summary.total_books == total
+    assert summary.categories == len(get_category_counts())
+    assert summary.authors == len(authors)
+    assert summary.duplicate_numbers == len(duplicates)
+    assert sorted(get_top_authors(1000), key=lambda row: (-row[1], row[0])) == authors
+    assert get_duplicate_numbers() == duplicates
+    # Growth is only tracked from v10 on, so there may be no month yet
+    assert all(month.total == total for month in get_growth()[-1:])
+
+
+def test_v6_keeps_books_and_drops_placeholder_rows(v1_catalog):
+    with db.connection() as conn:
+        assert schema_version(conn) == LATEST_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM books WHERE name = 'New Book'").fetchone()[0] == 0
+        assert conn.execute("SELECT id, name FROM books ORDER BY id").fetchall() == [
+            (2, "Godan"), (4, "Gitanjali"), (5, "Madhushala")]
+        assert conn.execute("SELECT number_key FROM books WHERE id = 4").fetchone()[0] == "p1"
+        # The deleted book's id isn't handed out again after the rebuild
+        assert conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'books'").fetchone()[0] == 7
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO books (name, number, category) VALUES ('Orphan', 'X-1', 'Nowhere')")
+    # Categories keep the order they were first used in, empty ones included
+    assert get_category_counts() == [("Fiction", 1), ("Poetry", 2), ("Reference", 0)]
+    assert [hit.name for hit in search_books("gitanjali")] == ["Gitanjali"]
+    assert_stats_match_books()
+
+
+def test_statistics_follow_inserts_moves_edits_and_deletes(v1_catalog):
+    add_book("Gaban", "F-3", "Premchand", "Fiction")
+    add_book("Gaban", "F-3", "premchand ", "Fiction")
+    add_book("Atlas", "R-1", None, "Reference")
+    add_book("Kamayani", "P-3", "Jaishankar Prasad", "Poetry")
+    assert_stats_match_books()
+
+    ids = dict(books_query("SELECT name, id FROM books WHERE name IN ('Gaban', 'Atlas', 'Kamayani')"))
+    move_books([ids["Kamayani"], ids["Atlas"]], "Fiction")
+    add_category("Hindi")
+    move_books([ids["Kamayani"]], "Hindi")
+    assert_stats_match_books()
+
+    update_books([(ids["Atlas"], "Atlas", "F-3", "Oxford"), (ids["Kamayani"], "Kamayani", "P-3", "")])
+    assert_stats_match_books()
+
+    delete_books([ids["Atlas"], ids["Gaban"]])
+    delete_category("Poetry")
+    assert_stats_match_books()
+
+
+def test_statistics_follow_bulk_inserts(v1_catalog):
+    # insert_batch swaps the row triggers for one update of each aggregate
+    since = latest_change_id()
+    write(insert_batch, [
+        ("Godan", "F-1", "Premchand", "Fiction"),
+        ("Karmabhoomi", "F-4", "premchand", "Fiction"),
+        ("Gitanjali", "P-1", "Tagore ", "Poetry"),
+        ("Gitanjali", "P-1", "Tagore", "Poetry"),
+        ("Panchatantra", "H-1", "Vishnu Sharma", "Hindi"),
+        ("Jataka", "H-2", None, "Hindi"),
+    ])
+    assert_stats_match_books()
+    assert changed_categories(since)[0] == {"Fiction", "Poetry", "Hindi"}
+    triggers = {name for name, in books_query("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    assert {"books_count_ai", "books_changes_ai", "books_stats_ai", "books_fts_ai"} <= triggers
+
+    add_book("Atlas", "H-1", "Oxford", "Hindi")
+    assert_stats_match_books()
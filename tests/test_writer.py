@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import instrument
+import writer
+from writer import WriteQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WriteQueue(str(tmp_path / "writer.db"))
+    queue.submit(lambda conn: conn.execute("CREATE TABLE t (x)"))
+    yield queue
+    queue.close()
+
+
+def test_timed_out_request_is_never_applied(queue, monkeypatch):
+    monkeypatch.setattr(writer, "SUBMIT_TIMEOUT", 0.2)
+    blocker = threading.Thread(target=queue.submit, args=(lambda conn: time.sleep(0.6),))
+    blocker.start()
+    time.sleep(0.05)
+    with pytest.raises(TimeoutError):
+        queue.submit(lambda conn: conn.execute("INSERT INTO t VALUES (1)"))
+    blocker.join()
+    assert queue.submit(lambda conn: conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]) == 0
+
+
+def test_running_request_is_waited_for_past_the_timeout(queue, monkeypatch):
+    monkeypatch.setattr(writer, "SUBMIT_TIMEOUT", 0.1)
+    assert queue.submit(lambda conn: time.sleep(0.3) or "done") == "done"
+
+
+def test_writer_survives_a_failed_batch(queue):
+    # Closing the connection makes the commit itself fail
+    with pytest.raises(Exception):
+        queue.submit(lambda conn: conn.close())
+    assert queue.submit(lambda conn: conn.execute("INSERT INTO t VALUES (1)").rowcount) == 1
+
+
+def test_writer_survives_a_failed_connect(tmp_path):
+    queue = WriteQueue(str(tmp_path / "missing" / "writer.db"))
+    with pytest.raises(Exception):
+        queue.submit(lambda conn: None)
+    (tmp_path / "missing").mkdir()
+    assert queue.submit(lambda conn: "connected") == "connected"
+    queue.close()
+
+
+def _close_and_raise(message):
+    def helper(conn):
+        conn.close()
+        raise sqlite3.OperationalError(message)
+    return helper
+
+
+@pytest.mark.parametrize("message", ["disk I/O error", "database is locked"])
+def test_writer_survives_a_connection_broken_mid_batch(queue, monkeypatch, message):
+    monkeypatch.setattr(writer, "RETRY_BACKOFF", 0.001)
+    with pytest.raises(sqlite3.Error):
+        queue.submit(_close_and_raise(message))
+    assert queue.submit(lambda conn: conn.execute("INSERT INTO t VALUES (1)").rowcount) == 1
+    assert queue.submit(lambda conn: conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]) == 1
+
+
+def test_submit_fails_once_the_writer_has_stopped(queue):
+    queue.close()
+    with pytest.raises(RuntimeError):
+        queue.submit(lambda conn: None)
+
+
+def test_write_sql_is_counted_in_the_submitters_profile(tmp_path, monkeypatch):
+    # Profiles are per rerun; the statements run on the writer thread
+    monkeypatch.setattr(instrument, "ENABLED", True)
+    queue = WriteQueue(str(tmp_path / "writer.db"))
+    queue.submit(lambda conn: conn.execute("CREATE TABLE t (x)"))
+    with instrument.profile_rerun("test") as profile:
+        queue.submit(lambda conn: conn.execute("INSERT INTO t VALUES (1)"))
+    queue.submit(lambda conn: conn.execute("INSERT INTO t VALUES (2)"))
+    queue.close()
+    assert profile.statements == ["INSERT INTO t VALUES (1)"]
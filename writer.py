@@ -0,0 +1,260 @@
+import contextvars
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import db
+
+# After the first request arrives, wait this long for others to join the
+# batch. Staff typing accessions are seconds apart, so this only merges
+# requests that really are concurrent.
+BATCH_WINDOW = 0.005
+MAX_BATCH = 64
+# Retries of a whole batch when another process holds the write lock past
+# the busy timeout, e.g. a command-line import
+RETRIES = 5
+RETRY_BACKOFF = 0.05
+SUBMIT_TIMEOUT = 60.0
+
+log = logging.getLogger("library.writer")
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class WriteQueue:
+    # One thread owns the only writing connection, so sessions never fight
+    # over the SQLite write lock. Requests are group-committed: one
+    # BEGIN IMMEDIATE / COMMIT (one WAL fsync) per batch, with each request
+    # in its own savepoint so a failing request doesn't undo its neighbours.
+    # Helpers submitted here must not commit or roll back themselves.
+
+    def __init__(self, path):
+        self.path = path
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "batches": 0,
+            "max_batch": 0,
+            "failed": 0,
+            "retries": 0,
+            "commit_seconds": 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name=f"writer:{path}", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        # fn(conn, *args) runs on the writer thread inside a transaction;
+        # its return value or exception is handed back here. It runs in a
+        # copy of the caller's context, so what the caller set up (such as
+        # a rerun profile collecting SQL) still applies.
+        if threading.current_thread() is self._thread:
+            return fn(self._conn, *args)
+        if not self._thread.is_alive():
+            raise RuntimeError(f"the writer for {self.path} has stopped")
+        future = Future()
+        self._requests.put((fn, args, contextvars.copy_context(), future))
+        try:
+            return future.result(timeout=SUBMIT_TIMEOUT)
+        except TimeoutError:
+            # Still queued: withdraw it, so a write reported as failed can't
+            # commit later. Once started it commits or fails, so wait for
+            # that, but only while the writer thread is there to finish it.
+            if future.cancel():
+                raise
+        while True:
+            try:
+                return future.result(timeout=SUBMIT_TIMEOUT)
+            except TimeoutError:
+                if not self._thread.is_alive():
+                    raise RuntimeError(f"the writer for {self.path} has stopped") from None
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["queued"] = self._requests.qsize()
+        return stats
+
+    def _run(self):
+        # Opened on the first batch, and again after a batch fails in a way
+        # that may have broken it, so the thread outlives any one error
+        self._conn = None
+        try:
+            # Anything a helper looks up by default refers to this database
+            with db.use_database(self.path):
+                while True:
+                    batch = self._collect()
+                    if batch is None:
+                        return
+                    # Requests their callers gave up on are dropped here
+                    batch = [request for request in batch if request[-1].set_running_or_notify_cancel()]
+                    if batch:
+                        self._commit(batch)
+        finally:
+            if self._conn is not None:
+                self._conn.close()
+
+    def _collect(self):
+        first = self._requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + BATCH_WINDOW
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self._requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _fail(self, batch, error):
+        for *_, future in batch:
+            future.set_exception(error)
+        with self._lock:
+            self.stats["failed"] += len(batch)
+
+    def _reset(self):
+        # Drops the connection, which a failed helper may have left closed
+        # or mid-transaction; the next batch opens a new one
+        if self._conn is None:
+            return
+        try:
+            if self._conn.in_transaction:
+                self._conn.rollback()
+            self._conn.close()
+        except sqlite3.Error:
+            pass
+        self._conn = None
+
+    def _rollback(self):
+        # Before a retry; a connection that can't roll back is replaced
+        try:
+            if self._conn is not None and self._conn.in_transaction:
+                self._conn.rollback()
+        except sqlite3.Error:
+            self._reset()
+
+    def _commit(self, batch):
+        start = time.perf_counter()
+        for attempt in range(RETRIES + 1):
+            try:
+                if self._conn is None:
+                    self._conn = db.connect(self.path)
+                results = self._apply(batch)
+                break
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == RETRIES:
+                    log.warning("write batch of %d requests to %s failed: %s", len(batch), self.path, e)
+                    self._reset()
+                    self._fail(batch, e)
+                    return
+                self._rollback()
+                with self._lock:
+                    self.stats["retries"] += 1
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+            except Exception as e:
+                # Failed to connect, commit or roll back: this batch fails
+                # and the next one starts on a fresh connection
+                log.exception("write batch of %d requests to %s failed", len(batch), self.path)
+                self._reset()
+                self._fail(batch, e)
+                return
+
+        for (*_, future), (ok, value) in zip(batch, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        with self._lock:
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            self.stats["failed"] += sum(1 for ok, _ in results if not ok)
+            self.stats["commit_seconds"] += time.perf_counter() - start
+
+    def _apply(self, batch):
+        # Raises OperationalError for lock errors so the whole batch is
+        # retried; any other error only fails its own request
+        conn = self._conn
+        # A savepoint makes SQLite journal every page the request touches,
+        # which is measurable on import-sized requests, so a request that
+        # is alone in its batch runs without one
+        savepoints = len(batch) > 1
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        for fn, args, context, _ in batch:
+            if savepoints:
+                conn.execute("SAVEPOINT request")
+            try:
+                value = context.run(self._call, fn, conn, args)
+            except sqlite3.OperationalError as e:
+                if _is_busy(e):
+                    raise
+                results.append((False, e))
+            except Exception as e:
+                results.append((False, e))
+            else:
+                results.append((True, value))
+            if savepoints:
+                if not results[-1][0]:
+                    conn.execute("ROLLBACK TO request")
+                conn.execute("RELEASE request")
+        if savepoints or results[0][0]:
+            conn.commit()
+        else:
+            conn.rollback()
+        return results
+
+    def _call(self, fn, conn, args):
+        # The caller's context may name another database; the helper is
+        # writing to this one
+        with db.use_database(self.path):
+            return fn(conn, *args)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path=None):
+    path = path or db.current_path()
+    writer = _writers.get(path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(path)
+            if writer is None:
+                writer = _writers[path] = WriteQueue(path)
+    return writer
+
+
+def close_writers():
+    with _writers_lock:
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
+
+
+def writer_stats(path=None):
+    return get_writer(path).snapshot()
+
+
+def write(fn, *args):
+    return get_writer().submit(fn, *args)